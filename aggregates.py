@@ -0,0 +1,542 @@
+import os
+import json
+import datetime
+import numpy as np
+import pandas as pd
+
+# The count cube has one cell per hub, behaviour, day and time-of-day slot. It is counted from
+# the events at BASE_SLOT_MINUTES per slot and kept at that level as its non-zero cells only, a
+# few bytes per distinct minute with presses instead of a dense array that is almost all zeros.
+# The levels of STORED_MINUTES are added up from the cells once, each from the one below it, and
+# kept as dense arrays. Other levels of ROLLUP_MINUTES (e.g. 15 minutes) are added up from the
+# cells when first asked for. Weeks are read from the daily level.
+ROLLUP_MINUTES = (1, 15, 30, 60, 1440)
+STORED_MINUTES = (30, 60, 1440)
+BASE_SLOT_MINUTES = 1
+DAY_MINUTES = 24 * 60
+# Days summed at a time when reading a matrix from the cube, which bounds the memory used
+CUBE_CHUNK_DAYS = 32
+# Bump when the cube layout changes so older cubes are rebuilt
+CUBE_VERSION = 3
+NO_TIME = np.iinfo(np.int64).max
+
+
+def count_matrix(df, row='Hub Name', column='Behaviour Name'):
+    """
+    Count the rows of every (row, column) pair, e.g. hub x behaviour, in a single pass.
+    Returns two DataFrames with the same shape, rows and columns in order of first appearance:
+    the counts, and the position of the first row of each pair (-1 for pairs without rows),
+    which the reports use to list equal counts in order of first appearance.
+    """
+    row_codes, row_values = pd.factorize(df[row])
+    column_codes, column_values = pd.factorize(df[column])
+    valid = (row_codes >= 0) & (column_codes >= 0)
+    positions = np.flatnonzero(valid)
+    keys = row_codes[valid].astype(np.int64) * len(column_values) + column_codes[valid]
+
+    size = len(row_values) * len(column_values)
+    counts = np.bincount(keys, minlength=size)
+    first_seen = np.full(size, -1, dtype=np.int64)
+    # return_index gives the first position of every pair that has rows
+    unique_keys, first_index = np.unique(keys, return_index=True)
+    first_seen[unique_keys] = positions[first_index]
+
+    shape = (len(row_values), len(column_values))
+    index = pd.Index(np.asarray(row_values, dtype=object), name=row)
+    columns = pd.Index(np.asarray(column_values, dtype=object), name=column)
+    return (pd.DataFrame(counts.reshape(shape), index=index, columns=columns),
+            pd.DataFrame(first_seen.reshape(shape), index=index, columns=columns))
+
+
+def ranked(counts, first_seen):
+    """Non-zero entries of a count Series from most to least frequent, equal counts by first appearance."""
+    counts = counts[counts > 0]
+    first_seen = first_seen[counts.index]
+    order = np.lexsort((first_seen.to_numpy(), -counts.to_numpy()))
+    return counts.iloc[order]
+
+
+def row_totals(counts, first_seen):
+    """Total per row (e.g. entries per hub), ranked like value_counts()."""
+    totals = counts.sum(axis=1)
+    first = first_seen.where(first_seen >= 0).min(axis=1)
+    return ranked(totals, first)
+
+
+def group_order(index):
+    """Order in which a groupby lists the values in `index`: sorted, as groupby sorts its keys."""
+    return index.sort_values()
+
+
+class CountCube:
+    """
+    Press counts per hub x behaviour x day x time-of-day slot, at one level of the rollup
+    hierarchy. Reports and charts read their matrices from here instead of from the events.
+    `first` holds the second within its slot of each cell's first press, so matrices can still
+    list equal counts in order of first appearance. All levels of a cube share `levels`
+    (minutes per slot -> CountCube) and the base level's `cells`, and rollup() returns any level.
+    """
+
+    def __init__(self, counts, first, hubs, behaviours, first_day, slot_minutes=30, levels=None, cells=None):
+        self.counts = counts
+        self.first = first
+        self.hubs = hubs
+        self.behaviours = behaviours
+        self.first_day = first_day
+        self.slot_minutes = slot_minutes
+        self.slot_seconds = slot_minutes * 60
+        self.hub_codes = {name: code for code, name in enumerate(hubs) if name is not None}
+        self.behaviour_codes = {name: code for code, name in enumerate(behaviours) if name is not None}
+        self.levels = {} if levels is None else levels
+        self.levels[slot_minutes] = self
+        self.cells = cells
+
+    @property
+    def days(self):
+        return self.counts.shape[2]
+
+    @property
+    def slots_per_day(self):
+        return self.counts.shape[3]
+
+    def rollup(self, minutes):
+        """
+        This cube at `minutes` per slot, derived once from the closest finer level that divides it,
+        or from the base level's cells when no dense level does.
+        """
+        if minutes not in self.levels:
+            finer = [level for level in self.levels if level < minutes and minutes % level == 0]
+            base = self.cells.slot_minutes if self.cells is not None else min(self.levels)
+            if DAY_MINUTES % minutes or not (finer or (self.cells is not None and minutes % base == 0)):
+                raise ValueError(f"No {minutes}-minute rollup can be derived from the {base}-minute cube.")
+            if finer:
+                self.levels[max(finer)].coarsen(minutes)
+            else:
+                shape = self.counts.shape[:3] + (DAY_MINUTES // minutes,)
+                counts, first = self.cells.dense(shape, minutes)
+                CountCube(counts, first, self.hubs, self.behaviours, self.first_day, minutes, self.levels, self.cells)
+        return self.levels[minutes]
+
+    def coarsen(self, minutes):
+        """Add up every minutes / slot_minutes consecutive slots into a new level of this cube."""
+        factor = minutes // self.slot_minutes
+        hubs, behaviours, days, slots = self.counts.shape
+        shape = (hubs, behaviours, days, slots // factor)
+        counts = np.zeros(shape, dtype=np.uint32)
+        first = np.zeros(shape, dtype=first_dtype(minutes))
+        offsets = np.arange(factor, dtype=np.int64) * self.slot_seconds
+        for chunk in range(0, days, CUBE_CHUNK_DAYS):
+            stop = min(chunk + CUBE_CHUNK_DAYS, days)
+            block = np.asarray(self.counts[:, :, chunk:stop]).reshape(hubs, behaviours, stop - chunk, slots // factor, factor)
+            counts[:, :, chunk:stop] = block.sum(axis=4, dtype=np.uint32)
+            seconds = np.where(block > 0, np.asarray(self.first[:, :, chunk:stop]).reshape(block.shape) + offsets, NO_TIME).min(axis=4)
+            first[:, :, chunk:stop] = np.where(seconds == NO_TIME, 0, seconds)
+        return CountCube(compact_counts(counts), first, self.hubs, self.behaviours, self.first_day, minutes, self.levels,
+                         self.cells)
+
+    def day_window(self, start_date, end_date):
+        """
+        Cube days between start_date and end_date (None for the cube's first/last day),
+        clipped to the cube. Returns (first, stop, output offset, output days).
+        """
+        start_date = self.first_day if start_date is None else start_date
+        end_date = self.first_day + datetime.timedelta(days=self.days - 1) if end_date is None else end_date
+        days = (end_date - start_date).days + 1
+        lo = (start_date - self.first_day).days
+        first, stop = min(max(lo, 0), self.days), min(max(lo + days, 0), self.days)
+        return first, max(first, stop), max(first - lo, 0), days
+
+    def day_slot_counts(self, start_date, end_date, hub=None, behaviour=None):
+        """
+        Counts per day and slot (days x slots_per_day) for every day from start_date to end_date,
+        summed over all hubs and behaviours unless a hub or behaviour is given.
+        """
+        first, stop, offset, days = self.day_window(start_date, end_date)
+        result = np.zeros((days, self.slots_per_day), dtype=np.int64)
+        hubs = slice(None) if hub is None else self.hub_codes.get(hub)
+        behaviours = slice(None) if behaviour is None else self.behaviour_codes.get(behaviour)
+        if stop > first and hubs is not None and behaviours is not None:
+            block = self.counts[hubs, behaviours, first:stop]
+            if block.ndim == 4:
+                block = block.sum(axis=(0, 1), dtype=np.int64)
+            elif block.ndim == 3:
+                block = block.sum(axis=0, dtype=np.int64)
+            result[offset:offset + stop - first] = block
+        return result
+
+    @property
+    def last_day(self):
+        return self.first_day + datetime.timedelta(days=self.days - 1)
+
+    def count_matrix(self, start_date=None, end_date=None):
+        """
+        Hub x behaviour counts between start_date and end_date, returned like the module's
+        count_matrix: hubs and behaviours with presses in order of first appearance, and the
+        time (in seconds) of each pair's first press, -1 for pairs without presses.
+        """
+        first, stop, _, _ = self.day_window(start_date, end_date)
+        bounds = [self.first_day + datetime.timedelta(days=day) for day in (first, stop)]
+        return self.period_matrices(bounds)[0]
+
+    def period_matrices(self, bounds):
+        """
+        Hub x behaviour matrices, like count_matrix, for consecutive periods in a single pass
+        over the daily level of the cube. Period i runs from bounds[i] up to, not including,
+        bounds[i + 1].
+        """
+        daily = self.rollup(DAY_MINUTES)
+        offsets = np.array([(day - self.first_day).days for day in bounds], dtype=np.int64)
+        shape = self.counts.shape[:2] + (len(bounds) - 1,)
+        totals = np.zeros(shape, dtype=np.int64)
+        first_times = np.full(shape, NO_TIME, dtype=np.int64)
+        epoch_day = (self.first_day - datetime.date(1970, 1, 1)).days
+        first, stop = np.clip(offsets[[0, -1]], 0, self.days) if len(offsets) else (0, 0)
+        for chunk in range(first, stop, CUBE_CHUNK_DAYS):
+            chunk_stop = min(chunk + CUBE_CHUNK_DAYS, stop)
+            counts = np.asarray(daily.counts[:, :, chunk:chunk_stop, 0], dtype=np.int64)
+            day_starts = (epoch_day + np.arange(chunk, chunk_stop, dtype=np.int64)) * 86400
+            times = np.where(counts > 0, day_starts + daily.first[:, :, chunk:chunk_stop, 0], NO_TIME)
+
+            # Days of a chunk are consecutive, so each period is a run of days added up with reduceat
+            periods = np.searchsorted(offsets, np.arange(chunk, chunk_stop), side='right') - 1
+            breaks = np.flatnonzero(np.r_[True, periods[1:] != periods[:-1]])
+            touched = periods[breaks]
+            totals[:, :, touched] += np.add.reduceat(counts, breaks, axis=2)
+            first_times[:, :, touched] = np.minimum(first_times[:, :, touched],
+                                                    np.minimum.reduceat(times, breaks, axis=2))
+
+        return [matrix_frames(totals[:, :, period], first_times[:, :, period], self.hubs, self.behaviours)
+                for period in range(shape[2])]
+
+
+class CellList:
+    """
+    A cube level kept as its non-zero cells only: the position of each cell in the flattened
+    hubs x behaviours x days x slots array (in increasing order), its count and the second
+    within its slot of its first press.
+    """
+
+    def __init__(self, keys, counts, first, slot_minutes):
+        self.keys = keys
+        self.counts = counts
+        self.first = first
+        self.slot_minutes = slot_minutes
+
+    def dense(self, shape, minutes):
+        """Counts and first-press arrays of `shape` at `minutes` per slot, added up from the cells."""
+        factor = minutes // self.slot_minutes
+        counts = np.zeros(int(np.prod(shape)), dtype=np.uint32)
+        first = np.zeros(counts.size, dtype=first_dtype(minutes))
+        if len(self.keys):
+            rows, slots = np.divmod(np.asarray(self.keys, dtype=np.int64), shape[3] * factor)
+            keys = rows * shape[3] + slots // factor
+            seconds = np.asarray(self.first, dtype=np.int64) + (slots % factor) * self.slot_minutes * 60
+            # Cells are in order, so the cells of each coarser slot are consecutive
+            starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+            counts[keys[starts]] = np.add.reduceat(np.asarray(self.counts, dtype=np.uint32), starts)
+            first[keys[starts]] = np.minimum.reduceat(seconds, starts)
+        return compact_counts(counts).reshape(shape), first.reshape(shape)
+
+
+def matrix_frames(totals, first_times, hubs, behaviours):
+    """
+    Hub x behaviour count and first-seen DataFrames from arrays indexed by hub and behaviour code:
+    only hubs and behaviours with presses, in order of first appearance.
+    """
+    hub_rows = [code for code, name in enumerate(hubs) if name is not None and totals[code].any()]
+    behaviour_columns = [code for code, name in enumerate(behaviours) if name is not None and totals[:, code].any()]
+    hub_rows.sort(key=lambda code: first_times[code].min())
+    behaviour_columns.sort(key=lambda code: first_times[:, code].min())
+
+    index = pd.Index([hubs[code] for code in hub_rows], dtype=object, name='Hub Name')
+    columns = pd.Index([behaviours[code] for code in behaviour_columns], dtype=object, name='Behaviour Name')
+    selected = np.ix_(hub_rows, behaviour_columns)
+    first_seen = np.where(totals[selected] > 0, first_times[selected], -1)
+    return (pd.DataFrame(totals[selected], index=index, columns=columns),
+            pd.DataFrame(first_seen, index=index, columns=columns))
+
+
+class RunningCounts:
+    """
+    Press counts per hub x behaviour x day, updated one chunk of events at a time, for reports
+    that should not hold every row in memory: memory grows with the number of distinct
+    (hub, behaviour, day) keys, not with the number of rows. count_matrix and period_matrices
+    work like those of CountCube, so the same report code reads either.
+    """
+
+    def __init__(self):
+        self.hubs = []
+        self.behaviours = []
+        self.hub_codes = {}
+        self.behaviour_codes = {}
+        self.cells = {}  # (hub code, behaviour code, day since 1970) -> [count, time of first press]
+        self.rows = 0
+        self.first_time = self.last_time = None
+
+    def codes(self, values, names, name_codes):
+        # New names get the next code in order of first appearance, like the event store's tables
+        categories = values.cat.categories
+        for code in pd.unique(values.cat.codes.to_numpy()):
+            if code >= 0 and categories[code] not in name_codes:
+                name_codes[categories[code]] = len(names)
+                names.append(categories[code])
+        lookup = np.array([name_codes[name] for name in values.cat.categories] + [-1], dtype=np.int64)
+        return lookup[values.cat.codes.to_numpy()]  # -1 (missing) picks the trailing -1
+
+    def update(self, chunk):
+        hub_codes = self.codes(chunk['Hub Name'], self.hubs, self.hub_codes)
+        behaviour_codes = self.codes(chunk['Behaviour Name'], self.behaviours, self.behaviour_codes)
+        times = chunk['Timestamp'].to_numpy(dtype='datetime64[ns]').view(np.int64)
+        valid = (times != np.iinfo(np.int64).min) & (hub_codes >= 0) & (behaviour_codes >= 0)
+        self.rows += len(chunk)
+        if not valid.any():
+            return
+
+        seconds = times[valid] // 10 ** 9
+        hub_codes, behaviour_codes, days = hub_codes[valid], behaviour_codes[valid], seconds // 86400
+        chunk_first, chunk_last = int(seconds.min()), int(seconds.max())
+        self.first_time = chunk_first if self.first_time is None else min(self.first_time, chunk_first)
+        self.last_time = chunk_last if self.last_time is None else max(self.last_time, chunk_last)
+
+        # One entry per distinct key of the chunk: its count and earliest press
+        keys = np.stack([hub_codes, behaviour_codes, days], axis=1)
+        order = np.lexsort((seconds, days, behaviour_codes, hub_codes))
+        keys, seconds = keys[order], seconds[order]
+        starts = np.flatnonzero(np.r_[True, (keys[1:] != keys[:-1]).any(axis=1)])
+        counts = np.diff(np.r_[starts, len(keys)])
+        for (hub, behaviour, day), count, first in zip(keys[starts].tolist(), counts.tolist(), seconds[starts].tolist()):
+            cell = self.cells.get((hub, behaviour, day))
+            if cell is None:
+                self.cells[(hub, behaviour, day)] = [count, first]
+            else:
+                cell[0] += count
+                cell[1] = min(cell[1], first)
+
+    @property
+    def first_day(self):
+        return None if self.first_time is None else datetime.date(1970, 1, 1) + datetime.timedelta(days=self.first_time // 86400)
+
+    @property
+    def last_day(self):
+        return None if self.last_time is None else datetime.date(1970, 1, 1) + datetime.timedelta(days=self.last_time // 86400)
+
+    def count_matrix(self, start_date=None, end_date=None):
+        """Hub x behaviour counts between start_date and end_date, as CountCube.count_matrix."""
+        start_date = start_date or self.first_day or datetime.date(1970, 1, 1)
+        end_date = end_date or self.last_day or start_date
+        return self.period_matrices([start_date, end_date + datetime.timedelta(days=1)])[0]
+
+    def period_matrices(self, bounds):
+        """Hub x behaviour matrices for consecutive periods, as CountCube.period_matrices."""
+        offsets = np.array([(day - datetime.date(1970, 1, 1)).days for day in bounds], dtype=np.int64)
+        shape = (len(self.hubs), len(self.behaviours), len(bounds) - 1)
+        totals = np.zeros(shape, dtype=np.int64)
+        first_times = np.full(shape, NO_TIME, dtype=np.int64)
+        if self.cells:
+            keys = np.array(list(self.cells.keys()), dtype=np.int64)
+            values = np.array(list(self.cells.values()), dtype=np.int64)
+            periods = np.searchsorted(offsets, keys[:, 2], side='right') - 1
+            inside = (periods >= 0) & (periods < shape[2])
+            cells = (keys[inside, 0], keys[inside, 1], periods[inside])
+            np.add.at(totals, cells, values[inside, 0])
+            np.minimum.at(first_times, cells, values[inside, 1])
+        return [matrix_frames(totals[:, :, period], first_times[:, :, period], self.hubs, self.behaviours)
+                for period in range(shape[2])]
+
+
+class SummedAreaTable:
+    """
+    2-D prefix sums over the day x slot counts of one CountCube level, per hub and behaviour and
+    for all hubs and/or all behaviours together, so the presses in any rectangle of dates x
+    time of day are counted with four lookups, however long the window.
+
+    The table is dense, (hubs + 1) x (behaviours + 1) x (days + 1) x (slots + 1) entries of the
+    smallest signed type that holds the total count (2 bytes up to 32767 presses, then 4): with
+    4 bytes, about 160 MB for 200 hubs, 10 behaviours and a year in half-hour slots. Roll the
+    cube up to coarser slots to shrink it.
+    """
+
+    def __init__(self, cube):
+        self.cube = cube
+        hubs, behaviours, days, slots = cube.counts.shape
+        chunks = [(chunk, min(chunk + CUBE_CHUNK_DAYS, days)) for chunk in range(0, days, CUBE_CHUNK_DAYS)]
+        dtype = sum_dtype(sum(int(cube.counts[:, :, chunk:stop].sum()) for chunk, stop in chunks))
+        # Row/column 0 of the day and slot axes stay zero, the last hub/behaviour holds the totals
+        table = np.zeros((hubs + 1, behaviours + 1, days + 1, slots + 1), dtype=dtype)
+        for chunk, stop in chunks:
+            table[:hubs, :behaviours, chunk + 1:stop + 1, 1:] = cube.counts[:, :, chunk:stop]
+        table[hubs] = table[:hubs].sum(axis=0, dtype=dtype)
+        table[:, behaviours] = table[:, :behaviours].sum(axis=1, dtype=dtype)
+        np.cumsum(table, axis=2, dtype=dtype, out=table)
+        np.cumsum(table, axis=3, dtype=dtype, out=table)
+        self.table = table
+
+    def count(self, start_date=None, end_date=None, start_time=None, end_time=None,
+              hub=None, behaviour=None, weekdays=None):
+        """
+        Presses from start_date to end_date (inclusive) between start_time and end_time
+        ('HH:MM' on a slot boundary, end exclusive, '24:00' for midnight), for one hub and/or
+        behaviour or all of them. `weekdays` (0 = Monday) keeps only those days of the week,
+        at four lookups per run of consecutive days.
+        """
+        hub_code = len(self.cube.hubs) if hub is None else self.cube.hub_codes.get(hub)
+        behaviour_code = len(self.cube.behaviours) if behaviour is None else self.cube.behaviour_codes.get(behaviour)
+        if hub_code is None or behaviour_code is None:
+            return 0
+        lo = 0 if start_time is None else time_slot(start_time, self.cube.slot_minutes)
+        hi = self.cube.slots_per_day if end_time is None else time_slot(end_time, self.cube.slot_minutes)
+        first, stop, _, _ = self.cube.day_window(start_date, end_date)
+        if hi <= lo or stop <= first:
+            return 0
+
+        if weekdays is None:
+            runs = [(first, stop)]
+        else:
+            days = np.arange(first, stop)
+            selected = np.isin((self.cube.first_day.weekday() + days) % 7, list(weekdays))
+            edges = np.flatnonzero(np.diff(np.r_[0, selected.astype(np.int8), 0]))
+            runs = [(first + a, first + b) for a, b in zip(edges[::2], edges[1::2])]
+
+        table = self.table[hub_code, behaviour_code]
+        return int(sum(table[b, hi] - table[a, hi] - table[b, lo] + table[a, lo] for a, b in runs))
+
+
+def time_slot(value, slot_minutes=30):
+    """Slot of `slot_minutes` at which 'HH:MM' (or a datetime.time) starts, e.g. 48 for '24:00' in half hours."""
+    if isinstance(value, datetime.time):
+        hour, minute = value.hour, value.minute
+    else:
+        hour, minute = (int(part) for part in str(value).split(':'))
+    minutes = hour * 60 + minute
+    if minutes % slot_minutes or not 0 <= minutes <= DAY_MINUTES:
+        raise ValueError(f"Invalid time '{value}', use HH:MM on a {slot_minutes}-minute boundary.")
+    return minutes // slot_minutes
+
+
+def first_dtype(slot_minutes):
+    """Smallest type for the seconds within a slot of `slot_minutes`."""
+    return np.uint16 if slot_minutes * 60 <= np.iinfo(np.uint16).max + 1 else np.uint32
+
+
+def sum_dtype(total):
+    """Smallest signed type for sums up to `total`, so differences of them cannot wrap around."""
+    for dtype in (np.int16, np.int32):
+        if total <= np.iinfo(dtype).max:
+            return dtype
+    return np.int64
+
+
+def compact_counts(counts):
+    """Store counts as uint16 when they fit, which halves the size on disk for typical studies."""
+    if counts.size and counts.max() <= np.iinfo(np.uint16).max:
+        return counts.astype(np.uint16)
+    return counts
+
+
+def week_bounds(first_date, last_date, week_start=0):
+    """
+    Start dates of the weeks covering first_date to last_date, plus the day after the last week.
+    Weeks begin on `week_start` (0 = Monday, as in ISO weeks, 6 = Sunday).
+    """
+    start = first_date - datetime.timedelta(days=(first_date.weekday() - week_start) % 7)
+    weeks = (last_date - start).days // 7 + 1
+    return [start + datetime.timedelta(weeks=week) for week in range(weeks + 1)]
+
+
+def build_count_cube(parts, hubs, behaviours, first_day, days, slot_minutes=BASE_SLOT_MINUTES):
+    """
+    Build a CountCube from `parts`, an iterable of (times in ns, hub codes, behaviour codes)
+    arrays in time order, e.g. the event store's weekly partitions: the non-zero cells at
+    `slot_minutes` per slot and the dense levels of STORED_MINUTES. Presses without a valid
+    timestamp or outside the `days` days from `first_day` are not counted.
+    """
+    slot_seconds = slot_minutes * 60
+    slots_per_day = DAY_MINUTES // slot_minutes
+    cell_parts = []
+    epoch_day = (first_day - datetime.date(1970, 1, 1)).days
+    for times, hub_codes, behaviour_codes in parts:
+        times = np.asarray(times)
+        seconds = times // 10 ** 9
+        day = seconds // 86400 - epoch_day
+        valid = ((times != np.iinfo(np.int64).min) & (day >= 0) & (day < days)
+                 & (np.asarray(hub_codes) >= 0) & (np.asarray(behaviour_codes) >= 0))
+        seconds, day = seconds[valid], day[valid]
+        slot = (seconds % 86400) // slot_seconds
+        keys = ((np.asarray(hub_codes)[valid].astype(np.int64) * len(behaviours)
+                 + np.asarray(behaviour_codes)[valid]) * days + day) * slots_per_day + slot
+
+        # Parts are in time order, so the first press of a cell is the first one seen
+        cells, first_index, cell_counts = np.unique(keys, return_index=True, return_counts=True)
+        cell_parts.append((cells, cell_counts, seconds[first_index] % slot_seconds))
+
+    # Cells spread over several parts are merged, keeping the first press of the earliest part
+    keys = np.concatenate([part[0] for part in cell_parts]) if cell_parts else np.empty(0, dtype=np.int64)
+    keys, first_index, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    counts = np.zeros(len(keys), dtype=np.uint32)
+    first = np.zeros(len(keys), dtype=first_dtype(slot_minutes))
+    if cell_parts:
+        np.add.at(counts, inverse, np.concatenate([part[1] for part in cell_parts]).astype(np.uint32))
+        first[:] = np.concatenate([part[2] for part in cell_parts])[first_index]
+    cells = CellList(keys, compact_counts(counts), first, slot_minutes)
+
+    stored = [minutes for minutes in STORED_MINUTES if minutes >= slot_minutes and minutes % slot_minutes == 0]
+    finest = min(stored, default=slot_minutes)
+    shape = (len(hubs), len(behaviours), days, DAY_MINUTES // finest)
+    cube = CountCube(*cells.dense(shape, finest), hubs, behaviours, first_day, finest, cells=cells)
+    for minutes in stored:
+        cube.rollup(minutes)
+    return cube
+
+
+def save_count_cube(cube, cube_folder, source_key):
+    """
+    Save the base level's cells as cells-<m>min.npz and every dense level of STORED_MINUTES as
+    counts-<m>min.npy and first-<m>min.npy, with meta.json written last.
+    """
+    os.makedirs(cube_folder, exist_ok=True)
+    if os.path.exists(os.path.join(cube_folder, 'meta.json')):
+        os.remove(os.path.join(cube_folder, 'meta.json'))
+    cells = cube.cells
+    np.savez(os.path.join(cube_folder, f'cells-{cells.slot_minutes}min.npz'),
+             keys=cells.keys, counts=cells.counts, first=cells.first)
+    levels = sorted(minutes for minutes in cube.levels if minutes in STORED_MINUTES)
+    for minutes in levels:
+        np.save(os.path.join(cube_folder, f'counts-{minutes}min.npy'), cube.levels[minutes].counts)
+        np.save(os.path.join(cube_folder, f'first-{minutes}min.npy'), cube.levels[minutes].first)
+    meta = {
+        'version': CUBE_VERSION,
+        'source': source_key,
+        'first_day': cube.first_day.isoformat(),
+        'hubs': cube.hubs,
+        'behaviours': cube.behaviours,
+        'cell_minutes': cells.slot_minutes,
+        'levels': levels,
+    }
+    # The metadata is written last, so an interrupted build is never mistaken for a valid cube
+    with open(os.path.join(cube_folder, 'meta.json.tmp'), 'w', encoding='utf-8') as fh:
+        json.dump(meta, fh)
+    os.replace(os.path.join(cube_folder, 'meta.json.tmp'), os.path.join(cube_folder, 'meta.json'))
+
+
+def read_count_cube(cube_folder, source_key):
+    """
+    Open every dense level of a saved cube with its arrays memory-mapped, and the base level's
+    cells, and return the finest dense level, or None if the cube is missing or stale.
+    """
+    try:
+        with open(os.path.join(cube_folder, 'meta.json'), 'r', encoding='utf-8') as fh:
+            meta = json.load(fh)
+        if meta.get('version') != CUBE_VERSION or meta.get('source') != source_key:
+            return None
+        arrays = {minutes: (np.load(os.path.join(cube_folder, f'counts-{minutes}min.npy'), mmap_mode='r'),
+                            np.load(os.path.join(cube_folder, f'first-{minutes}min.npy'), mmap_mode='r'))
+                  for minutes in meta['levels']}
+        with np.load(os.path.join(cube_folder, f"cells-{meta['cell_minutes']}min.npz")) as saved:
+            cells = CellList(saved['keys'], saved['counts'], saved['first'], meta['cell_minutes'])
+    except (OSError, ValueError, KeyError):
+        return None
+    levels = {}
+    first_day = datetime.date.fromisoformat(meta['first_day'])
+    for minutes, (counts, first) in arrays.items():
+        CountCube(counts, first, meta['hubs'], meta['behaviours'], first_day, minutes, levels, cells)
+    return levels[min(levels)]
@@ -0,0 +1,352 @@
+import zlib
+import struct
+import numpy as np
+import matplotlib as mpl
+from matplotlib.colors import to_rgba, to_rgba_array
+
+# Raster backend for the fixed-grid cell charts of the fpMaker scripts (the consolidated, styled
+# and transparent charts). Instead of drawing every cell through matplotlib, the anti-aliased
+# coverage of one cell is computed once per offset from the pixel grid and stamped into the image
+# band by band, and the bands are written straight to a PNG with zlib. The layout follows the
+# matplotlib figures (default axes box, frame, bbox_inches='tight' margin), and the edges are
+# anti-aliased as Agg does it, so the two backends differ by a few 255ths at cell edges.
+#
+# Coverage is counted in 255ths, as Agg counts it, so a chart of a few cell colours has a few
+# hundred colours in all: the background, every cell colour at every coverage and the frame over
+# those. The image is built as indices into that palette and saved as a palette PNG when it has
+# up to 256 colours (square cells), otherwise as RGBA.
+
+# Coverage of a pixel, from 0 to LEVELS
+LEVELS = 255
+# Rounded cells are measured in STRIPS vertical strips per pixel, each cut by the corners at its middle
+STRIPS = 16
+# Cells are placed on a grid of OFFSET_STEPS x OFFSET_STEPS positions per pixel, one stamp for each
+OFFSET_STEPS = 64
+# Image rows built and compressed at a time; only one band is held in memory
+BAND_ROWS = 512
+# zlib level of the PNG data, from 1 (fastest) to 9 (smallest)
+PNG_COMPRESSION = 3
+# Margin around the framed charts, as savefig(bbox_inches='tight') adds
+PAD_INCHES = 0.1
+
+
+def corner_outline(radius_x, radius_y):
+    """
+    A rounded corner as Agg draws it: the quadratic Bezier curve from edge to edge with the control
+    point in the corner, cut into lines by Agg's recursive subdivision (curve3_div) until each is
+    within half a pixel of the curve. Returns the distance of the points from the vertical edge,
+    increasing, and their distance from the horizontal edge.
+    """
+    tolerance = 0.5 ** 2
+    points = [(0., radius_y)]
+    # Control points of the curves left to cut, the curve nearest the vertical edge last
+    curves = [((0., radius_y), (0., 0.), (radius_x, 0.), 0)]
+    while curves:
+        (x1, y1), (x2, y2), (x3, y3), level = curves.pop()
+        x12, y12, x23, y23 = (x1 + x2) / 2, (y1 + y2) / 2, (x2 + x3) / 2, (y2 + y3) / 2
+        x123, y123 = (x12 + x23) / 2, (y12 + y23) / 2
+        dx, dy = x3 - x1, y3 - y1
+        # A corner is never straight, so Agg's case of collinear control points does not arise
+        d = abs((x2 - x3) * dy - (y2 - y3) * dx)
+        if level > 32 or d * d <= tolerance * (dx * dx + dy * dy):
+            points.append((x123, y123))
+            continue
+        curves.append(((x123, y123), (x23, y23), (x3, y3), level + 1))
+        curves.append(((x1, y1), (x12, y12), (x123, y123), level + 1))
+    points.append((radius_x, 0.))
+    return np.array(points).T
+
+
+class CellStamps:
+    """
+    Coverage of a cell of width x height pixels, in 255ths per pixel, by where the cell is placed.
+    Rounded cells have the corners of BoxStyle "round" and anti-aliased edges, with one stamp per
+    offset from the pixel grid. Square cells are snapped to whole pixels, as matplotlib snaps
+    rectilinear paths, and are either in or out of a pixel.
+    """
+
+    def __init__(self, width, height, radius_x=0, radius_y=0):
+        self.width = width
+        self.height = height
+        self.radius_x = radius_x
+        self.radius_y = radius_y
+        self.rounded = radius_x > 0 and radius_y > 0
+        # Coverage steps of a pixel
+        self.levels = LEVELS if self.rounded else 1
+        self.stamps = {}
+        if self.rounded:
+            self.corner = corner_outline(radius_x, radius_y)
+
+    def coverage(self, x, y):
+        """
+        Coverage of the pixels from (0, 0) by a cell whose top-left corner is at (x, y), both
+        below 1. Each pixel column is cut into STRIPS strips; in each, the cell spans the rows
+        between its top and bottom edge, which the corners cut off at the middle of the strip.
+        """
+        columns, rows = int(np.ceil(x + self.width)), int(np.ceil(y + self.height))
+        edges = np.clip(np.arange(columns * STRIPS + 1) / STRIPS, x, x + self.width)
+        widths = np.diff(edges)
+        middle = (edges[:-1] + edges[1:]) / 2
+        # Distance to the nearer vertical edge, and how far the corners cut in from the top and
+        # bottom there
+        a = np.minimum(middle - x, x + self.width - middle)
+        inset = np.interp(a, *self.corner, right=0)
+        pixels = np.arange(rows, dtype=float)[:, None]
+        spans = np.clip(np.minimum(pixels + 1, y + self.height - inset) - np.maximum(pixels, y + inset), 0, 1)
+        covered = (spans * widths).reshape(rows, columns, STRIPS).sum(axis=2)
+        return np.round(covered * LEVELS).astype(np.uint8)
+
+    def at(self, x, y):
+        """Top-left pixel of the cell with its top-left corner at (x, y), and the key of its stamp."""
+        if not self.rounded:
+            left, top = int(np.floor(x + 0.5)), int(np.floor(y + 0.5))
+            key = (int(np.floor(y + self.height + 0.5)) - top, int(np.floor(x + self.width + 0.5)) - left)
+            if key not in self.stamps:
+                self.stamps[key] = np.ones(key, dtype=np.uint8)
+            return left, top, key
+
+        left, offset_x = divmod(int(np.floor(x * OFFSET_STEPS + 0.5)), OFFSET_STEPS)
+        top, offset_y = divmod(int(np.floor(y * OFFSET_STEPS + 0.5)), OFFSET_STEPS)
+        key = (offset_y, offset_x)
+        if key not in self.stamps:
+            self.stamps[key] = self.coverage(offset_x / OFFSET_STEPS, offset_y / OFFSET_STEPS)
+        return left, top, key
+
+
+def over(color, pixels, coverage):
+    """
+    RGBA (0 to 1) of `color` composited over `pixels` with the given coverage, not premultiplied.
+    Fully transparent results come out white, as matplotlib writes them.
+    """
+    cover = color[3] * np.asarray(coverage, dtype=float)[..., None]
+    alpha = cover + pixels[..., 3:] * (1 - cover)
+    rgb = color[:3] * cover + pixels[..., :3] * pixels[..., 3:] * (1 - cover)
+    rgb = np.divide(rgb, alpha, out=np.ones_like(rgb), where=alpha > 0)
+    return np.concatenate([rgb, alpha], axis=-1)
+
+
+def line_coverage(size, start, end):
+    """Share of each of `size` pixels covered by the span from `start` to `end`."""
+    pixels = np.arange(size, dtype=np.float32)
+    return np.clip(np.minimum(pixels + 1, end) - np.maximum(pixels, start), 0, 1)
+
+
+def frame_level(coverage):
+    """Coverage in 255ths, the steps of an 8-bit image."""
+    return np.round(coverage * 255).astype(int)
+
+
+def crossing_level(under, over):
+    """Coverage in 255ths of a pixel where a line of coverage `over` is drawn over one of `under`."""
+    return frame_level(1 - (1 - under / 255) * (1 - over / 255))
+
+
+class CellChart:
+    """
+    An image of cells in a few colours, rendered as palette indices. `colors` holds the RGBA
+    colour of every cell, `xs` and `ys` the pixel position of the left edge of every column and
+    the top edge of every row, and `stamps` the CellStamps of the cell shape. Cells must not
+    overlap, including the pixel around rounded cells. `frame` is None or the left, top, right and
+    bottom of a black outline, and its line width, drawn over the cells like the spines of an axes.
+    """
+
+    def __init__(self, width, height, colors, xs, ys, stamps, background, frame=None):
+        self.width = width
+        self.height = height
+        self.xs = xs
+        self.ys = ys
+        self.stamps = stamps
+        cell_colors, self.color_index = np.unique(colors.reshape(-1, 4), axis=0, return_inverse=True)
+        self.color_index = self.color_index.reshape(len(ys), len(xs))
+
+        # Palette: the background, then every cell colour at every coverage step of the stamps.
+        # A transparent background is white, as matplotlib writes it
+        background = np.asarray(background, dtype=float)
+        if background[3] == 0:
+            background = np.array([1., 1., 1., 0.])
+        levels = np.arange(1, stamps.levels + 1) / stamps.levels
+        palette = [background[None, :]] + [over(color, background, levels) for color in cell_colors]
+        palette = np.concatenate(palette)
+        self.lines = []
+        self.frame_levels = np.empty(0, dtype=int)
+        if frame is not None:
+            self.set_frame(*frame)
+            # ... and all of those under every coverage of the frame
+            palette = np.concatenate([palette] + [over(np.array([0., 0., 0., 1.]), palette, level / 255)
+                                                  for level in self.frame_levels])
+        self.palette = np.round(palette * 255).astype(np.uint8)
+        self.base_colors = len(palette) // (len(self.frame_levels) + 1)
+        self.tiles = {}
+
+    def set_frame(self, left, top, right, bottom, line_width):
+        # Spines are snapped as Agg snaps them: to the nearest pixel edge, then to the centre of a
+        # pixel if the rounded line width is odd. Each one runs the full length of the outline.
+        snap = 0.5 if int(np.floor(line_width + 0.5)) % 2 else 0
+        left, top, right, bottom = [np.floor(edge + 0.5) + snap for edge in (left, top, right, bottom)]
+        frame_columns = line_coverage(self.width, left - line_width / 2, right + line_width / 2)
+        frame_rows = line_coverage(self.height, top - line_width / 2, bottom + line_width / 2)
+        for edge in (left, right):
+            self.lines.append((frame_rows, line_coverage(self.width, edge - line_width / 2, edge + line_width / 2)))
+        for edge in (top, bottom):
+            self.lines.append((line_coverage(self.height, edge - line_width / 2, edge + line_width / 2), frame_columns))
+        # Every coverage a pixel of a line can have, in 255ths and increasing order, including the
+        # corners where the spines are drawn over each other
+        levels = [frame_level(np.outer(rows[rows > 0], columns[columns > 0])).ravel() for rows, columns in self.lines]
+        for i, (under_rows, under_columns) in enumerate(self.lines):
+            for over_rows, over_columns in self.lines[i + 1:]:
+                rows = (under_rows > 0) & (over_rows > 0)
+                columns = (under_columns > 0) & (over_columns > 0)
+                levels.append(crossing_level(frame_level(np.outer(under_rows[rows], under_columns[columns])),
+                                             frame_level(np.outer(over_rows[rows], over_columns[columns]))).ravel())
+        levels = np.unique(np.concatenate(levels))
+        self.frame_levels = levels[levels > 0]
+
+    def tile(self, key, color):
+        """Palette indices of the stamp `key` in cell colour number `color`."""
+        if (key, color) not in self.tiles:
+            levels = self.stamps.stamps[key]
+            self.tiles[key, color] = np.where(levels > 0, levels.astype(np.intp) + color * self.stamps.levels, 0).astype(self.dtype)
+        return self.tiles[key, color]
+
+    @property
+    def dtype(self):
+        return np.uint8 if len(self.palette) <= 256 else np.uint16
+
+    def paste(self, band, band_top, left, top, tile):
+        rows, columns = tile.shape
+        row_start, row_end = max(top, band_top), min(top + rows, band_top + band.shape[0])
+        column_start, column_end = max(left, 0), min(left + columns, self.width)
+        if row_start < row_end and column_start < column_end:
+            band[row_start - band_top:row_end - band_top, column_start:column_end] = \
+                tile[row_start - top:row_end - top, column_start - left:column_end - left]
+
+    def paste_line(self, band, band_top, rows, columns):
+        """Put a frame line, given by its coverage of the rows and columns, over the band."""
+        rows = rows[band_top:band_top + band.shape[0]]
+        if not rows.any():
+            return
+        row_start, row_end = np.flatnonzero(rows)[[0, -1]] + [0, 1]
+        column_start, column_end = np.flatnonzero(columns)[[0, -1]] + [0, 1]
+        levels = frame_level(np.outer(rows[row_start:row_end], columns[column_start:column_end]))
+        region = band[row_start:row_end, column_start:column_end]
+        # Where lines cross, the line is drawn over the coverage already there, as Agg blends spines
+        levels = crossing_level(np.append(0, self.frame_levels)[region // self.base_colors], levels)
+        levels = np.where(levels > 0, np.searchsorted(self.frame_levels, levels) + 1, 0)
+        region[:] = region % self.base_colors + levels * self.base_colors
+
+    def bands(self):
+        """Palette indices of the image, BAND_ROWS rows at a time."""
+        for band_top in range(0, self.height, BAND_ROWS):
+            band = np.zeros((min(BAND_ROWS, self.height - band_top), self.width), dtype=self.dtype)
+            # Cells of the rows that reach into this band
+            for row, y in enumerate(self.ys):
+                if y + self.stamps.height + 2 < band_top or y > band_top + band.shape[0]:
+                    continue
+                for column, x in enumerate(self.xs):
+                    left, top, key = self.stamps.at(x, y)
+                    self.paste(band, band_top, left, top, self.tile(key, self.color_index[row, column]))
+            for rows, columns in self.lines:
+                self.paste_line(band, band_top, rows, columns)
+            yield band
+
+
+def png_chunk(kind, data):
+    return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+
+def write_png(path, chart, dpi):
+    """
+    Write the chart as a PNG, compressing it band by band. With up to 256 colours it is a palette
+    image, otherwise 8-bit RGBA.
+    """
+    indexed = len(chart.palette) <= 256
+    compressor = zlib.compressobj(PNG_COMPRESSION)
+    pixels_per_metre = int(round(dpi / 0.0254))
+    with open(path, 'wb') as fh:
+        fh.write(b'\x89PNG\r\n\x1a\n')
+        fh.write(png_chunk(b'IHDR', struct.pack('>IIBBBBB', chart.width, chart.height, 8, 3 if indexed else 6, 0, 0, 0)))
+        fh.write(png_chunk(b'pHYs', struct.pack('>IIB', pixels_per_metre, pixels_per_metre, 1)))
+        if indexed:
+            fh.write(png_chunk(b'PLTE', chart.palette[:, :3].tobytes()))
+            if (chart.palette[:, 3] < 255).any():
+                fh.write(png_chunk(b'tRNS', chart.palette[:, 3].tobytes()))
+        # RGBA pixels are looked up as one 32-bit word each
+        colors = None if indexed else np.ascontiguousarray(chart.palette).view(np.uint32).ravel()
+        above = None
+        for band in chart.bands():
+            pixels = band if indexed else colors.take(band).view(np.uint8)
+            # Every row is stored with filter type 2, as its difference from the row above, which
+            # is all zeros for the many rows that repeat the one above
+            rows = np.empty((pixels.shape[0], pixels.shape[1] + 1), dtype=np.uint8)
+            rows[:, 0] = 2
+            rows[0, 1:] = pixels[0] if above is None else pixels[0] - above
+            rows[1:, 1:] = pixels[1:] - pixels[:-1]
+            above = pixels[-1]
+            data = compressor.compress(rows.tobytes())
+            if data:
+                fh.write(png_chunk(b'IDAT', data))
+        fh.write(png_chunk(b'IDAT', compressor.flush()))
+        fh.write(png_chunk(b'IEND', b''))
+
+
+def axes_size(fig_width, fig_height, dpi):
+    """Width and height in pixels of the default axes of a fig_width x fig_height inch figure."""
+    params = mpl.rcParams
+    return ((params['figure.subplot.right'] - params['figure.subplot.left']) * fig_width * dpi,
+            (params['figure.subplot.top'] - params['figure.subplot.bottom']) * fig_height * dpi)
+
+
+def write_cell_chart(path, colors, xs, ys, stamps, plot_width, plot_height, dpi, pad=0, background='white', frame=False):
+    """
+    Write a chart of cells placed at `xs` and `ys` pixels from the top-left corner of a plot area
+    of plot_width x plot_height pixels, with `pad` pixels of margin on every side. As with
+    savefig, the image size is truncated to whole pixels and the plot area keeps its place from
+    the bottom-left corner.
+    """
+    colors = to_rgba_array(np.asarray(colors).ravel()).reshape(len(ys), len(xs), 4)
+    # Rounded first, so sizes that are whole pixels up to float error are not cut short
+    width, height = int(round(plot_width + 2 * pad, 6)), int(round(plot_height + 2 * pad, 6))
+    # ... and so is the corner of the plot area, which would otherwise put the frame and the cells
+    # a pixel higher than matplotlib when it falls a float error short of a whole pixel
+    left, top = round(pad, 6), round(height - pad - plot_height, 6)
+    outline = (left, top, left + plot_width, top + plot_height, mpl.rcParams['axes.linewidth'] * dpi / 72) if frame else None
+    chart = CellChart(width, height, colors, np.asarray(xs) + left, np.asarray(ys) + top, stamps, to_rgba(background), outline)
+    write_png(path, chart, dpi)
+
+
+def write_square_chart(path, colors, cell_size, dpi=None):
+    """
+    Raster version of generate_consolidated_chart: square cells of `cell_size` inches filling a
+    framed, equal-aspect axes on white. `colors` holds the colour of every cell, rows top to bottom.
+    """
+    dpi = dpi or mpl.rcParams['figure.dpi']
+    num_rows, num_columns = np.shape(colors)[:2]
+    plot_width, plot_height = axes_size(cell_size * num_columns, cell_size * num_rows, dpi)
+    # With an equal aspect ratio the axes shrink to the largest square cells that fit
+    cell = min(plot_width / num_columns, plot_height / num_rows)
+    write_cell_chart(path, colors, cell * np.arange(num_columns), cell * np.arange(num_rows), CellStamps(cell, cell),
+                     cell * num_columns, cell * num_rows, dpi, pad=PAD_INCHES * dpi, frame=True)
+
+
+def write_rounded_chart(path, colors, cell_size, spacing, corner_radius, dpi=300, background='white', transparent=False):
+    """
+    Raster version of generate_styled_consolidated_chart: rounded cells of `cell_size` points,
+    `spacing` points apart, in a framed axes on `background` that leaves the spacing after the
+    last row and column. With transparent=True, that of generate_transparent_chart: no frame, no
+    margin and no spacing after the last cell. `colors` holds the colour of every cell, rows top
+    to bottom.
+    """
+    num_rows, num_columns = np.shape(colors)[:2]
+    trailing = 0 if transparent else spacing
+    fig_width = (num_columns * (cell_size + spacing) - spacing + trailing) / 72
+    fig_height = (num_rows * (cell_size + spacing) - spacing + trailing) / 72
+    plot_width, plot_height = axes_size(fig_width, fig_height, dpi)
+    # The axes limits are the figure size in inches, so points are scaled by the axes' share of the figure
+    scale_x, scale_y = plot_width / fig_width / 72, plot_height / fig_height / 72
+    stamps = CellStamps(cell_size * scale_x, cell_size * scale_y, corner_radius * scale_x, corner_radius * scale_y)
+    xs = np.arange(num_columns) * (cell_size + spacing) * scale_x
+    ys = np.arange(num_rows) * (cell_size + spacing) * scale_y
+    write_cell_chart(path, colors, xs, ys, stamps, plot_width, plot_height, dpi,
+                     pad=0 if transparent else PAD_INCHES * dpi,
+                     background='none' if transparent else background,
+                     frame=not transparent)
@@ -1,4 +1,5 @@
 import os
+import shutil
 import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
@@ -9,6 +10,21 @@ from matplotlib.colors import rgb_to_hsv, hsv_to_rgb
 from matplotlib.colors import LinearSegmentedColormap, Normalize
 from matplotlib.colors import ListedColormap, BoundaryNorm
 from matplotlib.colors import to_rgb
+from dataloader import describe_folder
+from eventstore import open_events, load_count_cube
+from chartrender import draw_heatmap_cells
+from chartpool import render_charts
+from rendercache import cached_render
+
+# Minutes per heatmap column, any level of the count cube's rollups (see ROLLUP_MINUTES in aggregates.py)
+HEATMAP_SLOT_MINUTES = 30
+# Worker processes rendering the charts; None for one per CPU core, 1 to render them one by one here
+CHART_WORKERS = None
+# Charts of hub x behavior pairs without entries in the date range: 'render' draws each of them
+# with its own title, 'link' draws one blank chart titled EMPTY_CHART_TITLE and hardlinks (or
+# copies) it to the file of every empty pair, 'skip' leaves them out
+EMPTY_CHARTS = 'render'
+EMPTY_CHART_TITLE = "No entries"
 
 
 pd.options.mode.chained_assignment = None  # Suppress SettingWithCopyWarning
@@ -16,7 +32,7 @@ pd.options.mode.chained_assignment = None  # Suppress SettingWithCopyWarning
 def list_folders(root_folder):
     subfolders = [f for f in os.listdir(root_folder) if os.path.isdir(os.path.join(root_folder, f))]
     for idx, folder in enumerate(subfolders, 1):
-        print(f"[{idx}] {folder}")
+        print(f"[{idx}] {folder} {describe_folder(os.path.join(root_folder, folder))}")
     return subfolders
 
 def get_folder_selection(subfolders):
@@ -54,16 +70,12 @@ def confirm_file_list():
             print("Invalid input, please enter Y or N.")
 
 def merge_csv_files(folder_path, csv_files):
-    merged_df = pd.concat([pd.read_csv(os.path.join(folder_path, file)) for file in csv_files], ignore_index=True)
-    merged_df = merged_df.loc[:, ~merged_df.columns.duplicated()]  # Remove duplicate columns if any
-    
-    # Assuming the 'Timestamp' column is present and contains both date and time
-    merged_df['Timestamp'] = pd.to_datetime(merged_df['Timestamp'])
-    merged_df['Date'] = merged_df['Timestamp'].dt.date
-    merged_df['Time'] = merged_df['Timestamp'].dt.time
-    first_date = merged_df['Date'].min()
-    last_date = merged_df['Date'].max()
-    return merged_df, first_date, last_date
+    # Only the store's metadata (or the start and end of each file) is read here,
+    # the counts are read once the date range is known
+    store = open_events(folder_path, csv_files)
+    first_date = store.first_date
+    last_date = store.last_date
+    return store, first_date, last_date
 
 def get_date_range(first_date, last_date):
     print(f"Available data range: {first_date} to {last_date}")
@@ -92,35 +104,28 @@ def create_data_vis_folder():
     os.makedirs(export_path, exist_ok=True)
     return export_path
 
-def generate_heatmap(df, hub_name, behavior_name, export_path, start_date, end_date):
-    # Prepare data for the heatmap
-    df = df.copy()
-    df['Timestamp'] = pd.to_datetime(df['Timestamp'])
-    
-    # Extract date and weekday
-    df['Date'] = df['Timestamp'].dt.date
-    df['Weekday'] = df['Timestamp'].dt.strftime('%a')
-    df['Date_with_Weekday'] = df['Date'].astype(str) + ' (' + df['Weekday'] + ')'
-    
-    # Create half-hour intervals by flooring the time to the nearest 30 minutes
-    df['Half Hour'] = df['Timestamp'].dt.floor('30min').dt.strftime('%H:%M')
-    
+def heatmap_matrix(cube, hub_name, behavior_name, start_date, end_date):
+    """
+    Date x time slot count matrix for the heatmap, read from the count cube at
+    HEATMAP_SLOT_MINUTES per slot. None for `hub_name` or `behavior_name` adds up all hubs
+    or behaviours.
+    """
     # Create a date range and time slots to ensure the chart includes all dates and times
     date_range = pd.date_range(start=start_date, end=end_date)
     date_labels = date_range.strftime('%Y-%m-%d (%a)').tolist()
+    time_slots = [f'{minute // 60:02d}:{minute % 60:02d}' for minute in range(0, 24 * 60, HEATMAP_SLOT_MINUTES)]
+
+    counts = cube.rollup(HEATMAP_SLOT_MINUTES).day_slot_counts(start_date, end_date, hub_name, behavior_name)
+    return pd.DataFrame(counts, index=date_labels, columns=time_slots)
+
+def heatmap_file(export_path, hub_name, behavior_name):
+    return os.path.join(export_path, f"{hub_name}-{behavior_name}.png")
+
+def generate_heatmap(pivot_df, hub_name, behavior_name, export_path, start_date, end_date, title=None):
+    # Weekdays of the rows, used to add extra spacing around weekends
+    date_range = pd.date_range(start=start_date, end=end_date)
     weekdays = date_range.strftime('%a').tolist()
-    time_slots = [f'{hour:02d}:{minute:02d}' for hour in range(24) for minute in [0, 30]]
-    
-    # Pivot the DataFrame to create a matrix for the heatmap
-    pivot_df = df.pivot_table(
-        index='Date_with_Weekday',
-        columns='Half Hour',
-        values='Button ID',
-        aggfunc='count',
-        fill_value=0
-    )
-    pivot_df = pivot_df.reindex(index=date_labels, columns=time_slots, fill_value=0)
-    
+
     data = pivot_df.values
     num_rows, num_columns = data.shape
 
@@ -202,73 +207,9 @@ def generate_heatmap(df, hub_name, behavior_name, export_path, start_date, end_d
     # Adjust font size to 55% of cell height
     font_size = cell_height_in_points * 0.45  # 55% of cell height in points
 
-    # Draw the heatmap cells with rounded corners and spacing
-    for (i, j), value in np.ndenumerate(data):
-        # Calculate positions with spacing and extra offsets
-        x = j + spacing / 2
-        y_cell = y_positions[i] + spacing / 2
-
-        time_label = pivot_df.columns[j]
-        facecolor = None
-        edgecolor = None
-        linewidth = 0
-
-        if value == 0:
-            facecolor = 'none'  # No background color
-            linewidth = linewidth_in_points
-
-            if time_label.endswith(':00'):
-                edgecolor = '#E6E7E6'  # Border color for '00' minutes
-            elif time_label.endswith(':30'):
-                edgecolor = '#C4C4C4'  # Border color for '30' minutes
-            else:
-                edgecolor = 'black'  # Default edge color if time format is unexpected
-        else:
-            # Determine the appropriate color based on the value
-            if value <= 5:
-                color_index = int(value) - 1  # Indices start from 0
-            else:
-                color_index = 5  # '5+' color
-            facecolor = cmap.colors[color_index]
-            edgecolor = None
-            linewidth = 0
-
-        # Draw the cell
-        rect = FancyBboxPatch(
-            (x, y_cell),
-            adjusted_cell_size,
-            adjusted_cell_size,
-            boxstyle=f"round,pad=0,rounding_size={adjusted_cell_size * 0.25}",
-            linewidth=linewidth,
-            edgecolor=edgecolor,
-            facecolor=facecolor
-        )
-        ax.add_patch(rect)
-
-        # Add the data value as text in the center of the cell with padding
-        if value != 0:
-            # Convert facecolor to RGB tuple
-            r, g, b = to_rgb(facecolor)  # Returns values between 0 and 1
-
-            # Calculate text color based on cell background color
-            luminance = 0.2126 * r + 0.7152 * g + 0.0722 * b  # Relative luminance
-            text_color = 'black' if luminance > 0.6 else 'white'
-
-            # Position of the text (center of the cell)
-            x_text = x + adjusted_cell_size / 2
-            y_text = y_cell + adjusted_cell_size / 2
-
-            # Add text
-            ax.text(
-                x_text,
-                y_text,
-                int(value),
-                ha='center',
-                va='center',
-                color=text_color,
-                fontsize=font_size,
-                clip_on=False
-            )
+    # Draw the heatmap cells with rounded corners and spacing, and their counts, as two batched artists
+    draw_heatmap_cells(ax, data, pivot_df.columns, y_positions, spacing, adjusted_cell_size,
+                       linewidth_in_points, cmap.colors, font_size)
 
     # Set the limits, labels, and ticks
     ax.set_xlim(0, num_columns)
@@ -283,9 +224,10 @@ def generate_heatmap(df, hub_name, behavior_name, export_path, start_date, end_d
     y_tick_positions = [y_positions[i] + adjusted_cell_size / 2 for i in range(num_rows)]
     ax.set_yticks(y_tick_positions)
     ax.set_yticklabels(pivot_df.index)
-    ax.set_xlabel("Time of Day (Half-Hour Intervals)")
+    interval = {30: "Half-Hour", 60: "Hourly"}.get(HEATMAP_SLOT_MINUTES, f"{HEATMAP_SLOT_MINUTES}-Minute")
+    ax.set_xlabel(f"Time of Day ({interval} Intervals)")
     ax.set_ylabel("Date (Weekday)")
-    plt.title(f"{hub_name} - {behavior_name}")
+    plt.title(title or f"{hub_name} - {behavior_name}")
 
     # Remove the spines and set aspect ratio
     ax.set_aspect('equal')
@@ -302,26 +244,51 @@ def generate_heatmap(df, hub_name, behavior_name, export_path, start_date, end_d
     cbar.ax.set_yticklabels(['1', '2', '3', '4', '5', '5+'])
 
     # Save the heatmap as a PNG file
-    export_file_name = f"{hub_name}-{behavior_name}.png"
-    plt.savefig(os.path.join(export_path, export_file_name), format='png', bbox_inches='tight')
+    # fig.savefig, as plt.savefig redraws the whole figure once more after saving
+    fig.savefig(heatmap_file(export_path, hub_name, behavior_name), format='png', bbox_inches='tight')
     plt.close()
 
-def analyze_and_generate_charts(merged_df, start_date, end_date):
-    # Filter data based on the selected date range
-    filtered_df = merged_df[(merged_df['Date'] >= start_date) & (merged_df['Date'] <= end_date)]
-    
-    # Get unique hubs and behaviors
-    hubs = filtered_df['Hub Name'].unique()
-    behaviors = filtered_df['Behaviour Name'].unique()
+def link_or_copy(source, destination):
+    try:
+        os.link(source, destination)
+    except OSError:
+        # File systems without hard links
+        shutil.copyfile(source, destination)
+
+def generate_empty_charts(cube, pairs, export_path, start_date, end_date):
+    """Charts of the hub x behavior pairs without entries in the date range, as set by EMPTY_CHARTS."""
+    if not pairs or EMPTY_CHARTS == 'skip':
+        return
+    empty_df = heatmap_matrix(cube, *pairs[0], start_date, end_date)
+    if EMPTY_CHARTS == 'render':
+        render_charts(generate_heatmap, [(empty_df, hub, behavior, export_path, start_date, end_date) for hub, behavior in pairs],
+                      CHART_WORKERS, outputs=[heatmap_file(export_path, hub, behavior) for hub, behavior in pairs])
+        return
+
+    # Draw the blank chart once, under the name of the first pair, and link the others to it
+    hub, behavior = pairs[0]
+    template = heatmap_file(export_path, hub, behavior)
+    cached_render(generate_heatmap, empty_df, hub, behavior, export_path, start_date, end_date, EMPTY_CHART_TITLE,
+                  output=template)
+    for hub, behavior in pairs[1:]:
+        link_or_copy(template, heatmap_file(export_path, hub, behavior))
+    print(f"{len(pairs)} hub and behavior pair(s) without entries share one blank chart.")
+
+def analyze_and_generate_charts(cube, start_date, end_date):
+    # Entries of every hub and behavior with data in the selected date range, in one lookup
+    counts, _ = cube.count_matrix(start_date, end_date)
+    pairs = counts.stack()
 
     # Create a folder for exporting the charts
     export_path = create_data_vis_folder()
 
-    # Generate charts for each hub and each behavior
-    for hub in hubs:
-        for behavior in behaviors:
-            behavior_df = filtered_df[(filtered_df['Hub Name'] == hub) & (filtered_df['Behaviour Name'] == behavior)]
-            generate_heatmap(behavior_df, hub, behavior, export_path, start_date, end_date)
+    # Generate charts for the hub and behavior pairs with entries, from their count matrices
+    filled = [pair for pair, count in pairs.items() if count > 0]
+    jobs = [(heatmap_matrix(cube, hub, behavior, start_date, end_date), hub, behavior, export_path, start_date, end_date)
+            for hub, behavior in filled]
+    render_charts(generate_heatmap, jobs, CHART_WORKERS,
+                  outputs=[heatmap_file(export_path, hub, behavior) for hub, behavior in filled])
+    generate_empty_charts(cube, [pair for pair, count in pairs.items() if count == 0], export_path, start_date, end_date)
 
 def main():
     root_folder = "data_input"
@@ -345,10 +312,12 @@ def main():
             # Now print the CSV files
             list_csv_files(folder_path)  # Default is print_files=True
             if confirm_file_list():
-                merged_df, first_date, last_date = merge_csv_files(folder_path, csv_files)
+                store, first_date, last_date = merge_csv_files(folder_path, csv_files)
                 start_date, end_date = get_date_range(first_date, last_date)
                 if confirm_date_selection(start_date, end_date):
-                    analyze_and_generate_charts(merged_df, start_date, end_date)
+                    # Charts are drawn from the count cube, the events themselves are not loaded
+                    cube = load_count_cube(store, start_date, end_date)
+                    analyze_and_generate_charts(cube, start_date, end_date)
                 break
             else:
                 continue
@@ -0,0 +1,83 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from rendercache import USE_RENDER_CACHE, source_key, chart_key, restore_chart, store_chart, evict_charts
+
+# Renders the charts of a fan-out (every hub x behaviour, every behaviour x week, ...) in a pool
+# of worker processes. A job is the arguments of one call of a chart function: the chart's small
+# count matrix and where to save it, so workers never need the events or the count cube. File
+# names are part of the jobs, not of the order in which they finish, so the output is the same
+# for any number of workers. Charts already in the render cache (see rendercache.py) are copied
+# from it instead of being drawn.
+
+# Width of the progress bar in characters
+PROGRESS_BAR_WIDTH = 40
+
+
+def init_worker():
+    # Workers only save files, so they use the non-interactive Agg backend whatever the default is
+    import matplotlib.pyplot as plt
+    plt.switch_backend('Agg')
+
+
+def show_progress(label, done, total):
+    filled = PROGRESS_BAR_WIDTH * done // total if total else PROGRESS_BAR_WIDTH
+    bar = '#' * filled + '-' * (PROGRESS_BAR_WIDTH - filled)
+    print(f"\r{label} [{bar}] {done}/{total}", end='\n' if done == total else '', flush=True)
+
+
+def cached_jobs(render, jobs, outputs):
+    """
+    Copy the charts of `jobs` found in the render cache to their outputs, and return the jobs
+    left to render with their cache keys and outputs.
+    """
+    if outputs is None or not USE_RENDER_CACHE:
+        return [(job, None, None) for job in jobs]
+    sources = source_key(render)
+    pending = []
+    for job, output in zip(jobs, outputs):
+        key = chart_key(sources, job, output)
+        if not restore_chart(key, output):
+            pending.append((job, key, output))
+    if len(pending) < len(jobs):
+        print(f"{len(jobs) - len(pending)} of {len(jobs)} chart(s) unchanged, copied from the render cache.")
+    return pending
+
+
+def finish_job(key, output):
+    if key is not None:
+        store_chart(key, output)
+
+
+def render_charts(render, jobs, workers=None, label="Rendering charts", outputs=None):
+    """
+    Call render(*job) for every job in `workers` processes (None for one per CPU core, 1 to render
+    in this process), with a progress bar. `render` must be a module-level function. An error in
+    any chart cancels the charts not yet started and is raised here. With `outputs`, the file each
+    job saves, charts are looked up in and added to the render cache.
+    """
+    jobs = list(jobs)
+    pending = cached_jobs(render, jobs, outputs)
+    if jobs and not pending:
+        return
+    workers = min(workers or os.cpu_count() or 1, len(pending))
+    show_progress(label, 0, len(pending))
+    if workers <= 1:
+        for done, (job, key, output) in enumerate(pending, 1):
+            render(*job)
+            finish_job(key, output)
+            show_progress(label, done, len(pending))
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as pool:
+            futures = {pool.submit(render, *job): (key, output) for job, key, output in pending}
+            try:
+                for done, future in enumerate(as_completed(futures), 1):
+                    future.result()
+                    finish_job(*futures[future])
+                    show_progress(label, done, len(pending))
+            except BaseException:
+                print()
+                for future in futures:
+                    future.cancel()
+                raise
+    if outputs is not None and USE_RENDER_CACHE and pending:
+        evict_charts()
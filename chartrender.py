@@ -0,0 +1,134 @@
+import numpy as np
+from matplotlib.artist import Artist, allow_rasterization
+from matplotlib.collections import PathCollection
+from matplotlib.colors import to_rgba, to_rgba_array
+from matplotlib.patches import BoxStyle
+from matplotlib.text import Text
+
+# Batched drawing for the cell charts. A chart of 30 days x 48 slots used to add one
+# FancyBboxPatch and one ax.text per cell, and savefig spent most of its time walking those
+# thousands of artists. Here every cell of a chart is one path of a single PathCollection and
+# all count labels are drawn by a single artist, with the same shapes, colours and glyphs.
+
+
+def add_cells(ax, xs, ys, width, height, boxstyle, facecolors, edgecolors='none', linewidths=0, zorder=1):
+    """
+    Add cells of `width` x `height` data units at the (xs, ys) corners as one collection. Each
+    cell has the outline the same FancyBboxPatch would have (`boxstyle`, e.g. "round,pad=0,
+    rounding_size=0.2"), and its own face colour, edge colour and edge width in points.
+    """
+    style = BoxStyle(boxstyle)
+    # The path FancyBboxPatch.get_path would build for each cell (mutation scale and aspect 1)
+    paths = [style(x, y, width, height, 1.) for x, y in zip(np.asarray(xs, dtype=float).tolist(),
+                                                             np.asarray(ys, dtype=float).tolist())]
+    cells = PathCollection(
+        paths,
+        facecolors=facecolors,
+        edgecolors=edgecolors,
+        linewidths=linewidths,
+        joinstyle='miter',  # Patch defaults, so outlines match those of FancyBboxPatch
+        capstyle='butt',
+        zorder=zorder,
+    )
+    ax.add_collection(cells, autolim=False)
+    return cells
+
+
+class CellLabels(Artist):
+    """
+    Many short single-line text labels drawn by one artist instead of one Text each. Every
+    distinct label is measured once, with Text.get_window_extent and the renderer's text metrics,
+    and each copy is drawn with renderer.draw_text, which renders the same glyphs as a Text with
+    the same properties.
+    """
+    zorder = 3  # Same as Text, so the labels are drawn over the cells
+
+    def __init__(self, xs, ys, labels, colors, fontsize, ha='center', va='center'):
+        super().__init__()
+        self.xs = np.asarray(xs, dtype=float)
+        self.ys = np.asarray(ys, dtype=float)
+        self.labels = [str(label) for label in labels]
+        self.colors = to_rgba_array(colors) if len(self.labels) else np.empty((0, 4))
+        self.fontsize = fontsize
+        self.ha = ha
+        self.va = va
+
+    def layout(self, label, renderer):
+        """
+        Offset of the baseline of a single-line `label` from its anchor, in pixels, and its font.
+        The bottom of the extent of the same Text aligned on its baseline is one descent below it.
+        """
+        template = Text(0, 0, label, ha=self.ha, va=self.va, fontsize=self.fontsize)
+        template.set_figure(self.get_figure(root=False))
+        extent = template.get_window_extent(renderer)
+        template.set_verticalalignment('baseline')
+        descent = -template.get_window_extent(renderer).y0
+        return extent.x0, extent.y0 + descent, template.get_fontproperties()
+
+    @allow_rasterization
+    def draw(self, renderer):
+        if not self.get_visible() or not self.labels:
+            return
+        renderer.open_group('cell_labels', self.get_gid())
+        positions = self.get_transform().transform(np.column_stack([self.xs, self.ys]))
+        _, canvas_height = renderer.get_canvas_width_height()
+        layouts = {}
+        gc = renderer.new_gc()
+        for (posx, posy), label, color in zip(positions, self.labels, self.colors):
+            if label not in layouts:
+                layouts[label] = self.layout(label, renderer)
+            x, y, prop = layouts[label]
+            gc.set_foreground(tuple(color), isRGBA=True)
+            y = y + posy
+            if renderer.flipy():
+                y = canvas_height - y
+            renderer.draw_text(gc, x + posx, y, label, prop, 0)
+        gc.restore()
+        renderer.close_group('cell_labels')
+        self.stale = False
+
+
+def add_cell_labels(ax, xs, ys, labels, colors, fontsize):
+    """Add labels centred on the (xs, ys) data positions, as ax.text(..., clip_on=False) would draw them."""
+    labels = CellLabels(xs, ys, labels, colors, fontsize)
+    labels.set_transform(ax.transData)
+    ax.add_artist(labels)
+    return labels
+
+
+def label_colors(facecolors):
+    """Black labels on light cells and white ones on dark cells, by relative luminance."""
+    rgb = to_rgba_array(facecolors)[:, :3]
+    luminance = rgb @ np.array([0.2126, 0.7152, 0.0722])
+    return np.where(luminance[:, None] > 0.6, to_rgba('black'), to_rgba('white'))
+
+
+def draw_heatmap_cells(ax, data, time_labels, y_positions, spacing, cell_size, edge_width, colors, font_size):
+    """
+    Draw the cells and count labels of a heatmap: rounded cells coloured by count (1 to 5, then
+    5+), and empty cells outlined in light grey on the hour and darker grey on the half hour.
+    Returns the cell collection and the label artist.
+    """
+    rows, columns = np.indices(data.shape)
+    rows, columns, values = rows.ravel(), columns.ravel(), np.asarray(data).ravel()
+    xs = columns + spacing / 2
+    ys = np.asarray(y_positions, dtype=float)[rows] + spacing / 2
+
+    # Empty cells: outline only, coloured by the minutes of their column
+    time_labels = np.asarray([str(label) for label in time_labels])
+    outline = np.where(np.char.endswith(time_labels, ':00'), '#E6E7E6',
+                       np.where(np.char.endswith(time_labels, ':30'), '#C4C4C4', 'black'))[columns]
+    empty = values == 0
+    color_index = np.clip(values, 1, 5 + 1).astype(int) - 1  # 6 and up share the '5+' colour
+    facecolors = np.where(empty[:, None], to_rgba('none'), to_rgba_array(colors)[color_index])
+    edgecolors = np.where(empty[:, None], to_rgba_array(outline), to_rgba('none'))
+    linewidths = np.where(empty, edge_width, 0)
+    cells = add_cells(ax, xs, ys, cell_size, cell_size, f"round,pad=0,rounding_size={cell_size * 0.25}",
+                      facecolors, edgecolors, linewidths)
+
+    # Count labels in the centre of every non-empty cell
+    filled = ~empty
+    labels = add_cell_labels(ax, xs[filled] + cell_size / 2, ys[filled] + cell_size / 2,
+                             values[filled].astype(int), label_colors(facecolors[filled]) if filled.any() else [],
+                             font_size)
+    return cells, labels
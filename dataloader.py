@@ -0,0 +1,608 @@
+import os
+import csv
+import json
+import time
+import hashlib
+import numpy as np
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+# Number of files parsed at the same time. None lets the pool pick a default based on the CPU count.
+LOAD_WORKERS = None
+# 'thread' or 'process'. Threads avoid copying the parsed frames between processes,
+# processes sidestep the GIL for very large folders.
+LOAD_EXECUTOR = 'thread'
+
+# Parsed files are kept here as one columnar .npz entry per source file
+USE_CACHE = True
+CACHE_FOLDER = os.path.join('data_output', '.cache')
+# Bump when the cached layout or the schema changes so older entries are not reused
+CACHE_VERSION = 3
+
+# Schema of the hub exports: "Timestamp","Hub Name","Behaviour Name","Button ID"
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+CATEGORY_COLUMNS = ['Hub Name', 'Behaviour Name']
+
+# Rows failing these checks are left out of the data and written to a quarantine CSV instead
+VALIDATE_ROWS = True
+QUARANTINE_FOLDER = os.path.join('data_output', 'quarantine')
+# Behaviour names to accept, e.g. ['Cooking fresh', 'Eating Out', 'Re-Heating Food', 'Snacking', 'Take Away']
+# for the fpMaker charts. None accepts every behaviour name.
+KNOWN_BEHAVIOURS = None
+BUTTON_ID_RANGE = (1, 9999)  # Smallest and largest valid Button ID
+
+# Drop presses exported more than once (same Timestamp, Hub Name, Behaviour Name and Button ID)
+DROP_DUPLICATES = True
+EVENT_KEY_COLUMNS = ['Timestamp', 'Hub Name', 'Behaviour Name', 'Button ID']
+
+# The quick date range scan reads this many rows from the start and the end of each file
+SCAN_LINES = 20
+SCAN_BLOCK = 64 * 1024
+# Rows read per chunk by iter_event_chunks and the streaming merge, which bounds their memory use
+CHUNK_SIZE = 100000
+
+
+def validation_key():
+    """The row check settings, so that entries loaded under other settings are not reused."""
+    return f"{VALIDATE_ROWS}|{KNOWN_BEHAVIOURS}|{BUTTON_ID_RANGE}"
+
+
+def file_fingerprint(file_path):
+    """
+    Return a key that changes whenever the file at `file_path` is replaced or modified, or the
+    row checks it is loaded with change.
+    """
+    stat = os.stat(file_path)
+    key = f"{CACHE_VERSION}|{validation_key()}|{os.path.abspath(file_path)}|{stat.st_size}|{stat.st_mtime_ns}"
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+def get_cache_folder(folder_path):
+    folder_name = os.path.basename(os.path.normpath(folder_path))
+    folder_key = hashlib.sha1(os.path.abspath(folder_path).encode('utf-8')).hexdigest()[:12]
+    return os.path.join(CACHE_FOLDER, f"{folder_name}-{folder_key}")
+
+
+def save_frame(df, cache_path):
+    """Write `df` column by column into an uncompressed .npz file (no pickling involved)."""
+    arrays = {'columns': np.array([str(c) for c in df.columns]), 'kinds': np.array([''] * len(df.columns), dtype='<U8')}
+    for i, column in enumerate(df.columns):
+        series = df.iloc[:, i]
+        if pd.api.types.is_datetime64_dtype(series) or pd.api.types.is_bool_dtype(series) or pd.api.types.is_numeric_dtype(series):
+            # Plain NumPy dtypes (including naive datetime64) are stored as they are
+            arrays['kinds'][i] = 'numeric'
+            arrays[f'c{i}'] = series.to_numpy()
+        elif isinstance(series.dtype, pd.CategoricalDtype):
+            arrays['kinds'][i] = 'category'
+            arrays[f'c{i}'] = series.cat.codes.to_numpy()
+            arrays[f'c{i}_values'] = np.array([str(u) for u in series.cat.categories], dtype=str)
+        else:
+            # Strings are stored as integer codes plus a table of the distinct values
+            codes, uniques = pd.factorize(series)
+            arrays['kinds'][i] = 'text'
+            arrays[f'c{i}'] = codes
+            arrays[f'c{i}_values'] = np.array([str(u) for u in uniques], dtype=str)
+
+    tmp_path = cache_path + '.tmp'
+    with open(tmp_path, 'wb') as fh:
+        np.savez(fh, **arrays)
+    os.replace(tmp_path, cache_path)
+
+
+def load_frame(cache_path):
+    """Rebuild a DataFrame written by `save_frame`."""
+    with np.load(cache_path, allow_pickle=False) as npz:
+        data = {}
+        for i, (column, kind) in enumerate(zip(npz['columns'].tolist(), npz['kinds'].tolist())):
+            values = npz[f'c{i}']
+            if kind == 'category':
+                data[column] = pd.Categorical.from_codes(values, npz[f'c{i}_values'].astype(object))
+            elif kind == 'text':
+                categories = npz[f'c{i}_values'].astype(object)
+                data[column] = pd.Categorical.from_codes(values, categories).astype(object)
+            else:
+                data[column] = values
+    return pd.DataFrame(data)
+
+
+def parse_timestamps(values):
+    # The fixed format avoids per-row format guessing; other layouts fall back to inference
+    try:
+        return pd.to_datetime(values, format=TIMESTAMP_FORMAT)
+    except (ValueError, TypeError):
+        return pd.to_datetime(values)
+
+
+def naive_timestamp(value):
+    # Timestamp of one value, NaT if it cannot be read or carries a UTC offset
+    try:
+        timestamp = pd.Timestamp(value)
+    except (ValueError, TypeError):
+        return pd.NaT
+    return pd.NaT if timestamp is pd.NaT or timestamp.tzinfo is not None else timestamp
+
+
+def parse_other_timestamps(values):
+    """
+    Read timestamps that are not in TIMESTAMP_FORMAT by inferring each one's format. Values with a
+    UTC offset come out as NaT like unreadable ones, as the local hub times have no zone.
+    """
+    try:
+        timestamps = pd.to_datetime(values, format='mixed', errors='coerce')
+        if getattr(timestamps.dtype, 'tz', None) is None:
+            return timestamps
+    except (ValueError, TypeError):
+        pass  # Offsets next to naive values, or several different offsets
+    return pd.to_datetime(pd.Series([naive_timestamp(value) for value in values], index=values.index, dtype=object))
+
+
+def apply_schema(df):
+    """
+    Convert the known columns to compact dtypes: datetime64 timestamps, categorical hub and
+    behaviour names and the smallest integer type that holds the button IDs.
+    """
+    # Convert the timestamps once here so cached entries do not need parsing again
+    if 'Timestamp' in df.columns:
+        try:
+            df['Timestamp'] = parse_timestamps(df['Timestamp'])
+        except (ValueError, TypeError):
+            pass  # Leave malformed timestamps as text, the scripts decide how to handle them
+    if 'Button ID' in df.columns and not isinstance(df['Button ID'].dtype, pd.CategoricalDtype):
+        try:
+            df['Button ID'] = pd.to_numeric(df['Button ID'], downcast='integer')
+        except (ValueError, TypeError):
+            df['Button ID'] = df['Button ID'].astype('category')  # Non-numeric IDs
+    return df
+
+
+def blank_values(series):
+    # Missing values and strings of only whitespace
+    blanks = [v for v in pd.unique(series.dropna()) if not str(v).strip()]
+    return series.isna() | series.isin(blanks)
+
+
+def split_invalid_rows(df):
+    """
+    Run the row checks on whole columns at once. Returns the valid rows and the invalid rows,
+    the latter with a 'Reason' column listing every check the row failed.
+    """
+    checks = []
+    if 'Timestamp' in df.columns:
+        timestamps = pd.to_datetime(df['Timestamp'], format=TIMESTAMP_FORMAT, errors='coerce')
+        failed = timestamps.isna() & df['Timestamp'].notna()
+        if failed.any():
+            # Only the rows the fixed format could not read are tried again with format inference
+            timestamps[failed] = parse_other_timestamps(df['Timestamp'][failed].astype(str))
+        checks.append((timestamps.isna().to_numpy(), 'unparseable timestamp'))
+    if 'Hub Name' in df.columns:
+        checks.append((blank_values(df['Hub Name']).to_numpy(), 'missing hub name'))
+    if 'Behaviour Name' in df.columns and KNOWN_BEHAVIOURS is not None:
+        checks.append((~df['Behaviour Name'].isin(KNOWN_BEHAVIOURS).to_numpy(), 'unknown behaviour'))
+    if 'Button ID' in df.columns:
+        button_ids = df['Button ID']
+        if not pd.api.types.is_numeric_dtype(button_ids):
+            button_ids = pd.to_numeric(button_ids.astype(object), errors='coerce')
+        in_range = button_ids.between(*BUTTON_ID_RANGE) & (button_ids % 1 == 0)
+        checks.append((~in_range.to_numpy(), 'button ID out of range'))
+
+    if not checks:
+        return df, df.iloc[:0]
+    bad = np.logical_or.reduce([mask for mask, _ in checks])
+    if 'Timestamp' in df.columns:
+        parsed = df.assign(Timestamp=timestamps)  # Saves apply_schema from parsing them again
+    else:
+        parsed = df
+    if not bad.any():
+        return parsed, df.iloc[:0]
+
+    parts = [np.where(mask[bad], reason, '') for mask, reason in checks]
+    invalid = df[bad].copy()
+    invalid['Reason'] = ['; '.join(p for p in row if p) for row in zip(*parts)]
+    valid = parsed[~bad].reset_index(drop=True)
+    for column in CATEGORY_COLUMNS:
+        if column in valid.columns and isinstance(valid[column].dtype, pd.CategoricalDtype):
+            valid[column] = valid[column].cat.remove_unused_categories()
+    return valid, invalid
+
+
+def get_quarantine_path(file_path):
+    folder_name = os.path.basename(os.path.dirname(os.path.abspath(file_path)))
+    file_name = os.path.splitext(os.path.basename(file_path))[0]
+    return os.path.join(QUARANTINE_FOLDER, folder_name, f"{file_name}_quarantine.csv")
+
+
+def write_quarantine(invalid, file_path, append=False):
+    """Write the rows that failed validation to the quarantine CSV of `file_path`."""
+    quarantine_path = get_quarantine_path(file_path)
+    os.makedirs(os.path.dirname(quarantine_path), exist_ok=True)
+    invalid.to_csv(quarantine_path, mode='a' if append else 'w', header=not append, index=False)
+    return quarantine_path
+
+
+def parse_csv_file(file_path):
+    df = pd.read_csv(file_path, dtype={column: 'category' for column in CATEGORY_COLUMNS})
+    if VALIDATE_ROWS:
+        df, invalid = split_invalid_rows(df)
+        quarantine_path = get_quarantine_path(file_path)
+        if len(invalid):
+            write_quarantine(invalid, file_path)
+            print(f"{os.path.basename(file_path)}: {len(invalid)} invalid row(s) moved to {quarantine_path}")
+        elif os.path.exists(quarantine_path):
+            os.remove(quarantine_path)  # Left over from an earlier version of the file
+    return apply_schema(df)
+
+
+def concat_frames(frames):
+    """
+    Concatenate per-file frames. Categorical columns are first given the sorted union of all
+    files' categories, otherwise pd.concat would fall back to plain object columns.
+    """
+    frames = list(frames)
+    for column in CATEGORY_COLUMNS + ['Button ID']:
+        parts = [df[column] for df in frames if column in df.columns]
+        if not parts or not all(isinstance(part.dtype, pd.CategoricalDtype) for part in parts):
+            continue
+        categories = pd.Index(np.concatenate([part.cat.categories.to_numpy(dtype=object) for part in parts])).unique().sort_values()
+        for df in frames:
+            df[column] = df[column].cat.set_categories(categories)
+    return pd.concat(frames, ignore_index=True)
+
+
+def hash_events(df):
+    """
+    64-bit hash of every row's (Timestamp, Hub Name, Behaviour Name, Button ID) tuple. Values are
+    normalised first, so the same press hashes the same whatever dtypes its file was loaded with.
+    """
+    keys = {}
+    for column in [c for c in EVENT_KEY_COLUMNS if c in df.columns]:
+        values = df[column]
+        if pd.api.types.is_datetime64_any_dtype(values):
+            values = values.astype('datetime64[ns]').astype('int64')
+        elif pd.api.types.is_numeric_dtype(values) and not pd.api.types.is_bool_dtype(values):
+            values = values.astype('float64')
+        keys[column] = values.to_numpy()
+    return pd.util.hash_pandas_object(pd.DataFrame(keys), index=False).to_numpy()
+
+
+class EventHashSet:
+    """
+    Set of event hashes stored as a few sorted uint64 arrays (8 bytes per event). A new run is
+    merged into the newest existing one whenever it is at least as large, so there are only
+    a logarithmic number of runs to binary-search, and no DataFrame of past events is kept.
+    """
+
+    def __init__(self, hashes=None):
+        self.runs = []
+        if hashes is not None and len(hashes):
+            self.runs.append(np.unique(hashes))
+
+    def __len__(self):
+        return sum(len(run) for run in self.runs)
+
+    def contains(self, hashes):
+        found = np.zeros(len(hashes), dtype=bool)
+        for run in self.runs:
+            positions = np.minimum(np.searchsorted(run, hashes), len(run) - 1)
+            found |= run[positions] == hashes
+        return found
+
+    def add_new(self, hashes):
+        """Add `hashes` to the set; returns a mask of the ones not seen before (first copy only)."""
+        new = ~pd.Series(hashes).duplicated().to_numpy() & ~self.contains(hashes)
+        run = np.sort(hashes[new])
+        while self.runs and len(self.runs[-1]) <= len(run):
+            run = np.sort(np.concatenate([self.runs.pop(), run]), kind='mergesort')
+        if len(run):
+            self.runs.append(run)
+        return new
+
+    def to_array(self):
+        return np.sort(np.concatenate(self.runs)) if self.runs else np.empty(0, dtype=np.uint64)
+
+
+def drop_duplicate_events(frames, csv_files, seen=None, report=True):
+    """
+    Drop the rows of every frame that repeat an event of an earlier row or file, keeping the
+    first copy. `seen` can carry the events of earlier merges; the number of duplicates
+    dropped is printed per file.
+    """
+    seen = EventHashSet() if seen is None else seen
+    result = []
+    total = 0
+    for file, df in zip(csv_files, frames):
+        new = seen.add_new(hash_events(df))
+        dropped = int(len(df) - new.sum())
+        if dropped:
+            df = df[new].reset_index(drop=True)
+            if report:
+                print(f"{file}: dropped {dropped} duplicate entries")
+        total += dropped
+        result.append(df)
+    if report:
+        print(f"{total} duplicate entries dropped in total.")
+    return result
+
+
+def iter_event_chunks(folder_path, csv_files, chunk_size=CHUNK_SIZE):
+    """
+    Read the files chunk by chunk and yield every chunk validated, without duplicated presses
+    and with the shared schema, so a report can be built without holding all rows at once.
+    Invalid rows are quarantined as in parse_csv_file. The duplicate check keeps the 8-byte
+    hash of every event seen.
+    """
+    seen = EventHashSet() if DROP_DUPLICATES else None
+    total_dropped = 0
+    for file in csv_files:
+        file_path = os.path.join(folder_path, file)
+        dropped = quarantined = 0
+        for chunk in pd.read_csv(file_path, dtype={column: 'category' for column in CATEGORY_COLUMNS}, chunksize=chunk_size):
+            chunk = chunk.loc[:, ~chunk.columns.duplicated()]  # Remove duplicate columns if any
+            if VALIDATE_ROWS:
+                chunk, invalid = split_invalid_rows(chunk)
+                if len(invalid):
+                    write_quarantine(invalid, file_path, append=quarantined > 0)
+                    quarantined += len(invalid)
+            chunk = apply_schema(chunk)
+            if seen is not None:
+                new = seen.add_new(hash_events(chunk))
+                dropped += int(len(chunk) - new.sum())
+                chunk = chunk[new]
+            yield chunk
+        if quarantined:
+            print(f"{file}: {quarantined} invalid row(s) moved to {get_quarantine_path(file_path)}")
+        elif VALIDATE_ROWS and os.path.exists(get_quarantine_path(file_path)):
+            os.remove(get_quarantine_path(file_path))  # Left over from an earlier version of the file
+        if dropped:
+            print(f"{file}: dropped {dropped} duplicate entries")
+        total_dropped += dropped
+    if seen is not None:
+        print(f"{total_dropped} duplicate entries dropped in total.")
+
+
+def sort_by_time(df):
+    """
+    Sort `df` by Timestamp (rows without a valid timestamp last), the order `time_slice` and
+    `date_slice` rely on. Frames that are already in this order are returned unchanged.
+    """
+    timestamps = df['Timestamp']
+    valid_rows = int(timestamps.notna().sum())
+    head = timestamps.iloc[:valid_rows]
+    if head.notna().all() and head.is_monotonic_increasing:
+        return df
+    return df.sort_values('Timestamp', kind='stable', na_position='last', ignore_index=True)
+
+
+def time_slice(df, start, end):
+    """
+    Rows of a time-sorted frame with start <= Timestamp < end (None for an open end), found
+    with a binary search instead of comparing every row.
+    """
+    times = df['Timestamp'].to_numpy()
+    lo = 0 if start is None else times.searchsorted(pd.Timestamp(start).to_datetime64().astype(times.dtype), side='left')
+    hi = int(df['Timestamp'].notna().sum()) if end is None else times.searchsorted(pd.Timestamp(end).to_datetime64().astype(times.dtype), side='left')
+    return df.iloc[lo:hi]
+
+
+def date_slice(df, start_date, end_date):
+    """Rows of a time-sorted frame dated from `start_date` to `end_date`, both inclusive."""
+    return time_slice(df, pd.Timestamp(start_date), pd.Timestamp(end_date) + pd.Timedelta(days=1))
+
+
+def report_memory_usage(df):
+    usage = df.memory_usage(deep=True, index=False)
+    print("Memory footprint per column:")
+    for column, size in usage.items():
+        print(f"---- {column} ({df[column].dtype}): {size / 1024 ** 2:.2f} MB")
+    print(f"---- Total: {usage.sum() / 1024 ** 2:.2f} MB")
+
+
+def compute_file_stats(df):
+    """Row count, date range, hubs and behaviours of one file, as stored in its stats sidecar."""
+    stats = {'rows': len(df), 'first': None, 'last': None, 'hubs': [], 'behaviours': []}
+    if 'Timestamp' in df.columns:
+        timestamps = pd.to_datetime(df['Timestamp'], errors='coerce')
+        first, last = timestamps.min(), timestamps.max()
+        stats['first'] = None if pd.isna(first) else first.isoformat()
+        stats['last'] = None if pd.isna(last) else last.isoformat()
+    for column, key in (('Hub Name', 'hubs'), ('Behaviour Name', 'behaviours')):
+        if column in df.columns:
+            stats[key] = [str(v) for v in df[column].dropna().unique()]
+    return stats
+
+
+def get_stats_path(cache_path):
+    return cache_path[:-len('.npz')] + '.stats.json'
+
+
+def write_file_stats(df, stats_path):
+    try:
+        with open(stats_path, 'w', encoding='utf-8') as fh:
+            json.dump(compute_file_stats(df), fh)
+    except OSError as e:
+        print(f"Could not write {stats_path}: {e}")
+
+
+def read_file_stats(folder_path, file):
+    """Stats sidecar of `file`, or None when the file has not been loaded since it last changed."""
+    key = file_fingerprint(os.path.join(folder_path, file))
+    stats_path = os.path.join(get_cache_folder(folder_path), f"{key}.stats.json")
+    try:
+        with open(stats_path, 'r', encoding='utf-8') as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return None
+
+
+def read_csv_file(file_path, cache_path=None):
+    """
+    Parse a single CSV file, or load it from `cache_path` when a cached copy exists.
+    Returns the DataFrame, the time spent in seconds and whether the cache was used.
+    A stats sidecar is written next to the cache entry if there is none yet.
+    """
+    start = time.perf_counter()
+    df, cached = None, False
+    if cache_path is not None and os.path.exists(cache_path):
+        try:
+            df, cached = load_frame(cache_path), True
+        except (OSError, ValueError, KeyError):
+            pass  # Unreadable cache entry, fall back to the CSV file
+
+    if df is None:
+        df = parse_csv_file(file_path)
+        if cache_path is not None:
+            try:
+                save_frame(df, cache_path)
+            except OSError as e:
+                print(f"Could not cache {file_path}: {e}")
+    if cache_path is not None and not os.path.exists(get_stats_path(cache_path)):
+        write_file_stats(df, get_stats_path(cache_path))
+    return df, time.perf_counter() - start, cached
+
+
+def file_in_date_range(stats, start_date, end_date):
+    # Files without stats (or without valid timestamps) cannot be ruled out
+    if stats is None or stats['first'] is None:
+        return True
+    if start_date is not None and pd.Timestamp(stats['last']).date() < start_date:
+        return False
+    if end_date is not None and pd.Timestamp(stats['first']).date() > end_date:
+        return False
+    return True
+
+
+def files_in_date_range(folder_path, csv_files, start_date, end_date):
+    """Drop the files whose stats sidecar shows they hold no rows between start_date and end_date."""
+    return [file for file in csv_files
+            if file_in_date_range(read_file_stats(folder_path, file), start_date, end_date)]
+
+
+def describe_folder(folder_path):
+    """
+    Summary of a data folder built from the stats sidecars only, for the folder picker.
+    Files that have not been loaded yet are counted as not indexed.
+    """
+    csv_files = [f for f in os.listdir(folder_path) if f.endswith('.csv')]
+    all_stats = [read_file_stats(folder_path, file) for file in csv_files]
+    indexed = [stats for stats in all_stats if stats is not None]
+    if not csv_files:
+        return "(no CSV files)"
+    if not indexed:
+        return f"({len(csv_files)} file(s), not indexed yet)"
+
+    rows = sum(stats['rows'] for stats in indexed)
+    firsts = [stats['first'] for stats in indexed if stats['first']]
+    lasts = [stats['last'] for stats in indexed if stats['last']]
+    date_range = f"{pd.Timestamp(min(firsts)).date()} to {pd.Timestamp(max(lasts)).date()}" if firsts else "no valid dates"
+    hubs = {hub for stats in indexed for hub in stats['hubs']}
+    behaviours = {behaviour for stats in indexed for behaviour in stats['behaviours']}
+    summary = f"{len(csv_files)} file(s), {rows} entries, {date_range}, {len(hubs)} hub(s), {len(behaviours)} behaviour(s)"
+    if len(indexed) < len(csv_files):
+        summary += f", {len(csv_files) - len(indexed)} file(s) not indexed yet"
+    return f"({summary})"
+
+
+def evict_stale_cache_entries(cache_folder, keep_keys):
+    """Delete cache entries of files that changed or no longer exist."""
+    if not os.path.isdir(cache_folder):
+        return 0
+    removed = 0
+    for entry in os.listdir(cache_folder):
+        key = entry.split('.', 1)[0]
+        if key not in keep_keys and not os.path.isdir(os.path.join(cache_folder, entry)):
+            try:
+                os.remove(os.path.join(cache_folder, entry))
+                removed += 1
+            except OSError:
+                pass
+    return removed
+
+
+def scan_timestamp_range(file_path, lines=SCAN_LINES):
+    """
+    Estimate the first and last timestamp of a CSV file from its first and last few rows only.
+    Hub exports are written in time order, so the rows in between do not need parsing.
+    Returns (first, last), NaT when no readable timestamp was found.
+    """
+    with open(file_path, 'rb') as fh:
+        head = fh.read(SCAN_BLOCK).decode('utf-8', errors='replace').splitlines()
+        tail_start = max(0, os.path.getsize(file_path) - SCAN_BLOCK)
+        fh.seek(tail_start)
+        tail = fh.read().decode('utf-8', errors='replace').splitlines()
+    if not head:
+        return pd.NaT, pd.NaT
+    if tail_start > 0:
+        tail = tail[1:]  # The block most likely starts in the middle of a row
+
+    header = next(csv.reader([head[0]]))
+    column = header.index('Timestamp') if 'Timestamp' in header else 0
+    sample = head[1:lines + 1] + tail[-lines:]
+    values = [row[column] for row in csv.reader(sample) if len(row) > column]
+    timestamps = pd.to_datetime(pd.Series(values, dtype=object), format=TIMESTAMP_FORMAT, errors='coerce')
+    if timestamps.isna().all():
+        timestamps = pd.to_datetime(pd.Series(values, dtype=object), errors='coerce', format='mixed')
+    return timestamps.min(), timestamps.max()
+
+
+def scan_folder_range(folder_path, csv_files):
+    """
+    First and last timestamp of every file, taken from its stats sidecar when there is one
+    and from a head/tail scan otherwise.
+    """
+    ranges = {}
+    for file in csv_files:
+        stats = read_file_stats(folder_path, file)
+        if stats is not None:
+            ranges[file] = (pd.Timestamp(stats['first']) if stats['first'] else pd.NaT,
+                            pd.Timestamp(stats['last']) if stats['last'] else pd.NaT)
+        else:
+            ranges[file] = scan_timestamp_range(os.path.join(folder_path, file))
+    return ranges
+
+
+def load_csv_files(folder_path, csv_files, workers=LOAD_WORKERS, executor=LOAD_EXECUTOR, report=True, use_cache=USE_CACHE,
+                   start_date=None, end_date=None):
+    """
+    Parse every file in `csv_files` concurrently and return the DataFrames in the same order
+    as `csv_files`, so the merged result does not depend on which file finished first.
+    Unchanged files are loaded from the columnar cache instead of being parsed again.
+    With `start_date`/`end_date`, files whose stats sidecar lies wholly outside the range
+    are skipped without being opened.
+    """
+    if start_date is not None or end_date is not None:
+        in_range = files_in_date_range(folder_path, csv_files, start_date, end_date)
+        if report and len(in_range) < len(csv_files):
+            print(f"Skipping {len(csv_files) - len(in_range)} file(s) outside {start_date} to {end_date}.")
+        csv_files = in_range
+    file_paths = [os.path.join(folder_path, file) for file in csv_files]
+    cache_paths = [None] * len(file_paths)
+    if use_cache:
+        cache_folder = get_cache_folder(folder_path)
+        os.makedirs(cache_folder, exist_ok=True)
+        keys = [file_fingerprint(path) for path in file_paths]
+        cache_paths = [os.path.join(cache_folder, f"{key}.npz") for key in keys]
+        # Only evict when looking at the whole folder, a partial file list is not a reason to drop entries
+        if set(csv_files) == {f for f in os.listdir(folder_path) if f.endswith('.csv')}:
+            evict_stale_cache_entries(cache_folder, set(keys))
+
+    wall_start = time.perf_counter()
+    if workers == 1 or len(file_paths) <= 1:
+        results = [read_csv_file(path, cache) for path, cache in zip(file_paths, cache_paths)]
+    else:
+        pool_class = ProcessPoolExecutor if executor == 'process' else ThreadPoolExecutor
+        with pool_class(max_workers=workers) as pool:
+            # map() yields results in submission order regardless of completion order
+            results = list(pool.map(read_csv_file, file_paths, cache_paths))
+
+    wall_time = time.perf_counter() - wall_start
+    if report:
+        total_rows = 0
+        for file, (df, elapsed, cached) in zip(csv_files, results):
+            total_rows += len(df)
+            rate = len(df) / elapsed if elapsed > 0 else float('inf')
+            source = "loaded from cache" if cached else "parsed"
+            print(f"---- {file}: {len(df)} rows {source} in {elapsed:.3f}s ({rate:,.0f} rows/s)")
+        total_rate = total_rows / wall_time if wall_time > 0 else float('inf')
+        cache_hits = sum(1 for _, _, cached in results if cached)
+        print(f"Loaded {total_rows} rows from {len(results)} file(s) ({cache_hits} from cache) in {wall_time:.3f}s ({total_rate:,.0f} rows/s)")
+
+    return [df for df, _, _ in results]
@@ -0,0 +1,341 @@
+import os
+import json
+import hashlib
+import datetime
+import numpy as np
+import pandas as pd
+from aggregates import build_count_cube, save_count_cube, read_count_cube
+from dataloader import (load_csv_files, concat_frames, file_fingerprint, get_cache_folder, scan_folder_range,
+                        sort_by_time, date_slice, drop_duplicate_events, validation_key, DROP_DUPLICATES)
+
+# One fixed-size record per button press, sorted by time
+EVENT_DTYPE = np.dtype([
+    ('time', '<i8'),       # nanoseconds since the epoch, NaT for unparseable timestamps
+    ('hub', '<u2'),        # index into the hub name table
+    ('behaviour', 'u1'),   # index into the behaviour name table
+    ('button', '<i4'),     # index into the button ID table
+])
+EVENT_COLUMNS = ['Timestamp', 'Hub Name', 'Behaviour Name', 'Button ID']
+# Bump when the on-disk layout changes so older stores are rebuilt
+STORE_VERSION = 3
+NAT_TIME = np.iinfo(np.int64).min
+NS_PER_DAY = 86400 * 10 ** 9
+
+
+def empty_events():
+    """A frame without events, with the dtypes of loaded ones (categorical hub and behaviour names)."""
+    return pd.DataFrame({
+        'Timestamp': pd.Series(dtype='datetime64[ns]'),
+        'Hub Name': pd.Categorical([]),
+        'Behaviour Name': pd.Categorical([]),
+        'Button ID': pd.Series(dtype='int64'),
+    })
+
+
+def load_events(folder_path, csv_files):
+    """Load and concatenate the files, leaving out presses repeated across exports."""
+    frames = load_csv_files(folder_path, csv_files)
+    if DROP_DUPLICATES:
+        frames = drop_duplicate_events(frames, csv_files)
+    return concat_frames(frames)
+
+
+def get_store_folder(folder_path):
+    return os.path.join(get_cache_folder(folder_path), 'events')
+
+
+def get_source_key(folder_path, csv_files):
+    """Key of the exact set of input files a store was built from."""
+    fingerprints = sorted(file_fingerprint(os.path.join(folder_path, file)) for file in csv_files)
+    return hashlib.sha1(f"{STORE_VERSION}|{DROP_DUPLICATES}|{validation_key()}|{'|'.join(fingerprints)}".encode('utf-8')).hexdigest()
+
+
+def encode_column(values, max_codes, column):
+    # NaN gets its own entry (stored as null in the name table) instead of a sentinel code
+    codes, uniques = pd.factorize(values, use_na_sentinel=False)
+    if len(uniques) > max_codes:
+        raise ValueError(f"Too many distinct values in '{column}' for the event store ({len(uniques)} > {max_codes}).")
+    names = [None if pd.isna(u) else (u.item() if isinstance(u, np.generic) else u) for u in np.asarray(uniques, dtype=object)]
+    return codes, names
+
+
+def build_event_store(df, store_folder, source_key):
+    """Write the four event columns of `df` to `store_folder` as time-sorted record files, one per ISO week."""
+    missing = [column for column in EVENT_COLUMNS if column not in df.columns]
+    if missing:
+        raise ValueError(f"Required column(s) {', '.join(missing)} not found in the data.")
+
+    times = pd.to_datetime(df['Timestamp'], errors='coerce').to_numpy(dtype='datetime64[ns]').view('int64')
+    hub_codes, hubs = encode_column(df['Hub Name'], np.iinfo(np.uint16).max + 1, 'Hub Name')
+    behaviour_codes, behaviours = encode_column(df['Behaviour Name'], np.iinfo(np.uint8).max + 1, 'Behaviour Name')
+    button_codes, buttons = encode_column(df['Button ID'], np.iinfo(np.int32).max, 'Button ID')
+
+    events = np.empty(len(df), dtype=EVENT_DTYPE)
+    events['time'] = times
+    events['hub'] = hub_codes
+    events['behaviour'] = behaviour_codes
+    events['button'] = button_codes
+    events = events[np.argsort(times, kind='stable')]
+
+    os.makedirs(store_folder, exist_ok=True)
+    partitions = []
+    for name, first_row, last_row in partition_bounds(events['time']):
+        path = os.path.join(store_folder, f"{name}.bin")
+        events[first_row:last_row].tofile(path + '.tmp')
+        os.replace(path + '.tmp', path)
+        part_times = events['time'][first_row:last_row]
+        partitions.append({
+            'name': name,
+            'rows': int(last_row - first_row),
+            'first': None if part_times[0] == NAT_TIME else str(part_times[0].astype('datetime64[ns]')),
+            'last': None if part_times[-1] == NAT_TIME else str(part_times[-1].astype('datetime64[ns]')),
+        })
+
+    meta = {
+        'version': STORE_VERSION,
+        'source': source_key,
+        'rows': len(events),
+        'partitions': partitions,
+        'hubs': hubs,
+        'behaviours': behaviours,
+        'buttons': buttons,
+    }
+    # The metadata is written last, so an interrupted build is never mistaken for a valid store
+    with open(os.path.join(store_folder, 'meta.json.tmp'), 'w', encoding='utf-8') as fh:
+        json.dump(meta, fh)
+    os.replace(os.path.join(store_folder, 'meta.json.tmp'), os.path.join(store_folder, 'meta.json'))
+
+    # Remove partitions of an earlier build that no longer hold any events
+    keep = {f"{p['name']}.bin" for p in partitions}
+    for entry in os.listdir(store_folder):
+        if entry.endswith('.bin') and entry not in keep:
+            os.remove(os.path.join(store_folder, entry))
+
+
+def partition_bounds(times):
+    """
+    Split time-sorted nanosecond timestamps into ISO-week partitions. Yields the partition name
+    and its first/last row; events without a valid timestamp go into an 'undated' partition.
+    """
+    first_valid = int(np.searchsorted(times, NAT_TIME, side='right'))
+    if first_valid > 0:
+        yield 'undated', 0, first_valid
+    days = times[first_valid:] // NS_PER_DAY
+    # 1970-01-01 was a Thursday, shifting by 3 days makes the weeks start on Monday
+    week_starts = days - (days + 3) % 7
+    starts = np.flatnonzero(np.diff(week_starts)) + 1
+    bounds = np.concatenate([[0], starts, [len(week_starts)]]) if len(week_starts) else []
+    for i in range(len(bounds) - 1):
+        week_start = pd.Timestamp(int(week_starts[bounds[i]]) * NS_PER_DAY)
+        iso_year, iso_week, _ = week_start.isocalendar()
+        yield f"events-{iso_year}-W{iso_week:02d}", first_valid + int(bounds[i]), first_valid + int(bounds[i + 1])
+
+
+def read_store_meta(store_folder):
+    try:
+        with open(os.path.join(store_folder, 'meta.json'), 'r', encoding='utf-8') as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return None
+
+
+def name_table(names):
+    """Turn a stored name list into (categories, code map) for pd.Categorical.from_codes."""
+    code_map = np.full(len(names), -1, dtype=np.int32)
+    categories = []
+    for code, name in enumerate(names):
+        if name is not None:
+            code_map[code] = len(categories)
+            categories.append(name)
+    return categories, code_map
+
+
+class EventStore:
+    """
+    Read-only view of an event store. Each ISO week is a separate file that is opened with
+    np.memmap only when a requested date range overlaps it, so opening the store reads just
+    the metadata and a short date range touches only a few partitions.
+    """
+
+    def __init__(self, store_folder):
+        meta = read_store_meta(store_folder)
+        if meta is None:
+            raise FileNotFoundError(f"No event store found in {store_folder}.")
+        self.store_folder = store_folder
+        self.source = meta['source']
+        self.rows = meta['rows']
+        self.partitions = meta['partitions']
+        self.hubs = meta['hubs']
+        self.behaviours = meta['behaviours']
+        self.buttons = meta['buttons']
+
+    def __len__(self):
+        return self.rows
+
+    @property
+    def dated_partitions(self):
+        return [p for p in self.partitions if p['first'] is not None]
+
+    @property
+    def first_date(self):
+        dated = self.dated_partitions
+        return pd.Timestamp(dated[0]['first']).date() if dated else None
+
+    @property
+    def last_date(self):
+        dated = self.dated_partitions
+        return pd.Timestamp(dated[-1]['last']).date() if dated else None
+
+    def read_partition(self, partition):
+        path = os.path.join(self.store_folder, f"{partition['name']}.bin")
+        return np.memmap(path, dtype=EVENT_DTYPE, mode='r', shape=(partition['rows'],))
+
+    def read_events(self, start_date=None, end_date=None):
+        """
+        Return the events between `start_date` and `end_date` (inclusive dates, None for open
+        ends), sorted by time. Partitions outside the range are never opened. Without a range,
+        all events are returned, with undated ones at the end.
+        """
+        if start_date is None and end_date is None:
+            # Undated events go last, matching how pandas sorts NaT
+            partitions = self.dated_partitions + [p for p in self.partitions if p['first'] is None]
+        else:
+            partitions = [p for p in self.dated_partitions
+                          if (start_date is None or pd.Timestamp(p['last']).date() >= start_date)
+                          and (end_date is None or pd.Timestamp(p['first']).date() <= end_date)]
+        if not partitions:
+            return np.empty(0, dtype=EVENT_DTYPE)
+        parts = [self.read_partition(p) for p in partitions]
+        events = parts[0] if len(parts) == 1 else np.concatenate(parts)
+
+        # Trim the first and last partition to the exact range
+        lo, hi = 0, len(events)
+        if start_date is not None:
+            lo = np.searchsorted(events['time'], pd.Timestamp(start_date).value, side='left')
+        if end_date is not None:
+            hi = np.searchsorted(events['time'], (pd.Timestamp(end_date) + pd.Timedelta(days=1)).value, side='left')
+        return events[lo:hi]
+
+    def to_frame(self, start_date=None, end_date=None):
+        """Decode the events between `start_date` and `end_date` into the usual four-column DataFrame."""
+        events = self.read_events(start_date, end_date)
+        hub_categories, hub_map = name_table(self.hubs)
+        behaviour_categories, behaviour_map = name_table(self.behaviours)
+
+        if self.buttons and all(isinstance(b, int) for b in self.buttons):
+            button_values = np.asarray(self.buttons)
+            button_ids = pd.to_numeric(button_values, downcast='integer')[events['button']]
+        else:
+            button_categories, button_map = name_table(self.buttons)
+            button_ids = pd.Categorical.from_codes(button_map[events['button']], button_categories)
+
+        return pd.DataFrame({
+            'Timestamp': np.asarray(events['time']).view('datetime64[ns]'),
+            'Hub Name': pd.Categorical.from_codes(hub_map[events['hub']], hub_categories),
+            'Behaviour Name': pd.Categorical.from_codes(behaviour_map[events['behaviour']], behaviour_categories),
+            'Button ID': button_ids,
+        })
+
+
+def load_event_store(folder_path, csv_files):
+    """
+    Open the event store of `folder_path`, building it first when it is missing or was built
+    from a different set of files.
+    """
+    store_folder = get_store_folder(folder_path)
+    source_key = get_source_key(folder_path, csv_files)
+    meta = read_store_meta(store_folder)
+    if meta is None or meta.get('source') != source_key:
+        print("Building the event store for this folder...")
+        df = load_events(folder_path, csv_files)
+        build_event_store(df, store_folder, source_key)
+    return EventStore(store_folder)
+
+
+class FolderScan:
+    """
+    Stand-in for an EventStore that has not been built yet, with the same first_date, last_date
+    and to_frame. Opening it only reads the first and last rows of each file (or its stats
+    sidecar), and to_frame loads just the files overlapping the requested range.
+    """
+
+    def __init__(self, folder_path, csv_files):
+        self.folder_path = folder_path
+        self.csv_files = csv_files
+        self.ranges = scan_folder_range(folder_path, csv_files)
+        firsts = [first for first, _ in self.ranges.values() if not pd.isna(first)]
+        lasts = [last for _, last in self.ranges.values() if not pd.isna(last)]
+        self.first_date = min(firsts).date() if firsts else None
+        self.last_date = max(lasts).date() if lasts else None
+
+    def files_in_range(self, start_date, end_date):
+        # Files without any readable timestamp are always loaded, they cannot be ruled out
+        files = []
+        for file in self.csv_files:
+            first, last = self.ranges[file]
+            if pd.isna(first) or pd.isna(last):
+                files.append(file)
+            elif (start_date is None or last.date() >= start_date) and (end_date is None or first.date() <= end_date):
+                files.append(file)
+        return files
+
+    def to_frame(self, start_date=None, end_date=None):
+        """Load the events between `start_date` and `end_date` straight from the overlapping CSV files."""
+        csv_files = self.files_in_range(start_date, end_date)
+        print(f"Loading {len(csv_files)} of {len(self.csv_files)} file(s) for the selected range...")
+        df = load_events(self.folder_path, csv_files) if csv_files else empty_events()
+
+        if len(csv_files) == len(self.csv_files):
+            # Everything was loaded anyway, so build the store for the next run
+            store_folder = get_store_folder(self.folder_path)
+            build_event_store(df, store_folder, get_source_key(self.folder_path, self.csv_files))
+            return EventStore(store_folder).to_frame(start_date, end_date)
+
+        df = df.loc[:, EVENT_COLUMNS].copy()
+        df['Timestamp'] = pd.to_datetime(df['Timestamp'], errors='coerce').astype('datetime64[ns]')
+        return date_slice(sort_by_time(df), start_date, end_date)
+
+
+def open_events(folder_path, csv_files):
+    """
+    Return the folder's EventStore when it is up to date. Otherwise return a FolderScan, so the
+    available date range can be shown without parsing the files first.
+    """
+    store_folder = get_store_folder(folder_path)
+    meta = read_store_meta(store_folder)
+    if meta is not None and meta.get('source') == get_source_key(folder_path, csv_files):
+        return EventStore(store_folder)
+    print("Event store not built yet, reading the date range from the start and end of each file...")
+    return FolderScan(folder_path, csv_files)
+
+
+def load_count_cube(store, start_date=None, end_date=None):
+    """
+    Count cube of `store`. For an EventStore it is built once, one partition at a time, and
+    kept in the store folder. A FolderScan has no store yet, so the cube of the selected
+    range is built in memory from the loaded events.
+    """
+    if isinstance(store, FolderScan):
+        df = store.to_frame(start_date, end_date)
+        times = df['Timestamp'].to_numpy(dtype='datetime64[ns]').view('int64')
+        valid_times = times[times != NAT_TIME]
+        if start_date is None:
+            start_date = pd.Timestamp(valid_times.min()).date() if len(valid_times) else store.first_date
+        if end_date is None:
+            end_date = pd.Timestamp(valid_times.max()).date() if len(valid_times) else start_date
+        return build_count_cube(
+            [(times, df['Hub Name'].cat.codes.to_numpy(), df['Behaviour Name'].cat.codes.to_numpy())],
+            list(df['Hub Name'].cat.categories), list(df['Behaviour Name'].cat.categories),
+            start_date, (end_date - start_date).days + 1)
+
+    cube_folder = os.path.join(store.store_folder, 'cube')
+    cube = read_count_cube(cube_folder, store.source)
+    if cube is None:
+        print("Building the count cube for this folder...")
+        first_day = store.first_date or datetime.date(1970, 1, 1)
+        days = (store.last_date - first_day).days + 1 if store.last_date else 0
+        parts = ((events['time'], events['hub'], events['behaviour'])
+                 for events in (store.read_partition(p) for p in store.dated_partitions))
+        save_count_cube(build_count_cube(parts, store.hubs, store.behaviours, first_day, days), cube_folder, store.source)
+        cube = read_count_cube(cube_folder, store.source)
+    return cube
@@ -0,0 +1,195 @@
+import os
+import sys
+import csv
+import json
+import argparse
+import contextlib
+from datetime import datetime, timedelta
+from aggregates import ranked, row_totals, week_bounds
+from eventstore import load_event_store, load_count_cube
+
+# Non-interactive counterpart of the factsfinder scripts: runs many (folder, start, end) jobs
+# in one process, loading each folder's count cube once, and writes the reports as JSON or CSV.
+#
+#   python factsbatch.py --job pilot 20241111 20241117 --job pilot 20241118 20241124
+#   python factsbatch.py --config nightly.json --format csv --output data_output/nightly.csv
+#
+# A config file lists the jobs, each with one window or a list of windows:
+#   {"jobs": [{"folder": "pilot", "start": "20241111", "end": "20241201"},
+#             {"folder": "pilot", "windows": [["20241111", "20241117"], ["20241118", "20241124"]]}]}
+
+ROOT_FOLDER = "data_input"
+OUTPUT_FOLDER = "data_output"
+CSV_COLUMNS = ['Folder', 'Start Date', 'End Date', 'Hub Name', 'Behaviour Name', 'Count', 'Percentage of Hub']
+
+
+def parse_date(value):
+    """Dates are given as YYYYMMDD, like in the factsfinder prompts, or as YYYY-MM-DD."""
+    for date_format in ('%Y%m%d', '%Y-%m-%d'):
+        try:
+            return datetime.strptime(str(value), date_format).date()
+        except ValueError:
+            pass
+    raise ValueError(f"Invalid date '{value}', expected YYYYMMDD.")
+
+
+def read_config_jobs(config_path):
+    with open(config_path, 'r', encoding='utf-8') as fh:
+        config = json.load(fh)
+    jobs = []
+    for job in config.get('jobs', []):
+        windows = job.get('windows') or [[job.get('start'), job.get('end')]]
+        for start, end in windows:
+            jobs.append((job['folder'], start, end))
+    return jobs
+
+
+def group_jobs(jobs):
+    """Windows per folder, folders in the order they are first listed, so each folder is loaded once."""
+    windows = {}
+    for folder, start, end in jobs:
+        start_date = parse_date(start) if start else None
+        end_date = parse_date(end) if end else None
+        if start_date and end_date and end_date < start_date:
+            raise ValueError(f"End date {end_date} is earlier than start date {start_date} for folder '{folder}'.")
+        windows.setdefault(folder, []).append((start_date, end_date))
+    return windows
+
+
+def get_folder_path(folder):
+    """Folders are named like in the folder list of the scripts, or given as a path."""
+    return folder if os.path.isdir(folder) else os.path.join(ROOT_FOLDER, folder)
+
+
+def window_report(cube, start_date, end_date):
+    """The factsfinder report of one date window as a dict, read from a single hub x behaviour matrix."""
+    counts, first_seen = cube.count_matrix(start_date, end_date)
+    hubs = []
+    for hub in counts.index:
+        hub_total = int(counts.loc[hub].sum())
+        behaviour_counts = ranked(counts.loc[hub], first_seen.loc[hub])
+        hubs.append({
+            'hub': hub,
+            'total': hub_total,
+            'most_frequent': behaviour_counts.index[0],
+            'behaviours': [{'behaviour': behaviour, 'count': int(count),
+                            'percentage': round(count / hub_total * 100, 2)}
+                           for behaviour, count in behaviour_counts.items()],
+        })
+    return {
+        'total_entries': int(counts.to_numpy().sum()),
+        'hub_totals': {hub: int(count) for hub, count in row_totals(counts, first_seen).items()},
+        'hubs': hubs,
+    }
+
+
+def weekly_report(cube, week_start):
+    """Entries per behaviour per hub for every week of the study, as in factsfinderv3.py."""
+    bounds = week_bounds(cube.first_day, cube.last_day, week_start)
+    weeks = []
+    for start, end, (counts, first_seen) in zip(bounds, bounds[1:], cube.period_matrices(bounds)):
+        weeks.append({
+            'start': start.isoformat(),
+            'end': (end - timedelta(days=1)).isoformat(),
+            'hubs': {hub: {behaviour: int(count) for behaviour, count in ranked(counts.loc[hub], first_seen.loc[hub]).items()}
+                     for hub in counts.index},
+        })
+    return weeks
+
+
+def run_jobs(windows, weekly=False, week_start=0):
+    results = []
+    for folder, folder_windows in windows.items():
+        folder_path = get_folder_path(folder)
+        csv_files = [f for f in os.listdir(folder_path) if f.endswith('.csv')] if os.path.isdir(folder_path) else []
+        if not csv_files:
+            print(f"No CSV files found in {folder_path}, skipping {len(folder_windows)} job(s).")
+            continue
+
+        # Load once, then answer every window of this folder from the same cube
+        store = load_event_store(folder_path, csv_files)
+        cube = load_count_cube(store)
+        print(f"{folder}: {len(store)} entries from {len(csv_files)} file(s), ranging from {store.first_date} to {store.last_date}.")
+
+        for start_date, end_date in folder_windows:
+            start_date = start_date or store.first_date
+            end_date = end_date or store.last_date
+            result = {'folder': folder, 'start_date': start_date.isoformat(), 'end_date': end_date.isoformat()}
+            result.update(window_report(cube, start_date, end_date))
+            results.append(result)
+            print(f"  {start_date} to {end_date}: {result['total_entries']} entries")
+        if weekly:
+            results.append({'folder': folder, 'weeks': weekly_report(cube, week_start)})
+    return results
+
+
+def write_json(results, fh):
+    json.dump(results, fh, indent=2)
+    fh.write('\n')
+
+
+def write_csv(results, fh):
+    """One row per (window, hub, behaviour); weekly breakdowns get one row per week instead of per window."""
+    writer = csv.writer(fh)
+    writer.writerow(CSV_COLUMNS)
+    for result in results:
+        if 'weeks' in result:
+            for week in result['weeks']:
+                for hub, behaviours in week['hubs'].items():
+                    total = sum(behaviours.values())
+                    for behaviour, count in behaviours.items():
+                        writer.writerow([result['folder'], week['start'], week['end'], hub, behaviour, count, f"{count / total * 100:.2f}"])
+            continue
+        for hub in result['hubs']:
+            for entry in hub['behaviours']:
+                writer.writerow([result['folder'], result['start_date'], result['end_date'], hub['hub'],
+                                 entry['behaviour'], entry['count'], f"{entry['percentage']:.2f}"])
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run the factsfinder reports for many folders and date windows without prompts.")
+    parser.add_argument('--job', nargs=3, action='append', default=[], metavar=('FOLDER', 'START', 'END'),
+                        help="folder in data_input/ (or a path) and a YYYYMMDD date window; repeat for more jobs")
+    parser.add_argument('--config', help="JSON file with a list of jobs")
+    parser.add_argument('--format', choices=['json', 'csv'], default='json')
+    parser.add_argument('--output', help="output file, '-' for standard output (default: a timestamped file in data_output/)")
+    parser.add_argument('--weekly', action='store_true', help="add the weekly breakdown of every folder")
+    parser.add_argument('--week-start', type=int, default=0, choices=range(7), help="first day of the week, 0 = Monday (ISO weeks)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    jobs = [tuple(job) for job in args.job]
+    if args.config:
+        jobs += read_config_jobs(args.config)
+    if not jobs:
+        print("No jobs given, use --job or --config.")
+        return 1
+    try:
+        windows = group_jobs(jobs)
+    except ValueError as e:
+        print(e)
+        return 1
+
+    output = args.output
+    if output is None:
+        os.makedirs(OUTPUT_FOLDER, exist_ok=True)
+        output = os.path.join(OUTPUT_FOLDER, f"facts_batch_on_{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}.{args.format}")
+    write = write_json if args.format == 'json' else write_csv
+
+    if output == '-':
+        # Progress goes to stderr so standard output holds only the results
+        with contextlib.redirect_stdout(sys.stderr):
+            results = run_jobs(windows, args.weekly, args.week_start)
+        write(results, sys.stdout)
+    else:
+        results = run_jobs(windows, args.weekly, args.week_start)
+        with open(output, 'w', newline='', encoding='utf-8') as fh:
+            write(results, fh)
+        print(f"{len(results)} report(s) written to {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,11 +1,13 @@
 import os
-import pandas as pd
 from datetime import datetime
+from dataloader import describe_folder, iter_event_chunks
+from aggregates import RunningCounts, ranked, row_totals, group_order
+from eventstore import load_event_store, load_count_cube
 
 def list_folders(root_folder):
     subfolders = [f for f in os.listdir(root_folder) if os.path.isdir(os.path.join(root_folder, f))]
     for idx, folder in enumerate(subfolders, 1):
-        print(f"[{idx}] {folder}")
+        print(f"[{idx}] {folder} {describe_folder(os.path.join(root_folder, folder))}")
     return subfolders
 
 def get_folder_selection(subfolders):
@@ -53,14 +55,16 @@ def confirm_file_list():
 #     return merged_df, first_date, last_date
 
 def merge_csv_files(folder_path, csv_files):
-    merged_df = pd.concat([pd.read_csv(os.path.join(folder_path, file)) for file in csv_files], ignore_index=True)
-    merged_df = merged_df.loc[:, ~merged_df.columns.duplicated()]  # Remove duplicate columns if any
+    # The reports are read from the folder's count cube, built once from its event store,
+    # so the events themselves are not loaded
+    store = load_event_store(folder_path, csv_files)
+    cube = load_count_cube(store)
 
-    first_date = pd.to_datetime(merged_df.iloc[:, 0], errors='coerce').min().date()
-    last_date = pd.to_datetime(merged_df.iloc[:, 0], errors='coerce').max().date()
-    print(f"{len(merged_df)} entries from {len(csv_files)} file(s), ranging from {first_date} to {last_date}, have been loaded for analysis.")
+    first_date = store.first_date
+    last_date = store.last_date
+    print(f"{len(store)} entries from {len(csv_files)} file(s), ranging from {first_date} to {last_date}, have been loaded for analysis.")
 
-    return merged_df, first_date, last_date
+    return cube, first_date, last_date
 
 
 # def get_date_range(first_date, last_date):
@@ -94,6 +98,31 @@ def merge_csv_files(folder_path, csv_files):
 
 #     return start_date, end_date
 
+def stream_csv_files(folder_path, csv_files):
+    # Running counters updated chunk by chunk, so the rows are never all held in memory
+    counts = RunningCounts()
+    for chunk in iter_event_chunks(folder_path, csv_files):
+        counts.update(chunk)
+
+    first_date = counts.first_day
+    last_date = counts.last_day
+    print(f"{counts.rows} entries from {len(csv_files)} file(s), ranging from {first_date} to {last_date}, have been read for analysis.")
+
+    return counts, first_date, last_date
+
+
+def choose_analysis_mode():
+    print("Select analysis mode:")
+    print("[1] Standard analysis (reads the folder's event store, built on the first run)")
+    print("[2] Streaming analysis (low memory, reads the CSV files chunk by chunk)")
+    while True:
+        choice = input("Enter the number of your choice: ").strip()
+        if choice in ['1', '2']:
+            return choice
+        else:
+            print("Invalid input, please enter 1 or 2.")
+
+
 def get_date_range(first_date, last_date):
     while True:
         start_date_str = input("Enter start date in YYYYMMDD format: ").strip()
@@ -130,37 +159,30 @@ def get_date_range(first_date, last_date):
 #     merged_df['Date'] = pd.to_datetime(merged_df.iloc[:, 0], errors='coerce')
 #     filtered_df = merged_df[(merged_df['Date'] >= start_date) & (merged_df['Date'] <= end_date)]
 
-def analyze_data(merged_df, start_date, end_date):
-    merged_df['Date'] = pd.to_datetime(merged_df.iloc[:, 0], errors='coerce').dt.date
-    filtered_df = merged_df[(merged_df['Date'] >= start_date) & (merged_df['Date'] <= end_date)]
-
-
-    # Check if 'Hub Name' and 'Behaviour Name' columns exist
-    if 'Hub Name' not in filtered_df.columns or 'Behaviour Name' not in filtered_df.columns:
-        print("Error: Required columns 'Hub Name' or 'Behaviour Name' not found in the data.")
-        return
+def analyze_data(cube, start_date, end_date):
+    # One hub x behaviour count matrix, every section below is read from it
+    counts, first_seen = cube.count_matrix(start_date, end_date)
 
     # Total entries per hub
-    hub_counts = filtered_df['Hub Name'].value_counts()
+    hub_counts = row_totals(counts, first_seen)
     print("\nTotal entries per hub in the given time range:")
     for hub, count in hub_counts.items():
         print(f"{hub}: {count} entries")
 
     # Entries per behavior per hub
-    behaviors = filtered_df['Behaviour Name'].unique()
     print("\nEntries per behavior per hub in the given time range:")
-    for behavior in behaviors:
-        behavior_df = filtered_df[filtered_df['Behaviour Name'] == behavior]
-        behavior_counts = behavior_df['Hub Name'].value_counts()
+    for behavior in counts.columns:
+        behavior_counts = ranked(counts[behavior], first_seen[behavior])
         print(f"\nBehavior: {behavior}")
         for hub, count in behavior_counts.items():
             print(f"{hub}: {count} entries")
 
     # Most frequent behavior per hub
     print("\nMost frequent behavior per hub in the given time range:")
-    most_frequent_behaviors = filtered_df.groupby('Hub Name')['Behaviour Name'].apply(lambda x: x.value_counts().head(1))
-    for (hub, behavior), count in most_frequent_behaviors.items():
-        print(f"{hub}: {behavior} ({count} times)")
+    for hub in group_order(counts.index):
+        most_frequent = ranked(counts.loc[hub], first_seen.loc[hub]).head(1)
+        for behavior, count in most_frequent.items():
+            print(f"{hub}: {behavior} ({count} times)")
 
 
 def main():
@@ -185,9 +207,13 @@ def main():
             # Now print the CSV files
             list_csv_files(folder_path)  # Default is print_files=True
             if confirm_file_list():
-                merged_df, first_date, last_date = merge_csv_files(folder_path, csv_files)
+                mode = choose_analysis_mode()
+                if mode == '2':
+                    cube, first_date, last_date = stream_csv_files(folder_path, csv_files)
+                else:
+                    cube, first_date, last_date = merge_csv_files(folder_path, csv_files)
                 start_date, end_date = get_date_range(first_date, last_date)
-                analyze_data(merged_df, start_date, end_date)
+                analyze_data(cube, start_date, end_date)
                 break
             else:
                 continue
@@ -1,11 +1,16 @@
 import os
-import pandas as pd
-from datetime import datetime
+from datetime import datetime, timedelta
+from dataloader import describe_folder, iter_event_chunks
+from aggregates import RunningCounts, ranked, row_totals, group_order, week_bounds, SummedAreaTable
+from eventstore import load_event_store, load_count_cube
+
+# First day of the weeks in the weekly breakdown: 0 = Monday (ISO weeks) ... 6 = Sunday
+WEEK_START = 0
 
 def list_folders(root_folder):
     subfolders = [f for f in os.listdir(root_folder) if os.path.isdir(os.path.join(root_folder, f))]
     for idx, folder in enumerate(subfolders, 1):
-        print(f"[{idx}] {folder}")
+        print(f"[{idx}] {folder} {describe_folder(os.path.join(root_folder, folder))}")
     return subfolders
 
 def get_folder_selection(subfolders):
@@ -44,14 +49,41 @@ def confirm_file_list():
 
 
 def merge_csv_files(folder_path, csv_files):
-    merged_df = pd.concat([pd.read_csv(os.path.join(folder_path, file)) for file in csv_files], ignore_index=True)
-    merged_df = merged_df.loc[:, ~merged_df.columns.duplicated()]  # Remove duplicate columns if any
+    # The reports are read from the folder's count cube, built once from its event store,
+    # so the events themselves are not loaded
+    store = load_event_store(folder_path, csv_files)
+    cube = load_count_cube(store)
+
+    first_date = store.first_date
+    last_date = store.last_date
+    print(f"{len(store)} entries from {len(csv_files)} file(s), ranging from {first_date} to {last_date}, have been loaded for analysis.")
+
+    return cube, first_date, last_date
+
 
-    first_date = pd.to_datetime(merged_df.iloc[:, 0], errors='coerce').min().date()
-    last_date = pd.to_datetime(merged_df.iloc[:, 0], errors='coerce').max().date()
-    print(f"{len(merged_df)} entries from {len(csv_files)} file(s), ranging from {first_date} to {last_date}, have been loaded for analysis.")
+def stream_csv_files(folder_path, csv_files):
+    # Running counters updated chunk by chunk, so the rows are never all held in memory
+    counts = RunningCounts()
+    for chunk in iter_event_chunks(folder_path, csv_files):
+        counts.update(chunk)
 
-    return merged_df, first_date, last_date
+    first_date = counts.first_day
+    last_date = counts.last_day
+    print(f"{counts.rows} entries from {len(csv_files)} file(s), ranging from {first_date} to {last_date}, have been read for analysis.")
+
+    return counts, first_date, last_date
+
+
+def choose_analysis_mode():
+    print("Select analysis mode:")
+    print("[1] Standard analysis (reads the folder's event store, built on the first run)")
+    print("[2] Streaming analysis (low memory, reads the CSV files chunk by chunk)")
+    while True:
+        choice = input("Enter the number of your choice: ").strip()
+        if choice in ['1', '2']:
+            return choice
+        else:
+            print("Invalid input, please enter 1 or 2.")
 
 
 def get_date_range(first_date, last_date):
@@ -86,95 +118,67 @@ def get_date_range(first_date, last_date):
     return start_date, end_date
 
 
-def weekly_behaviour_counts(merged_df):
-    # Ensure 'Date' column is in datetime
-    merged_df['Date'] = pd.to_datetime(merged_df.iloc[:, 0], errors='coerce').dt.date
-
-    # Define the weekly date ranges
-    week_ranges = [
-        ("2024-11-11", "2024-11-17"),
-        ("2024-11-18", "2024-11-24"),
-        ("2024-11-25", "2024-12-01"),
-        ("2024-12-02", "2024-12-08")
-    ]
+def weekly_behaviour_counts(cube):
+    # Weeks covering the whole study, derived from the dates in the data
+    bounds = week_bounds(cube.first_day, cube.last_day, WEEK_START)
+    week_ranges = [(start, end - timedelta(days=1)) for start, end in zip(bounds, bounds[1:])]
 
-    # Convert them to date objects
-    week_ranges = [(pd.to_datetime(start).date(), pd.to_datetime(end).date()) for start, end in week_ranges]
+    # One hub x behaviour matrix per week, all read in a single pass over the count cube
+    week_matrices = cube.period_matrices(bounds)
 
-    # Check if necessary columns exist
-    if 'Hub Name' not in merged_df.columns or 'Behaviour Name' not in merged_df.columns:
-        print("Error: Required columns 'Hub Name' or 'Behaviour Name' not found in the data.")
-        return
-
-    # Get all unique hubs
-    all_hubs = merged_df['Hub Name'].unique()
+    # Get all hubs, in order of first appearance
+    all_hubs = cube.count_matrix()[0].index
 
     # Print results by Hub first
     for hub in all_hubs:
         print(f"\nHub: {hub}")
-        hub_df = merged_df[merged_df['Hub Name'] == hub]
-
-        # If no data for this hub, skip
-        if hub_df.empty:
-            print("  No data available for this hub.")
-            continue
 
         # For each week
-        for i, (start_date, end_date) in enumerate(week_ranges, 1):
-            filtered_df = hub_df[(hub_df['Date'] >= start_date) & (hub_df['Date'] <= end_date)]
-
+        for i, ((start_date, end_date), (counts, first_seen)) in enumerate(zip(week_ranges, week_matrices), 1):
             print(f"  Week {i} ({start_date} to {end_date}):")
-            if filtered_df.empty:
+            if hub not in counts.index:
                 print("    No data available for this week.")
                 continue
 
             # Count each behaviour
-            behaviour_counts = filtered_df['Behaviour Name'].value_counts()
+            behaviour_counts = ranked(counts.loc[hub], first_seen.loc[hub])
             for behaviour, count in behaviour_counts.items():
                 print(f"    {behaviour}: {count} entries")
 
 
 
-def analyze_data(merged_df, start_date, end_date):
-    merged_df['Date'] = pd.to_datetime(merged_df.iloc[:, 0], errors='coerce').dt.date
-    filtered_df = merged_df[(merged_df['Date'] >= start_date) & (merged_df['Date'] <= end_date)]
-
-    # Check if 'Hub Name' and 'Behaviour Name' columns exist
-    if 'Hub Name' not in filtered_df.columns or 'Behaviour Name' not in filtered_df.columns:
-        print("Error: Required columns 'Hub Name' or 'Behaviour Name' not found in the data.")
-        return
+def analyze_data(cube, start_date, end_date):
+    # One hub x behaviour count matrix, every section below is read from it
+    counts, first_seen = cube.count_matrix(start_date, end_date)
 
     # Total entries per hub
-    hub_counts = filtered_df['Hub Name'].value_counts()
+    hub_counts = row_totals(counts, first_seen)
     print("\nTotal entries per hub in the given time range:")
     for hub, count in hub_counts.items():
         print(f"{hub}: {count} entries")
 
     # Entries per behavior per hub (original)
-    behaviors = filtered_df['Behaviour Name'].unique()
     print("\nEntries per behavior per hub in the given time range:")
-    for behavior in behaviors:
-        behavior_df = filtered_df[filtered_df['Behaviour Name'] == behavior]
-        behavior_counts = behavior_df['Hub Name'].value_counts()
+    for behavior in counts.columns:
+        behavior_counts = ranked(counts[behavior], first_seen[behavior])
         print(f"\nBehavior: {behavior}")
         for hub, count in behavior_counts.items():
             print(f"{hub}: {count} entries")
 
     # Most frequent behavior per hub (original)
     print("\nMost frequent behavior per hub in the given time range:")
-    most_frequent_behaviors = filtered_df.groupby('Hub Name')['Behaviour Name'].apply(lambda x: x.value_counts().head(1))
-    for (hub, behavior), count in most_frequent_behaviors.items():
-        print(f"{hub}: {behavior} ({count} times)")
+    for hub in group_order(counts.index):
+        most_frequent = ranked(counts.loc[hub], first_seen.loc[hub]).head(1)
+        for behavior, count in most_frequent.items():
+            print(f"{hub}: {behavior} ({count} times)")
 
     # Additional insights:
     # For each Hub, show total entries, and for each behaviour within that Hub
     # show count and percentage of the Hub's total, sorted from most to least.
     print("\nAdditional Insights:")
-    hubs = filtered_df['Hub Name'].unique()
-    for hub in hubs:
-        hub_df = filtered_df[filtered_df['Hub Name'] == hub]
-        hub_total = len(hub_df)
-        behaviour_counts = hub_df['Behaviour Name'].value_counts()
+    for hub in counts.index:
+        hub_total = counts.loc[hub].sum()
+        behaviour_counts = ranked(counts.loc[hub], first_seen.loc[hub])
 
         print(f"\nHub: {hub}")
         print(f"  Total entries: {hub_total}")
@@ -183,6 +187,33 @@ def analyze_data(merged_df, start_date, end_date):
             percentage = (bcount / hub_total) * 100
             print(f"    {behaviour}: {bcount} entries ({percentage:.2f}% of {hub})")
 
+def query_time_windows(cube, start_date, end_date):
+    # Prefix sums of the count cube, so each window below is counted with a few lookups
+    table = SummedAreaTable(cube.rollup(30))
+    hubs = cube.count_matrix(start_date, end_date)[0].index
+
+    while True:
+        try:
+            window = input("Enter a time-of-day window to count presses per hub as HH:MM-HH:MM (e.g. 17:00-20:00), or press Enter to finish: ").strip()
+        except EOFError:
+            break
+        if not window:
+            break
+        try:
+            start_time, end_time = window.split('-')
+            totals = [(hub,
+                       table.count(start_date, end_date, start_time, end_time, hub=hub),
+                       table.count(start_date, end_date, start_time, end_time, hub=hub, weekdays=range(5)))
+                      for hub in hubs]
+        except ValueError:
+            print("Invalid window, please enter two times on the hour or half hour, e.g. 17:00-20:00.")
+            continue
+
+        print(f"\nEntries between {start_time} and {end_time} from {start_date} to {end_date}:")
+        for hub, total, weekdays in totals:
+            print(f"{hub}: {total} entries ({weekdays} on weekdays, {total - weekdays} at weekends)")
+
+
 def main():
     root_folder = "data_input"
     os.makedirs(root_folder, exist_ok=True)
@@ -205,10 +236,17 @@ def main():
             # Now print the CSV files
             list_csv_files(folder_path)  # Default is print_files=True
             if confirm_file_list():
-                merged_df, first_date, last_date = merge_csv_files(folder_path, csv_files)
+                mode = choose_analysis_mode()
+                if mode == '2':
+                    cube, first_date, last_date = stream_csv_files(folder_path, csv_files)
+                else:
+                    cube, first_date, last_date = merge_csv_files(folder_path, csv_files)
                 start_date, end_date = get_date_range(first_date, last_date)
-                analyze_data(merged_df, start_date, end_date)
-                weekly_behaviour_counts(merged_df)
+                analyze_data(cube, start_date, end_date)
+                weekly_behaviour_counts(cube)
+                if mode == '1':
+                    # Time-of-day windows need the count cube, the streaming counters are per day
+                    query_time_windows(cube, start_date, end_date)
                 break
             else:
                 continue
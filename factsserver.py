@@ -0,0 +1,241 @@
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+import traceback
+from collections import OrderedDict
+from functools import lru_cache
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from dataloader import describe_folder
+from aggregates import SummedAreaTable
+from eventstore import load_event_store, load_count_cube, get_source_key
+from factsbatch import ROOT_FOLDER, parse_date, window_report, weekly_report
+
+# Local JSON service for the factsfinder metrics. Each folder's count cube is loaded once and
+# kept in memory, and results are kept in an LRU cache, so repeated lookups need no reparsing.
+#
+#   python factsserver.py --port 8765
+#   curl "http://127.0.0.1:8765/hubs?folder=pilot&start=20241115&end=20241201"
+#
+# Endpoints (start/end as YYYYMMDD, both optional):
+#   /folders                                     input folders with their date coverage
+#   /report?folder=&start=&end=                  the full factsfinder report of a window
+#   /hubs?folder=&start=&end=                    total entries per hub
+#   /behaviours?folder=&start=&end=              behaviour mix (count and percentage) per hub
+#   /most-frequent?folder=&start=&end=           most frequent behaviour per hub
+#   /weekly?folder=&week_start=                  entries per behaviour per hub for every week
+#   /count?folder=&start=&end=&start_time=&end_time=&hub=&behaviour=&weekdays=
+#                                                entries in a date x time-of-day window
+
+HOST = "127.0.0.1"
+PORT = 8765
+# Number of distinct query results kept in memory
+RESULT_CACHE_SIZE = 256
+# Endpoints answered from a folder's count cube
+QUERY_ENDPOINTS = ('report', 'hubs', 'behaviours', 'most-frequent', 'weekly', 'count')
+# Number of folders kept in memory; the least recently queried one is dropped beyond it
+MAX_DATASETS = 8
+# Seconds a loaded folder is served before its files are listed again to check for changes
+SOURCE_CHECK_SECONDS = 10
+
+# Folder -> (source key, cube, table, time of the last check), least recently queried first
+_datasets = OrderedDict()
+# Guards _datasets and _folder_locks; never held while a folder loads, so other folders are served
+_datasets_lock = threading.Lock()
+# One lock per folder, held while it loads so concurrent requests load it once
+_folder_locks = {}
+
+
+class QueryError(ValueError):
+    """A request the service cannot answer, returned to the client as a 4xx response."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def get_folder_path(folder):
+    """Path of `folder`, which must name a direct subfolder of ROOT_FOLDER, as the folder list shows them."""
+    root = os.path.realpath(ROOT_FOLDER)
+    folder_path = os.path.realpath(os.path.join(root, folder))
+    if os.path.commonpath([root, folder_path]) != root or os.path.dirname(folder_path) != root \
+            or not os.path.isdir(folder_path):
+        raise QueryError(f"Folder '{folder}' not found.", 404)
+    return folder_path
+
+
+def store_dataset(folder, dataset):
+    with _datasets_lock:
+        _datasets[folder] = dataset
+        _datasets.move_to_end(folder)
+        while len(_datasets) > MAX_DATASETS:
+            _datasets.popitem(last=False)
+
+
+def get_dataset(folder):
+    """
+    Count cube and summed-area table of `folder`, loaded on first use and kept until the files
+    in the folder change, which is checked at most every SOURCE_CHECK_SECONDS. Returns (source
+    key, cube, table).
+    """
+    folder_path = get_folder_path(folder)
+    with _datasets_lock:
+        dataset = _datasets.get(folder)
+        if dataset is not None:
+            _datasets.move_to_end(folder)
+            if time.monotonic() - dataset[3] < SOURCE_CHECK_SECONDS:
+                return dataset[:3]
+        lock = _folder_locks.setdefault(folder, threading.Lock())
+
+    with lock:
+        csv_files = [f for f in os.listdir(folder_path) if f.endswith('.csv')]
+        if not csv_files:
+            raise QueryError(f"No CSV files found in '{folder}'.", 404)
+        source_key = get_source_key(folder_path, csv_files)
+        with _datasets_lock:
+            dataset = _datasets.get(folder)  # Possibly loaded by another request meanwhile
+        if dataset is None or dataset[0] != source_key:
+            store = load_event_store(folder_path, csv_files)
+            cube = load_count_cube(store)
+            dataset = (source_key, cube, SummedAreaTable(cube.rollup(30)))
+            print(f"{folder}: {len(store)} entries from {len(csv_files)} file(s), ranging from {store.first_date} to {store.last_date}.")
+        dataset = dataset[:3] + (time.monotonic(),)
+        store_dataset(folder, dataset)
+    return dataset[:3]
+
+
+def get_param(params, name, default=None):
+    values = params.get(name)
+    return values[0] if values else default
+
+
+def get_window(params):
+    try:
+        start_date = parse_date(get_param(params, 'start')) if get_param(params, 'start') else None
+        end_date = parse_date(get_param(params, 'end')) if get_param(params, 'end') else None
+    except ValueError as e:
+        raise QueryError(str(e))
+    if start_date and end_date and end_date < start_date:
+        raise QueryError(f"End date {end_date} is earlier than start date {start_date}.")
+    return start_date, end_date
+
+
+@lru_cache(maxsize=RESULT_CACHE_SIZE)
+def cached_query(endpoint, folder, source_key, query):
+    """
+    JSON body of one query. The source key is part of the cache key, so results of a folder
+    whose files have changed are never served again.
+    """
+    if endpoint not in QUERY_ENDPOINTS:
+        raise QueryError(f"Unknown endpoint '/{endpoint}'.", 404)
+    params = parse_qs(query)
+    _, cube, table = get_dataset(folder)
+    start_date, end_date = get_window(params)
+    start_date = start_date or cube.first_day
+    end_date = end_date or cube.last_day
+    window = {'folder': folder, 'start_date': start_date.isoformat(), 'end_date': end_date.isoformat()}
+
+    if endpoint == 'weekly':
+        week_start = get_param(params, 'week_start', '0')
+        if week_start not in [str(day) for day in range(7)]:
+            raise QueryError("week_start must be a number from 0 (Monday) to 6 (Sunday).")
+        result = {'folder': folder, 'weeks': weekly_report(cube, int(week_start))}
+    elif endpoint == 'count':
+        weekdays = get_param(params, 'weekdays')
+        if weekdays and not set(weekdays.split(',')) <= {str(day) for day in range(7)}:
+            raise QueryError("weekdays must be numbers from 0 (Monday) to 6 (Sunday), separated by commas.")
+        try:
+            count = table.count(start_date, end_date, get_param(params, 'start_time'), get_param(params, 'end_time'),
+                                hub=get_param(params, 'hub'), behaviour=get_param(params, 'behaviour'),
+                                weekdays=[int(day) for day in weekdays.split(',')] if weekdays else None)
+        except ValueError as e:
+            raise QueryError(str(e))
+        result = dict(window, count=count)
+    else:
+        report = window_report(cube, start_date, end_date)
+        if endpoint == 'report':
+            result = dict(window, **report)
+        elif endpoint == 'hubs':
+            result = dict(window, hub_totals=report['hub_totals'])
+        elif endpoint == 'behaviours':
+            result = dict(window, hubs={hub['hub']: hub['behaviours'] for hub in report['hubs']})
+        else:
+            result = dict(window, most_frequent={hub['hub']: hub['most_frequent'] for hub in report['hubs']})
+    return json.dumps(result).encode('utf-8')
+
+
+def list_folders_json():
+    os.makedirs(ROOT_FOLDER, exist_ok=True)
+    folders = [f for f in os.listdir(ROOT_FOLDER) if os.path.isdir(os.path.join(ROOT_FOLDER, f))]
+    return json.dumps({folder: describe_folder(os.path.join(ROOT_FOLDER, folder)) for folder in folders}).encode('utf-8')
+
+
+class FactsRequestHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        endpoint = url.path.strip('/')
+        try:
+            if endpoint == 'folders':
+                body = list_folders_json()
+            elif endpoint not in QUERY_ENDPOINTS:
+                raise QueryError(f"Unknown endpoint '/{endpoint}'.", 404)
+            else:
+                params = parse_qs(url.query)
+                folder = get_param(params, 'folder')
+                if not folder:
+                    raise QueryError("Missing 'folder' parameter.")
+                source_key = get_dataset(folder)[0]
+                # Sorted parameters, so the same query in another order hits the same cache entry
+                query = '&'.join(sorted(url.query.split('&')))
+                body = cached_query(endpoint, folder, source_key, query)
+        except QueryError as e:
+            self.send_json(e.status, json.dumps({'error': str(e)}).encode('utf-8'))
+        except Exception as e:
+            # Anything else (e.g. a damaged cache file) is logged here and still answered
+            traceback.print_exc()
+            self.send_json(500, json.dumps({'error': f"Internal error: {e}"}).encode('utf-8'))
+        else:
+            self.send_json(200, body)
+
+    def send_json(self, status, body):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the factsfinder metrics as JSON from in-memory count cubes.")
+    parser.add_argument('--host', default=HOST)
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--folder', action='append', default=[], help="folder to load at startup; repeat for more")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    for folder in args.folder:
+        try:
+            get_dataset(folder)
+        except QueryError as e:
+            print(e)
+            return 1
+
+    server = ThreadingHTTPServer((args.host, args.port), FactsRequestHandler)
+    print(f"Serving the factsfinder metrics on http://{args.host}:{server.server_port}/ (Ctrl+C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
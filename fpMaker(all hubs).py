@@ -13,6 +13,31 @@ from matplotlib.colors import rgb_to_hsv, hsv_to_rgb
 from matplotlib.colors import LinearSegmentedColormap, Normalize
 from matplotlib.colors import ListedColormap, BoundaryNorm
 from matplotlib.colors import to_rgb
+from dataloader import describe_folder
+from eventstore import open_events, load_count_cube
+from chartrender import draw_heatmap_cells, add_cells
+from cellraster import write_square_chart, write_rounded_chart
+from chartpool import render_charts
+from rendercache import cached_render
+
+# Minutes per heatmap column, any level of the count cube's rollups (see ROLLUP_MINUTES in aggregates.py)
+HEATMAP_SLOT_MINUTES = 30
+# 'matplotlib' draws the consolidated, styled and transparent charts as figures; 'raster' writes
+# them directly with NumPy (see cellraster.py), several times faster, with edge pixels a few
+# 255ths off the matplotlib ones
+CELL_CHART_BACKEND = 'matplotlib'
+# Worker processes rendering the per-behaviour and weekly charts; None for one per CPU core, 1 to
+# render them one by one here
+CHART_WORKERS = None
+
+# Behaviours of the behaviour mix chart, in the order of their slices, and their colours
+BEHAVIOUR_MIX_COLOURS = {
+    "Cooking fresh": "#FF085A",
+    "Eating Out": "#FFB1CE",
+    "Re-Heating Food": "#D29FF5",
+    "Snacking": "#9700FF",
+    "Take Away": "#FBE8E0",
+}
 
 
 # --- Helper for perceptual Lab gradient with fallback ---
@@ -39,7 +64,7 @@ pd.options.mode.chained_assignment = None  # Suppress SettingWithCopyWarning
 def list_folders(root_folder):
     subfolders = [f for f in os.listdir(root_folder) if os.path.isdir(os.path.join(root_folder, f))]
     for idx, folder in enumerate(subfolders, 1):
-        print(f"[{idx}] {folder}")
+        print(f"[{idx}] {folder} {describe_folder(os.path.join(root_folder, folder))}")
     return subfolders
 
 def get_folder_selection(subfolders):
@@ -77,16 +102,12 @@ def confirm_file_list():
             print("Invalid input, please enter Y or N.")
 
 def merge_csv_files(folder_path, csv_files):
-    merged_df = pd.concat([pd.read_csv(os.path.join(folder_path, file)) for file in csv_files], ignore_index=True)
-    merged_df = merged_df.loc[:, ~merged_df.columns.duplicated()]  # Remove duplicate columns if any
-    
-    # Assuming the 'Timestamp' column is present and contains both date and time
-    merged_df['Timestamp'] = pd.to_datetime(merged_df['Timestamp'])
-    merged_df['Date'] = merged_df['Timestamp'].dt.date
-    merged_df['Time'] = merged_df['Timestamp'].dt.time
-    first_date = merged_df['Date'].min()
-    last_date = merged_df['Date'].max()
-    return merged_df, first_date, last_date
+    # Only the store's metadata (or the start and end of each file) is read here,
+    # the counts are read once the date range is known
+    store = open_events(folder_path, csv_files)
+    first_date = store.first_date
+    last_date = store.last_date
+    return store, first_date, last_date
 
 def get_date_range(first_date, last_date):
     print(f"Available data range: {first_date} to {last_date}")
@@ -124,35 +145,67 @@ def create_data_vis_folder():
     os.makedirs(export_path, exist_ok=True)
     return export_path
 
-def generate_heatmap(df, hub_name, behavior_name, export_path, start_date, end_date):
-    # Prepare data for the heatmap
-    df = df.copy()
-    df['Timestamp'] = pd.to_datetime(df['Timestamp'])
-    
-    # Extract date and weekday
-    df['Date'] = df['Timestamp'].dt.date
-    df['Weekday'] = df['Timestamp'].dt.strftime('%a')
-    df['Date_with_Weekday'] = df['Date'].astype(str) + ' (' + df['Weekday'] + ')'
-    
-    # Create half-hour intervals by flooring the time to the nearest 30 minutes
-    df['Half Hour'] = df['Timestamp'].dt.floor('30min').dt.strftime('%H:%M')
-    
+def heatmap_matrix(cube, hub_name, behavior_name, start_date, end_date):
+    """
+    Date x time slot count matrix for the heatmap, newest date first, read from the count
+    cube at HEATMAP_SLOT_MINUTES per slot. None for `hub_name` or `behavior_name` adds up
+    all hubs or behaviours.
+    """
     # Create a date range and time slots to ensure the chart includes all dates and times , added [::-1] to invert
     date_range = pd.date_range(start=start_date, end=end_date)
     date_labels = date_range.strftime('%Y-%m-%d (%a)').tolist()[::-1]
+    time_slots = [f'{minute // 60:02d}:{minute % 60:02d}' for minute in range(0, 24 * 60, HEATMAP_SLOT_MINUTES)]
+
+    counts = cube.rollup(HEATMAP_SLOT_MINUTES).day_slot_counts(start_date, end_date, hub_name, behavior_name)[::-1]
+    return pd.DataFrame(counts, index=date_labels, columns=time_slots)
+
+def activity_matrix(cube, start_date, end_date, hub=None, behaviour=None):
+    """Date x hour matrix with 1 for every hour with at least one press, read from the count cube."""
+    # Create a date range to ensure all dates are included
+    date_range = pd.date_range(start=start_date, end=end_date).date
+    counts = cube.rollup(60).day_slot_counts(start_date, end_date, hub, behaviour)
+    return pd.DataFrame((counts > 0).astype(int), index=date_range, columns=range(24))
+
+def weekday_weekend_matrix(counts, days):
+    """Add up day x hour counts into a 2x24 matrix: row 0 = weekdays (Mon-Fri), row 1 = weekend."""
+    weekend = days.weekday >= 5
+    mat = np.zeros((2, 24), dtype=int)
+    mat[0] = counts[~weekend].sum(axis=0)
+    mat[1] = counts[weekend].sum(axis=0)
+    return mat
+
+def weekly_hour_matrices(cube, behaviour, start_date, end_date):
+    """
+    Weekday/weekend x hour matrix of `behaviour` for every ISO week in the date range that
+    has presses, as (year, week, matrix), read from the count cube.
+    """
+    days = pd.date_range(start=start_date, end=end_date)
+    counts = cube.rollup(60).day_slot_counts(start_date, end_date, behaviour=behaviour)
+    iso = days.isocalendar()
+    weeks = list(zip(iso['year'].astype(int), iso['week'].astype(int)))
+    result = []
+    for yr, wk in dict.fromkeys(weeks):
+        in_week = np.array([week == (yr, wk) for week in weeks])
+        mat = weekday_weekend_matrix(counts[in_week], days[in_week])
+        if mat.sum() > 0:
+            result.append((yr, wk, mat))
+    return result
+
+def behaviours_in_range(cube, start_date, end_date):
+    # Behaviours with presses in the date range, in order of first appearance
+    return cube.count_matrix(start_date, end_date)[0].columns
+
+def heatmap_file(export_path, hub_name, behavior_name):
+    return os.path.join(export_path, f"{hub_name}-{behavior_name}.png")
+
+def chart_file(export_path, chart_name, start_date, end_date):
+    return os.path.join(export_path, f"{chart_name}_{start_date}_to_{end_date}.png")
+
+def generate_heatmap(pivot_df, hub_name, behavior_name, export_path, start_date, end_date):
+    # Weekdays of the rows, used to add extra spacing around weekends
+    date_range = pd.date_range(start=start_date, end=end_date)
     weekdays = date_range.strftime('%a').tolist()
-    time_slots = [f'{hour:02d}:{minute:02d}' for hour in range(24) for minute in [0, 30]]
-    
-    # Pivot the DataFrame to create a matrix for the heatmap
-    pivot_df = df.pivot_table(
-        index='Date_with_Weekday',
-        columns='Half Hour',
-        values='Button ID',
-        aggfunc='count',
-        fill_value=0
-    )
-    pivot_df = pivot_df.reindex(index=date_labels, columns=time_slots, fill_value=0)
-    
+
     data = pivot_df.values
     num_rows, num_columns = data.shape
 
@@ -234,73 +287,9 @@ def generate_heatmap(df, hub_name, behavior_name, export_path, start_date, end_d
     # Adjust font size to 55% of cell height
     font_size = cell_height_in_points * 0.45  # 55% of cell height in points
 
-    # Draw the heatmap cells with rounded corners and spacing
-    for (i, j), value in np.ndenumerate(data):
-        # Calculate positions with spacing and extra offsets
-        x = j + spacing / 2
-        y_cell = y_positions[i] + spacing / 2
-
-        time_label = pivot_df.columns[j]
-        facecolor = None
-        edgecolor = None
-        linewidth = 0
-
-        if value == 0:
-            facecolor = 'none'  # No background color
-            linewidth = linewidth_in_points
-
-            if time_label.endswith(':00'):
-                edgecolor = '#E6E7E6'  # Border color for '00' minutes
-            elif time_label.endswith(':30'):
-                edgecolor = '#C4C4C4'  # Border color for '30' minutes
-            else:
-                edgecolor = 'black'  # Default edge color if time format is unexpected
-        else:
-            # Determine the appropriate color based on the value
-            if value <= 5:
-                color_index = int(value) - 1  # Indices start from 0
-            else:
-                color_index = 5  # '5+' color
-            facecolor = cmap.colors[color_index]
-            edgecolor = None
-            linewidth = 0
-
-        # Draw the cell
-        rect = FancyBboxPatch(
-            (x, y_cell),
-            adjusted_cell_size,
-            adjusted_cell_size,
-            boxstyle=f"round,pad=0,rounding_size={adjusted_cell_size * 0.25}",
-            linewidth=linewidth,
-            edgecolor=edgecolor,
-            facecolor=facecolor
-        )
-        ax.add_patch(rect)
-
-        # Add the data value as text in the center of the cell with padding
-        if value != 0:
-            # Convert facecolor to RGB tuple
-            r, g, b = to_rgb(facecolor)  # Returns values between 0 and 1
-
-            # Calculate text color based on cell background color
-            luminance = 0.2126 * r + 0.7152 * g + 0.0722 * b  # Relative luminance
-            text_color = 'black' if luminance > 0.6 else 'white'
-
-            # Position of the text (center of the cell)
-            x_text = x + adjusted_cell_size / 2
-            y_text = y_cell + adjusted_cell_size / 2
-
-            # Add text
-            ax.text(
-                x_text,
-                y_text,
-                int(value),
-                ha='center',
-                va='center',
-                color=text_color,
-                fontsize=font_size,
-                clip_on=False
-            )
+    # Draw the heatmap cells with rounded corners and spacing, and their counts, as two batched artists
+    draw_heatmap_cells(ax, data, pivot_df.columns, y_positions, spacing, adjusted_cell_size,
+                       linewidth_in_points, cmap.colors, font_size)
 
     # Set the limits, labels, and ticks
     ax.set_xlim(0, num_columns)
@@ -315,7 +304,8 @@ def generate_heatmap(df, hub_name, behavior_name, export_path, start_date, end_d
     y_tick_positions = [y_positions[i] + adjusted_cell_size / 2 for i in range(num_rows)]
     ax.set_yticks(y_tick_positions)
     ax.set_yticklabels(pivot_df.index)
-    ax.set_xlabel("Time of Day (Half-Hour Intervals)")
+    interval = {30: "Half-Hour", 60: "Hourly"}.get(HEATMAP_SLOT_MINUTES, f"{HEATMAP_SLOT_MINUTES}-Minute")
+    ax.set_xlabel(f"Time of Day ({interval} Intervals)")
     ax.set_ylabel("Date (Weekday)")
     plt.title(f"{hub_name} - {behavior_name}")
 
@@ -334,26 +324,11 @@ def generate_heatmap(df, hub_name, behavior_name, export_path, start_date, end_d
     cbar.ax.set_yticklabels(['1', '2', '3', '4', '5', '5+'])
 
     # Save the heatmap as a PNG file
-    export_file_name = f"{hub_name}-{behavior_name}.png"
-    plt.savefig(os.path.join(export_path, export_file_name), format='png', bbox_inches='tight')
+    # fig.savefig, as plt.savefig redraws the whole figure once more after saving
+    fig.savefig(heatmap_file(export_path, hub_name, behavior_name), format='png', bbox_inches='tight')
     plt.close()
 
-def generate_consolidated_chart(df, export_path, start_date, end_date):
-    # Prepare data for the chart
-    df = df.copy()
-    df['Timestamp'] = pd.to_datetime(df['Timestamp'])
-    df['Date'] = df['Timestamp'].dt.date
-    df['Hour'] = df['Timestamp'].dt.hour
-
-    # Create a date range to ensure all dates are included
-    date_range = pd.date_range(start=start_date, end=end_date).date
-    data_matrix = pd.DataFrame(index=date_range, columns=range(24), data=0)
-
-    # Mark hours with logged behavior as 1
-    for date, hour in zip(df['Date'], df['Hour']):
-        if date in data_matrix.index:
-            data_matrix.loc[date, hour] = 1
-
+def generate_consolidated_chart(data_matrix, export_path, start_date, end_date):
     # Convert to numpy array for easier plotting
     data = data_matrix.values
     num_rows, num_columns = data.shape
@@ -363,25 +338,23 @@ def generate_consolidated_chart(df, export_path, start_date, end_date):
     fig_width = cell_size * num_columns
     fig_height = cell_size * num_rows
 
-    # Create figure and axis
-    fig, ax = plt.subplots(figsize=(fig_width, fig_height))
-
     # Define colors for cells
     has_data_color = '#9700FF'
     no_data_color = '#3C0066'
+    colors = np.where(data == 1, has_data_color, no_data_color)
+    export_file = chart_file(export_path, "Consolidated_Chart", start_date, end_date)
+
+    if CELL_CHART_BACKEND == 'raster':
+        write_square_chart(export_file, colors, cell_size)
+        return
 
-    # Draw the chart
-    for (i, j), value in np.ndenumerate(data):
-        color = has_data_color if value == 1 else no_data_color
-        rect = FancyBboxPatch(
-            (j, num_rows - i - 1),  # Reverse y-axis for proper date sorting
-            1,
-            1,
-            boxstyle="square,pad=0",
-            facecolor=color,
-            edgecolor='none'
-        )
-        ax.add_patch(rect)
+    # Create figure and axis
+    fig, ax = plt.subplots(figsize=(fig_width, fig_height))
+
+    # Draw the chart, all cells as one collection
+    rows, columns = np.indices(data.shape)
+    # Reverse y-axis for proper date sorting
+    add_cells(ax, columns.ravel(), num_rows - rows.ravel() - 1, 1, 1, "square,pad=0", colors.ravel())
 
     # Adjust axis limits and aspect ratio
     ax.set_xlim(0, num_columns)
@@ -393,26 +366,10 @@ def generate_consolidated_chart(df, export_path, start_date, end_date):
     ax.set_yticks([])
 
     # Save the chart
-    export_file_name = f"Consolidated_Chart_{start_date}_to_{end_date}.png"
-    plt.savefig(os.path.join(export_path, export_file_name), format='png', bbox_inches='tight')
+    plt.savefig(export_file, format='png', bbox_inches='tight')
     plt.close()
 
-def generate_styled_consolidated_chart(df, export_path, start_date, end_date):
-
-    # Prepare data for the chart
-    df = df.copy()
-    df['Timestamp'] = pd.to_datetime(df['Timestamp'])
-    df['Date'] = df['Timestamp'].dt.date
-    df['Hour'] = df['Timestamp'].dt.hour
-
-    # Create a date range to ensure all dates are included
-    date_range = pd.date_range(start=start_date, end=end_date).date
-    data_matrix = pd.DataFrame(index=date_range, columns=range(24), data=0)
-
-    # Mark hours with logged behavior as 1
-    for date, hour in zip(df['Date'], df['Hour']):
-        if date in data_matrix.index:
-            data_matrix.loc[date, hour] = 1
+def generate_styled_consolidated_chart(data_matrix, export_path, start_date, end_date):
 
     # Convert to numpy array for easier plotting
     data = data_matrix.values
@@ -430,25 +387,26 @@ def generate_styled_consolidated_chart(df, export_path, start_date, end_date):
     fig_width = (cell_size + spacing) * num_columns / 72
     fig_height = (cell_size + spacing) * num_rows / 72
 
+    colors = np.where(data == 1, has_data_color, no_data_color)
+    export_file = chart_file(export_path, "Styled_Consolidated_Chart", start_date, end_date)
+
+    if CELL_CHART_BACKEND == 'raster':
+        # Rows from the top, where the figure has the last date
+        write_rounded_chart(export_file, colors[::-1], cell_size, spacing, corner_radius,
+                            background=background_color)
+        return
+
     # Create figure and axis
     fig, ax = plt.subplots(figsize=(fig_width, fig_height))
     fig.patch.set_facecolor(background_color)
     ax.set_facecolor(background_color)
 
-    # Draw the chart
-    for (i, j), value in np.ndenumerate(data):
-        x = j * (cell_size + spacing) / 72
-        y = (num_rows - i - 1) * (cell_size + spacing) / 72
-        color = has_data_color if value == 1 else no_data_color
-        rect = FancyBboxPatch(
-            (x, y),  # Position
-            cell_size / 72,  # Width
-            cell_size / 72,  # Height
-            boxstyle=f"round,pad=0,rounding_size={corner_radius / 72}",  # Rounded corners
-            facecolor=color,
-            edgecolor='none'  # Remove border
-        )
-        ax.add_patch(rect)
+    # Draw the chart, all cells as one collection
+    rows, columns = np.indices(data.shape)
+    xs = columns.ravel() * (cell_size + spacing) / 72
+    ys = (num_rows - rows.ravel() - 1) * (cell_size + spacing) / 72
+    add_cells(ax, xs, ys, cell_size / 72, cell_size / 72,
+              f"round,pad=0,rounding_size={corner_radius / 72}", colors.ravel())  # Rounded corners
 
     # Adjust axis limits to make the outer ring the edge of the chart
     ax.set_xlim(0, num_columns * (cell_size + spacing) / 72)
@@ -458,48 +416,34 @@ def generate_styled_consolidated_chart(df, export_path, start_date, end_date):
     ax.invert_yaxis()  # Match the order with dates from top to bottom
 
     # Save the chart
-    export_file_name = f"Styled_Consolidated_Chart_{start_date}_to_{end_date}.png"
-    plt.savefig(os.path.join(export_path, export_file_name), format='png', dpi=300, bbox_inches='tight')
+    plt.savefig(export_file, format='png', dpi=300, bbox_inches='tight')
     plt.close()
 
 
-def analyze_and_generate_consolidated_chart(merged_df, start_date, end_date):
-    # Filter data based on the selected date range
-    filtered_df = merged_df[(merged_df['Date'] >= start_date) & (merged_df['Date'] <= end_date)]
+def analyze_and_generate_consolidated_chart(cube, start_date, end_date):
+    # Hours with data in the selected date range
+    data_matrix = activity_matrix(cube, start_date, end_date)
 
     # Create a folder for exporting the chart
     export_path = create_data_vis_folder()
 
     # Generate the consolidated chart
-    generate_consolidated_chart(filtered_df, export_path, start_date, end_date)
+    cached_render(generate_consolidated_chart, data_matrix, export_path, start_date, end_date,
+                  output=chart_file(export_path, "Consolidated_Chart", start_date, end_date))
 
 
-def analyze_and_generate_styled_consolidated_chart(merged_df, start_date, end_date):
-    # Filter data based on the selected date range
-    filtered_df = merged_df[(merged_df['Date'] >= start_date) & (merged_df['Date'] <= end_date)]
+def analyze_and_generate_styled_consolidated_chart(cube, start_date, end_date):
+    # Hours with data in the selected date range
+    data_matrix = activity_matrix(cube, start_date, end_date)
 
     # Create a folder for exporting the chart
     export_path = create_data_vis_folder()
 
     # Generate the styled consolidated chart
-    generate_styled_consolidated_chart(filtered_df, export_path, start_date, end_date)
+    cached_render(generate_styled_consolidated_chart, data_matrix, export_path, start_date, end_date,
+                  output=chart_file(export_path, "Styled_Consolidated_Chart", start_date, end_date))
     
-def generate_transparent_chart(df, export_path, start_date, end_date):
-    # Prepare data for the chart
-    df = df.copy()
-    df['Timestamp'] = pd.to_datetime(df['Timestamp'])
-    df['Date'] = df['Timestamp'].dt.date
-    df['Hour'] = df['Timestamp'].dt.hour
-
-    # Create a date range to ensure all dates are included
-    date_range = pd.date_range(start=start_date, end=end_date).date
-    data_matrix = pd.DataFrame(index=date_range, columns=range(24), data=0)
-
-    # Mark hours with logged behavior as 1
-    for date, hour in zip(df['Date'], df['Hour']):
-        if date in data_matrix.index:
-            data_matrix.loc[date, hour] = 1
-
+def generate_transparent_chart(data_matrix, export_path, start_date, end_date):
     # Convert to numpy array for easier plotting
     data = data_matrix.values
     num_rows, num_columns = data.shape
@@ -515,25 +459,26 @@ def generate_transparent_chart(df, export_path, start_date, end_date):
     fig_width = (cell_size * num_columns + spacing * (num_columns - 1)) / 72
     fig_height = (cell_size * num_rows + spacing * (num_rows - 1)) / 72
 
+    colors = np.where(data == 1, has_data_color, no_data_color)
+    export_file = chart_file(export_path, "Transparent_Styled_Consolidated_Chart", start_date, end_date)
+
+    if CELL_CHART_BACKEND == 'raster':
+        # Rows from the top, where the figure has the last date
+        write_rounded_chart(export_file, colors[::-1], cell_size, spacing, corner_radius,
+                            transparent=True)
+        return
+
     # Create figure and axis
     fig, ax = plt.subplots(figsize=(fig_width, fig_height))
     fig.patch.set_alpha(0)  # Transparent figure background
     ax.set_alpha(0)  # Transparent axis background
 
-    # Draw the chart
-    for (i, j), value in np.ndenumerate(data):
-        x = j * (cell_size + spacing) / 72
-        y = (num_rows - i - 1) * (cell_size + spacing) / 72
-        color = has_data_color if value == 1 else no_data_color
-        rect = FancyBboxPatch(
-            (x, y),  # Position
-            cell_size / 72,  # Width
-            cell_size / 72,  # Height
-            boxstyle=f"round,pad=0,rounding_size={corner_radius / 72}",  # Rounded corners
-            facecolor=color,
-            edgecolor='none'  # No border
-        )
-        ax.add_patch(rect)
+    # Draw the chart, all cells as one collection
+    rows, columns = np.indices(data.shape)
+    xs = columns.ravel() * (cell_size + spacing) / 72
+    ys = (num_rows - rows.ravel() - 1) * (cell_size + spacing) / 72
+    add_cells(ax, xs, ys, cell_size / 72, cell_size / 72,
+              f"round,pad=0,rounding_size={corner_radius / 72}", colors.ravel())  # Rounded corners
 
     # Remove axis spines (black border lines)
     for spine in ax.spines.values():
@@ -547,9 +492,8 @@ def generate_transparent_chart(df, export_path, start_date, end_date):
     ax.invert_yaxis()  # Match the order with dates from top to bottom
 
     # Save the chart with transparent background and no margins
-    export_file_name = f"Transparent_Styled_Consolidated_Chart_{start_date}_to_{end_date}.png"
     plt.savefig(
-        os.path.join(export_path, export_file_name),
+        export_file,
         format='png',
         dpi=300,
         bbox_inches='tight',  # No extra margin
@@ -562,74 +506,53 @@ def generate_transparent_chart(df, export_path, start_date, end_date):
 
 
 # --- New function: generate_heatmaps_by_behavior
-def generate_heatmaps_by_behavior(df, hub_name, export_path, start_date, end_date):
+def generate_heatmaps_by_behavior(cube, hub_name, export_path, start_date, end_date):
     """
     Generate a heatmap for each unique behavior type (Behaviour Name) in the data.
     """
     # Get unique behavior identifiers
-    behaviors = df['Behaviour Name'].unique()
-    for behavior in behaviors:
-        # Filter data for this behavior
-        filtered_df = df[df['Behaviour Name'] == behavior]
-        # Use the behavior ID as the name in the title/file
-        behavior_name = str(behavior)
-        generate_heatmap(
-            filtered_df,
-            hub_name,
-            behavior_name,
-            export_path,
-            start_date,
-            end_date
-        )
+    behaviors = behaviours_in_range(cube, start_date, end_date)
+    # Counts for each behavior, with the behavior ID as the name in the title/file
+    jobs = [(heatmap_matrix(cube, None, behavior, start_date, end_date), hub_name, str(behavior), export_path, start_date, end_date)
+            for behavior in behaviors]
+    render_charts(generate_heatmap, jobs, CHART_WORKERS,
+                  outputs=[heatmap_file(export_path, hub_name, behavior) for behavior in behaviors])
 
 # --- New function: generate_consolidated_by_behavior
 
-def generate_consolidated_by_behavior(df, hub_name, export_path, start_date, end_date):
+def generate_consolidated_by_behavior(cube, hub_name, export_path, start_date, end_date):
     """
     Generate a transparent styled consolidated chart for each unique behavior type (Behaviour Name) over the time period.
     """
-    behaviors = df['Behaviour Name'].unique()
+    behaviors = behaviours_in_range(cube, start_date, end_date)
     for behavior in behaviors:
-        # Filter data for this behavior
-        filtered_df = df[df['Behaviour Name'] == behavior]
+        # Hours with data for this behavior
+        data_matrix = activity_matrix(cube, start_date, end_date, behaviour=behavior)
         # Generate the transparent styled consolidated chart for this behavior
-        generate_transparent_chart(filtered_df, export_path, start_date, end_date)
+        old_file = chart_file(export_path, "Transparent_Styled_Consolidated_Chart", start_date, end_date)
+        cached_render(generate_transparent_chart, data_matrix, export_path, start_date, end_date, output=old_file)
         # Rename the generated file to include the behavior
-        old_file = f"Transparent_Styled_Consolidated_Chart_{start_date}_to_{end_date}.png"
-        new_file = f"{behavior}_Transparent_Styled_Consolidated_Chart_{start_date}_to_{end_date}.png"
-        os.rename(
-            os.path.join(export_path, old_file),
-            os.path.join(export_path, new_file)
-        )
+        new_file = chart_file(export_path, f"{behavior}_Transparent_Styled_Consolidated_Chart", start_date, end_date)
+        os.rename(old_file, new_file)
 
 # --- New function: generate_behavior_mix_chart
-def generate_behavior_mix_chart(df, export_path, start_date, end_date):
+def generate_behavior_mix_chart(cube, export_path, start_date, end_date):
     """
     Generate a transparent chart where each non‑empty hour cell is divided vertically into equal
     slices representing the behaviours present in that hour (Cooking fresh, Eating Out,
     Re‑Heating Food, Snacking, Take Away). Unknown behaviours are ignored.
     """
-    # Prepare data
-    df = df.copy()
-    df['Timestamp'] = pd.to_datetime(df['Timestamp'])
-    df['Date'] = df['Timestamp'].dt.date
-    df['Hour'] = df['Timestamp'].dt.hour
+    # Hours with data per behaviour, read from the count cube
+    presence = {beh: activity_matrix(cube, start_date, end_date, behaviour=beh) for beh in BEHAVIOUR_MIX_COLOURS}
+    cached_render(draw_behavior_mix_chart, presence, export_path, start_date, end_date,
+                  output=chart_file(export_path, "Behaviour_Mix_Chart", start_date, end_date))
+
 
+def draw_behavior_mix_chart(presence, export_path, start_date, end_date):
+    """Draw the behaviour mix chart from the hours with data of each behaviour (`presence`)."""
     # Behaviour order and colours
-    behaviour_order = [
-        "Cooking fresh",
-        "Eating Out",
-        "Re-Heating Food",
-        "Snacking",
-        "Take Away",
-    ]
-    colour_map = {
-        "Cooking fresh": "#FF085A",
-        "Eating Out": "#FFB1CE",
-        "Re-Heating Food": "#D29FF5",
-        "Snacking": "#9700FF",
-        "Take Away": "#FBE8E0",
-    }
+    behaviour_order = list(BEHAVIOUR_MIX_COLOURS)
+    colour_map = BEHAVIOUR_MIX_COLOURS
     no_data_color = "#3C0066"
 
     # Build grid axes
@@ -653,13 +576,7 @@ def generate_behavior_mix_chart(df, export_path, start_date, end_date):
             y0 = i * (cell_size + spacing) / 72
 
             # Determine which of the 5 behaviours appear in this cell
-            present = (
-                df[(df['Date'] == date) & (df['Hour'] == hr)]['Behaviour Name']
-                .dropna()
-                .unique()
-                .tolist()
-            )
-            present = [b for b in behaviour_order if b in present]
+            present = [b for b in behaviour_order if presence[b].loc[date, hr]]
             n = len(present)
 
             if n == 0:
@@ -715,297 +632,128 @@ def generate_behavior_mix_chart(df, export_path, start_date, end_date):
         spine.set_visible(False)
 
     # Save
-    export_file = f"Behaviour_Mix_Chart_{start_date}_to_{end_date}.png"
     plt.savefig(
-        os.path.join(export_path, export_file),
+        chart_file(export_path, "Behaviour_Mix_Chart", start_date, end_date),
         format='png', dpi=300,
         bbox_inches='tight', pad_inches=0, transparent=True
     )
     plt.close()
 
 
-# --- New function: generate_weekly_behavior_heatmaps
-def generate_weekly_behavior_heatmaps(df, export_path, start_date, end_date):
+def draw_weekly_heatmap(mat, start_hex, end_hex, export_file):
     """
-    For each Behaviour Name and for each calendar week in the date range,
-    generate a 2×24 heatmap (row 1 = weekdays, row 2 = weekend) of event counts per hour.
-    Uses 5‑level discrete gradient: 0→#3C0066, 1→#53008C, 2→#6A00B2,
-    3→#8100D9, >=4→#9700FF. Transparent background.
+    Draw one 2×24 heatmap (row 1 = weekdays, row 2 = weekend) of event counts per hour, for a
+    week or the whole date range, on a continuous gradient from start_hex (no events) to end_hex
+    (the busiest hour). Transparent background.
     """
-    import numpy as _np
-    # Prepare data
-    df2 = df.copy()
-    df2['Timestamp'] = pd.to_datetime(df2['Timestamp'])
-    df2['Date'] = df2['Timestamp'].dt.date
-    df2['Hour'] = df2['Timestamp'].dt.hour
-    df2['Year'] = df2['Timestamp'].dt.isocalendar().year
-    df2['Week'] = df2['Timestamp'].dt.isocalendar().week
-
-    # Continuous perceptual gradient between pale yellow and magenta
-    from matplotlib.colors import LinearSegmentedColormap
-    start_hex, end_hex = "#FFEB8B", "#FF00CA"
     cmap = LinearSegmentedColormap.from_list(
         "week_grad", [start_hex, end_hex], N=256
     )
+    # draw heatmap
+    cell_size=20; spacing=8; corner=4
+    fig_w = (cell_size*24 + spacing*23)/72
+    fig_h = (cell_size*2 + spacing)/72
+    fig, ax = plt.subplots(figsize=(fig_w, fig_h))
+    fig.patch.set_alpha(0); ax.set_alpha(0)
+    max_val = mat.max() if mat.max() > 0 else 1
+    for i in range(2):
+        for j in range(24):
+            x=j*(cell_size+spacing)/72; y=(1-i)*(cell_size+spacing)/72
+            val = mat[i,j]
+            norm_val = val / max_val
+            rect = FancyBboxPatch(
+                (x, y), cell_size/72, cell_size/72,
+                boxstyle=f"round,pad=0,rounding_size={corner/72}",
+                facecolor=cmap(norm_val), edgecolor='none'
+            )
+            ax.add_patch(rect)
+    ax.set_xlim(0, fig_w); ax.set_ylim(0, fig_h)
+    ax.set_xticks([]); ax.set_yticks([])
+    ax.invert_yaxis()
+    for spine in ax.spines.values(): spine.set_visible(False)
+    plt.savefig(export_file, format='png', dpi=300,
+                bbox_inches='tight', pad_inches=0, transparent=True)
+    plt.close()
 
-    behaviours = df2['Behaviour Name'].dropna().unique()
+
+def weekly_heatmap_jobs(cube, export_path, start_date, end_date, start_hex, end_hex, suffix=""):
+    """Arguments of draw_weekly_heatmap for every behaviour and calendar week in the date range."""
+    jobs = []
+    behaviours = behaviours_in_range(cube, start_date, end_date)
     for beh in behaviours:
-        beh_df = df2[df2['Behaviour Name']==beh]
-        # group by year-week
-        for (yr, wk), group in beh_df.groupby(['Year','Week']):
-            # filter to only days within start/end
-            subset = group[(group['Date']>=start_date)&(group['Date']<=end_date)]
-            if subset.empty:
-                continue
-            # build 2×24 matrix: weekdays (Mon–Fri), weekends (Sat–Sun)
-            mat = _np.zeros((2,24), dtype=int)
-            # weekday mask: weekday <5
-            wd = subset[subset['Timestamp'].dt.weekday<5]
-            we = subset[subset['Timestamp'].dt.weekday>=5]
-            for df_seg, row in ((wd,0),(we,1)):
-                counts = df_seg.groupby('Hour').size()
-                for h,c in counts.items():
-                    mat[row, h] = c
-            # draw heatmap
-            cell_size=20; spacing=8; corner=4
-            weeks = [f"{yr}-W{wk:02d}"]
-            fig_w = (cell_size*24 + spacing*23)/72
-            fig_h = (cell_size*2 + spacing)/72
-            fig, ax = plt.subplots(figsize=(fig_w, fig_h))
-            fig.patch.set_alpha(0); ax.set_alpha(0)
-            max_val = mat.max() if mat.max() > 0 else 1
-            for i in range(2):
-                for j in range(24):
-                    x=j*(cell_size+spacing)/72; y=(1-i)*(cell_size+spacing)/72
-                    val = mat[i,j]
-                    norm_val = val / max_val
-                    rect = FancyBboxPatch(
-                        (x, y), cell_size/72, cell_size/72,
-                        boxstyle=f"round,pad=0,rounding_size={corner/72}",
-                        facecolor=cmap(norm_val), edgecolor='none'
-                    )
-                    ax.add_patch(rect)
-            ax.set_xlim(0, fig_w); ax.set_ylim(0, fig_h)
-            ax.set_xticks([]); ax.set_yticks([])
-            ax.invert_yaxis()
-            for spine in ax.spines.values(): spine.set_visible(False)
+        # 2×24 matrix per year-week: weekdays (Mon–Fri), weekends (Sat–Sun)
+        for yr, wk, mat in weekly_hour_matrices(cube, beh, start_date, end_date):
             # Compute min/max/total for filename
             min_val = int(mat.min())
             max_val = int(mat.max())
             total_val = int(mat.sum())
-            fname = f"{beh}_{yr}-W{wk}_heatmap(min_{min_val}_max_{max_val}_total_{total_val})_{start_date}_to_{end_date}.png"
-            plt.savefig(os.path.join(export_path, fname), format='png', dpi=300,
-                        bbox_inches='tight', pad_inches=0, transparent=True)
-            plt.close()
+            fname = f"{beh}_{yr}-W{wk}_heatmap(min_{min_val}_max_{max_val}_total_{total_val})_{start_date}_to_{end_date}{suffix}.png"
+            jobs.append((mat, start_hex, end_hex, os.path.join(export_path, fname)))
+    return jobs
+
+
+# --- New function: generate_weekly_behavior_heatmaps
+def generate_weekly_behavior_heatmaps(cube, export_path, start_date, end_date):
+    """
+    For each Behaviour Name and for each calendar week in the date range,
+    generate a 2×24 heatmap (row 1 = weekdays, row 2 = weekend) of event counts per hour.
+    Uses 5‑level discrete gradient: 0→#3C0066, 1→#53008C, 2→#6A00B2,
+    3→#8100D9, >=4→#9700FF. Transparent background.
+    """
+    # Continuous perceptual gradient between pale yellow and magenta
+    start_hex, end_hex = "#FFEB8B", "#FF00CA"
+    jobs = weekly_heatmap_jobs(cube, export_path, start_date, end_date, start_hex, end_hex)
+    render_charts(draw_weekly_heatmap, jobs, CHART_WORKERS, outputs=[job[-1] for job in jobs])
 
 # --- New function: generate_weekly_behavior_heatmaps_custom
-def generate_weekly_behavior_heatmaps_custom(df, export_path, start_date, end_date, start_hex, end_hex):
+def generate_weekly_behavior_heatmaps_custom(cube, export_path, start_date, end_date, start_hex, end_hex):
     """
     For each Behaviour Name and for each calendar week in the date range,
     generate a 2×24 heatmap (row 1 = weekdays, row 2 = weekend) of event counts per hour.
     Uses a continuous perceptual gradient between the provided start_hex and end_hex colors.
     Transparent background.
     """
-    import numpy as _np
-    # Prepare data
-    df2 = df.copy()
-    df2['Timestamp'] = pd.to_datetime(df2['Timestamp'])
-    df2['Date'] = df2['Timestamp'].dt.date
-    df2['Hour'] = df2['Timestamp'].dt.hour
-    df2['Year'] = df2['Timestamp'].dt.isocalendar().year
-    df2['Week'] = df2['Timestamp'].dt.isocalendar().week
-
-    from matplotlib.colors import LinearSegmentedColormap
-    cmap = LinearSegmentedColormap.from_list(
-        "week_grad_custom", [start_hex, end_hex], N=256
-    )
-
-    behaviours = df2['Behaviour Name'].dropna().unique()
-    for beh in behaviours:
-        beh_df = df2[df2['Behaviour Name']==beh]
-        # group by year-week
-        for (yr, wk), group in beh_df.groupby(['Year','Week']):
-            # filter to only days within start/end
-            subset = group[(group['Date']>=start_date)&(group['Date']<=end_date)]
-            if subset.empty:
-                continue
-            # build 2×24 matrix: weekdays (Mon–Fri), weekends (Sat–Sun)
-            mat = _np.zeros((2,24), dtype=int)
-            # weekday mask: weekday <5
-            wd = subset[subset['Timestamp'].dt.weekday<5]
-            we = subset[subset['Timestamp'].dt.weekday>=5]
-            for df_seg, row in ((wd,0),(we,1)):
-                counts = df_seg.groupby('Hour').size()
-                for h,c in counts.items():
-                    mat[row, h] = c
-            # draw heatmap
-            cell_size=20; spacing=8; corner=4
-            weeks = [f"{yr}-W{wk:02d}"]
-            fig_w = (cell_size*24 + spacing*23)/72
-            fig_h = (cell_size*2 + spacing)/72
-            fig, ax = plt.subplots(figsize=(fig_w, fig_h))
-            fig.patch.set_alpha(0); ax.set_alpha(0)
-            max_val = mat.max() if mat.max() > 0 else 1
-            for i in range(2):
-                for j in range(24):
-                    x=j*(cell_size+spacing)/72; y=(1-i)*(cell_size+spacing)/72
-                    val = mat[i,j]
-                    norm_val = val / max_val
-                    rect = FancyBboxPatch(
-                        (x, y), cell_size/72, cell_size/72,
-                        boxstyle=f"round,pad=0,rounding_size={corner/72}",
-                        facecolor=cmap(norm_val), edgecolor='none'
-                    )
-                    ax.add_patch(rect)
-            ax.set_xlim(0, fig_w); ax.set_ylim(0, fig_h)
-            ax.set_xticks([]); ax.set_yticks([])
-            ax.invert_yaxis()
-            for spine in ax.spines.values(): spine.set_visible(False)
-            # Compute min/max/total for filename
-            min_val = int(mat.min())
-            max_val = int(mat.max())
-            total_val = int(mat.sum())
-            fname = f"{beh}_{yr}-W{wk}_heatmap(min_{min_val}_max_{max_val}_total_{total_val})_{start_date}_to_{end_date}_custom.png"
-            plt.savefig(os.path.join(export_path, fname), format='png', dpi=300,
-                        bbox_inches='tight', pad_inches=0, transparent=True)
-            plt.close()
+    jobs = weekly_heatmap_jobs(cube, export_path, start_date, end_date, start_hex, end_hex, suffix="_custom")
+    render_charts(draw_weekly_heatmap, jobs, CHART_WORKERS, outputs=[job[-1] for job in jobs])
 
 # --- New function: generate_overall_behavior_heatmaps_custom
-def generate_overall_behavior_heatmaps_custom(df, export_path, start_date, end_date, start_hex, end_hex):
+def generate_overall_behavior_heatmaps_custom(cube, export_path, start_date, end_date, start_hex, end_hex):
     """
     For each Behaviour Name, generate a 2×24 heatmap aggregated across the entire date range,
     using a continuous perceptual gradient between start_hex and end_hex.
     Transparent background.
     """
-    import numpy as _np
-    from matplotlib.colors import LinearSegmentedColormap
-    # Prepare data
-    df2 = df.copy()
-    df2['Timestamp'] = pd.to_datetime(df2['Timestamp'])
-    df2['Date'] = df2['Timestamp'].dt.date
-    df2['Hour'] = df2['Timestamp'].dt.hour
-
-    # Create colormap
-    cmap = LinearSegmentedColormap.from_list(
-        "overall_grad_custom", [start_hex, end_hex], N=256
-    )
+    jobs = overall_heatmap_jobs(cube, export_path, start_date, end_date, start_hex, end_hex, suffix="_custom")
+    render_charts(draw_weekly_heatmap, jobs, CHART_WORKERS, outputs=[job[-1] for job in jobs])
 
-    behaviours = df2['Behaviour Name'].dropna().unique()
+
+def overall_heatmap_jobs(cube, export_path, start_date, end_date, start_hex, end_hex, suffix=""):
+    """Arguments of draw_weekly_heatmap for every behaviour, over the whole date range."""
+    jobs = []
+    days = pd.date_range(start=start_date, end=end_date)
+    behaviours = behaviours_in_range(cube, start_date, end_date)
     for beh in behaviours:
-        subset = df2[(df2['Behaviour Name']==beh)
-                     & (df2['Date']>=start_date)
-                     & (df2['Date']<=end_date)]
-        if subset.empty:
-            continue
-        # build 2×24 matrix
-        mat = _np.zeros((2,24), dtype=int)
-        wd = subset[subset['Timestamp'].dt.weekday < 5]
-        we = subset[subset['Timestamp'].dt.weekday >= 5]
-        for grp, row in ((wd,0),(we,1)):
-            counts = grp.groupby('Hour').size()
-            for h,c in counts.items():
-                mat[row,h] = c
-        # draw heatmap (mirror generate_overall_behavior_heatmaps)
-        cell_size=20; spacing=8; corner=4
-        fig_w = (cell_size*24 + spacing*23)/72
-        fig_h = (cell_size*2 + spacing)/72
-        fig, ax = plt.subplots(figsize=(fig_w, fig_h))
-        fig.patch.set_alpha(0); ax.set_alpha(0)
-        max_val = mat.max() if mat.max() > 0 else 1
-        for i in range(2):
-            for j in range(24):
-                x=j*(cell_size+spacing)/72; y=(1-i)*(cell_size+spacing)/72
-                norm_val = mat[i,j] / max_val
-                rect = FancyBboxPatch(
-                    (x, y), cell_size/72, cell_size/72,
-                    boxstyle=f"round,pad=0,rounding_size={corner/72}",
-                    facecolor=cmap(norm_val), edgecolor='none'
-                )
-                ax.add_patch(rect)
-        ax.set_xlim(0, fig_w); ax.set_ylim(0, fig_h)
-        ax.set_xticks([]); ax.set_yticks([])
-        ax.invert_yaxis()
-        for spine in ax.spines.values(): spine.set_visible(False)
+        # build 2×24 matrix from the behaviour's hourly counts
+        mat = weekday_weekend_matrix(cube.rollup(60).day_slot_counts(start_date, end_date, behaviour=beh), days)
         # Compute min/max/total for filename
         min_val = int(mat.min())
         max_val = int(mat.max())
         total_val = int(mat.sum())
-        filename = f"{beh}_overall_heatmap(min_{min_val}_max_{max_val}_total_{total_val})_{start_date}_to_{end_date}_custom.png"
-        plt.savefig(
-            os.path.join(export_path, filename),
-            format='png', dpi=300,
-            bbox_inches='tight', pad_inches=0, transparent=True
-        )
-        plt.close()
+        filename = f"{beh}_overall_heatmap(min_{min_val}_max_{max_val}_total_{total_val})_{start_date}_to_{end_date}{suffix}.png"
+        jobs.append((mat, start_hex, end_hex, os.path.join(export_path, filename)))
+    return jobs
 
 # --- New function: generate_overall_behavior_heatmaps
-def generate_overall_behavior_heatmaps(df, export_path, start_date, end_date):
+def generate_overall_behavior_heatmaps(cube, export_path, start_date, end_date):
     """
     For each Behaviour Name, generate a 2×24 heatmap (row 0=weekdays, row 1=weekend)
     aggregated across the entire date range. Uses the same 5-level discrete gradient
     (#3C0066, #53008C, #6A00B2, #8100D9, #9700FF) and transparent background.
     """
-    import numpy as _np
-    # Prepare data
-    df2 = df.copy()
-    df2['Timestamp'] = pd.to_datetime(df2['Timestamp'])
-    df2['Date'] = df2['Timestamp'].dt.date
-    df2['Hour'] = df2['Timestamp'].dt.hour
-
     # Continuous perceptual gradient between pale yellow and magenta
-    from matplotlib.colors import LinearSegmentedColormap
     start_hex, end_hex = "#FFEB8B", "#FF00CA"
-    cmap = LinearSegmentedColormap.from_list(
-        "overall_grad", [start_hex, end_hex], N=256
-    )
-
-    behaviours = df2['Behaviour Name'].dropna().unique()
-    for beh in behaviours:
-        subset = df2[(df2['Behaviour Name']==beh) &
-                     (df2['Date']>=start_date) & (df2['Date']<=end_date)]
-        if subset.empty:
-            continue
-        # build 2×24 matrix
-        mat = _np.zeros((2,24), dtype=int)
-        wd = subset[subset['Timestamp'].dt.weekday < 5]
-        we = subset[subset['Timestamp'].dt.weekday >= 5]
-        for grp, row in ((wd,0),(we,1)):
-            counts = grp.groupby('Hour').size()
-            for h,c in counts.items():
-                mat[row,h] = c
-        # draw heatmap
-        cell_size=20; spacing=8; corner=4
-        fig_w = (cell_size*24 + spacing*23)/72
-        fig_h = (cell_size*2 + spacing)/72
-        fig, ax = plt.subplots(figsize=(fig_w, fig_h))
-        fig.patch.set_alpha(0); ax.set_alpha(0)
-        max_val = mat.max() if mat.max() > 0 else 1
-        for i in range(2):
-            for j in range(24):
-                x=j*(cell_size+spacing)/72; y=(1-i)*(cell_size+spacing)/72
-                val = mat[i,j]
-                norm_val = val / max_val
-                rect = FancyBboxPatch(
-                    (x, y), cell_size/72, cell_size/72,
-                    boxstyle=f"round,pad=0,rounding_size={corner/72}",
-                    facecolor=cmap(norm_val), edgecolor='none'
-                )
-                ax.add_patch(rect)
-        ax.set_xlim(0, fig_w); ax.set_ylim(0, fig_h)
-        ax.set_xticks([]); ax.set_yticks([])
-        ax.invert_yaxis()
-        for spine in ax.spines.values(): spine.set_visible(False)
-        # Compute min/max/total for filename
-        min_val = int(mat.min())
-        max_val = int(mat.max())
-        total_val = int(mat.sum())
-        filename = f"{beh}_overall_heatmap(min_{min_val}_max_{max_val}_total_{total_val})_{start_date}_to_{end_date}.png"
-        plt.savefig(
-            os.path.join(export_path, filename),
-            format='png', dpi=300,
-            bbox_inches='tight', pad_inches=0, transparent=True
-        )
-        plt.close()
+    jobs = overall_heatmap_jobs(cube, export_path, start_date, end_date, start_hex, end_hex)
+    render_charts(draw_weekly_heatmap, jobs, CHART_WORKERS, outputs=[job[-1] for job in jobs])
 
 
 def main():
@@ -1030,14 +778,17 @@ def main():
             # Now print the CSV file list for the user to review
             list_csv_files(folder_path)  # Default is to print the file list
             if confirm_file_list():  # If the user confirms the file list
-                # Merge all CSV files into a single DataFrame
-                merged_df, first_date, last_date = merge_csv_files(folder_path, csv_files)
+                # Open the event store built from the CSV files (only its metadata is read here)
+                store, first_date, last_date = merge_csv_files(folder_path, csv_files)
                 
                 # Prompt the user to select a date range
                 start_date, end_date = get_date_range(first_date, last_date)
                 
                 # Confirm the date range selection
                 if confirm_date_selection(start_date, end_date):
+                    # Charts are drawn from the count cube, the events themselves are not loaded
+                    cube = load_count_cube(store, start_date, end_date)
+
                     # Ask the user which visualization to generate
                     print("Select visualization type to generate:")
                     print("[1] Heatmap")
@@ -1050,25 +801,33 @@ def main():
                     choice = input("Enter the number of your choice: ").strip()
                     export_path = create_data_vis_folder()
                     if choice == '1':
-                        generate_heatmap(merged_df, selected_folder, "Behavior", export_path, start_date, end_date)
+                        cached_render(generate_heatmap, heatmap_matrix(cube, None, None, start_date, end_date), selected_folder,
+                                      "Behavior", export_path, start_date, end_date,
+                                      output=heatmap_file(export_path, selected_folder, "Behavior"))
                     elif choice == '2':
-                        generate_transparent_chart(merged_df, export_path, start_date, end_date)
+                        cached_render(generate_transparent_chart, activity_matrix(cube, start_date, end_date), export_path,
+                                      start_date, end_date,
+                                      output=chart_file(export_path, "Transparent_Styled_Consolidated_Chart", start_date, end_date))
                     elif choice == '3':
-                        generate_heatmap(merged_df, selected_folder, "Behavior", export_path, start_date, end_date)
-                        generate_transparent_chart(merged_df, export_path, start_date, end_date)
+                        cached_render(generate_heatmap, heatmap_matrix(cube, None, None, start_date, end_date), selected_folder,
+                                      "Behavior", export_path, start_date, end_date,
+                                      output=heatmap_file(export_path, selected_folder, "Behavior"))
+                        cached_render(generate_transparent_chart, activity_matrix(cube, start_date, end_date), export_path,
+                                      start_date, end_date,
+                                      output=chart_file(export_path, "Transparent_Styled_Consolidated_Chart", start_date, end_date))
                     elif choice == '4':
                         generate_consolidated_by_behavior(
-                            merged_df,
+                            cube,
                             selected_folder,
                             export_path,
                             start_date,
                             end_date
                         )
                     elif choice == '5':
-                        generate_behavior_mix_chart(merged_df, export_path, start_date, end_date)
+                        generate_behavior_mix_chart(cube, export_path, start_date, end_date)
                     elif choice == '6':
-                        generate_weekly_behavior_heatmaps(merged_df, export_path, start_date, end_date)
-                        generate_overall_behavior_heatmaps(merged_df, export_path, start_date, end_date)
+                        generate_weekly_behavior_heatmaps(cube, export_path, start_date, end_date)
+                        generate_overall_behavior_heatmaps(cube, export_path, start_date, end_date)
                     elif choice == '7':
                         # Prompt user for custom gradient colors
                         start_hex = input("Enter start hex color (e.g. FFEB8B or #FFEB8B): ").strip()
@@ -1078,11 +837,11 @@ def main():
                         if not end_hex.startswith('#'):
                             end_hex = '#' + end_hex
                         generate_weekly_behavior_heatmaps_custom(
-                            merged_df, export_path, start_date, end_date, start_hex, end_hex
+                            cube, export_path, start_date, end_date, start_hex, end_hex
                         )
                         # Also generate overall custom heatmaps
                         generate_overall_behavior_heatmaps_custom(
-                            merged_df, export_path, start_date, end_date, start_hex, end_hex
+                            cube, export_path, start_date, end_date, start_hex, end_hex
                         )
                     else:
                         print("Invalid choice. No visualization generated.")
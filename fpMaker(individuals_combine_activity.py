@@ -11,6 +11,21 @@ from matplotlib.colors import rgb_to_hsv, hsv_to_rgb
 from matplotlib.colors import LinearSegmentedColormap, Normalize
 from matplotlib.colors import ListedColormap, BoundaryNorm
 from matplotlib.colors import to_rgb
+from dataloader import describe_folder
+from eventstore import open_events, load_count_cube
+from chartrender import draw_heatmap_cells, add_cells
+from cellraster import write_square_chart, write_rounded_chart
+from chartpool import render_charts
+from rendercache import cached_render
+
+# Minutes per heatmap column, any level of the count cube's rollups (see ROLLUP_MINUTES in aggregates.py)
+HEATMAP_SLOT_MINUTES = 30
+# 'matplotlib' draws the consolidated, styled and transparent charts as figures; 'raster' writes
+# them directly with NumPy (see cellraster.py), several times faster, with edge pixels a few
+# 255ths off the matplotlib ones
+CELL_CHART_BACKEND = 'matplotlib'
+# Worker processes rendering the per-hub charts; None for one per CPU core, 1 to render them one by one here
+CHART_WORKERS = None
 
 
 pd.options.mode.chained_assignment = None  # Suppress SettingWithCopyWarning
@@ -18,7 +33,7 @@ pd.options.mode.chained_assignment = None  # Suppress SettingWithCopyWarning
 def list_folders(root_folder):
     subfolders = [f for f in os.listdir(root_folder) if os.path.isdir(os.path.join(root_folder, f))]
     for idx, folder in enumerate(subfolders, 1):
-        print(f"[{idx}] {folder}")
+        print(f"[{idx}] {folder} {describe_folder(os.path.join(root_folder, folder))}")
     return subfolders
 
 def get_folder_selection(subfolders):
@@ -56,16 +71,12 @@ def confirm_file_list():
             print("Invalid input, please enter Y or N.")
 
 def merge_csv_files(folder_path, csv_files):
-    merged_df = pd.concat([pd.read_csv(os.path.join(folder_path, file)) for file in csv_files], ignore_index=True)
-    merged_df = merged_df.loc[:, ~merged_df.columns.duplicated()]  # Remove duplicate columns if any
-    
-    # Assuming the 'Timestamp' column is present and contains both date and time
-    merged_df['Timestamp'] = pd.to_datetime(merged_df['Timestamp'])
-    merged_df['Date'] = merged_df['Timestamp'].dt.date
-    merged_df['Time'] = merged_df['Timestamp'].dt.time
-    first_date = merged_df['Date'].min()
-    last_date = merged_df['Date'].max()
-    return merged_df, first_date, last_date
+    # Only the store's metadata (or the start and end of each file) is read here,
+    # the counts are read once the date range is known
+    store = open_events(folder_path, csv_files)
+    first_date = store.first_date
+    last_date = store.last_date
+    return store, first_date, last_date
 
 def get_date_range(first_date, last_date):
     print(f"Available data range: {first_date} to {last_date}")
@@ -94,35 +105,32 @@ def create_data_vis_folder():
     os.makedirs(export_path, exist_ok=True)
     return export_path
 
-def generate_heatmap(df, hub_name, behavior_name, export_path, start_date, end_date):
-    # Prepare data for the heatmap
-    df = df.copy()
-    df['Timestamp'] = pd.to_datetime(df['Timestamp'])
-    
-    # Extract date and weekday
-    df['Date'] = df['Timestamp'].dt.date
-    df['Weekday'] = df['Timestamp'].dt.strftime('%a')
-    df['Date_with_Weekday'] = df['Date'].astype(str) + ' (' + df['Weekday'] + ')'
-    
-    # Create half-hour intervals by flooring the time to the nearest 30 minutes
-    df['Half Hour'] = df['Timestamp'].dt.floor('30min').dt.strftime('%H:%M')
-    
+def heatmap_matrix(cube, hub_name, behavior_name, start_date, end_date):
+    """
+    Date x time slot count matrix for the heatmap, newest date first, read from the count
+    cube at HEATMAP_SLOT_MINUTES per slot. None for `hub_name` or `behavior_name` adds up
+    all hubs or behaviours.
+    """
     # Create a date range and time slots to ensure the chart includes all dates and times , added [::-1] to invert
     date_range = pd.date_range(start=start_date, end=end_date)
     date_labels = date_range.strftime('%Y-%m-%d (%a)').tolist()[::-1]
+    time_slots = [f'{minute // 60:02d}:{minute % 60:02d}' for minute in range(0, 24 * 60, HEATMAP_SLOT_MINUTES)]
+
+    counts = cube.rollup(HEATMAP_SLOT_MINUTES).day_slot_counts(start_date, end_date, hub_name, behavior_name)[::-1]
+    return pd.DataFrame(counts, index=date_labels, columns=time_slots)
+
+def activity_matrix(cube, start_date, end_date, hub=None, behaviour=None):
+    """Date x hour matrix with 1 for every hour with at least one press, read from the count cube."""
+    # Create a date range to ensure all dates are included
+    date_range = pd.date_range(start=start_date, end=end_date).date
+    counts = cube.rollup(60).day_slot_counts(start_date, end_date, hub, behaviour)
+    return pd.DataFrame((counts > 0).astype(int), index=date_range, columns=range(24))
+
+def generate_heatmap(pivot_df, hub_name, behavior_name, export_path, start_date, end_date):
+    # Weekdays of the rows, used to add extra spacing around weekends
+    date_range = pd.date_range(start=start_date, end=end_date)
     weekdays = date_range.strftime('%a').tolist()
-    time_slots = [f'{hour:02d}:{minute:02d}' for hour in range(24) for minute in [0, 30]]
-    
-    # Pivot the DataFrame to create a matrix for the heatmap
-    pivot_df = df.pivot_table(
-        index='Date_with_Weekday',
-        columns='Half Hour',
-        values='Button ID',
-        aggfunc='count',
-        fill_value=0
-    )
-    pivot_df = pivot_df.reindex(index=date_labels, columns=time_slots, fill_value=0)
-    
+
     data = pivot_df.values
     num_rows, num_columns = data.shape
 
@@ -204,73 +212,9 @@ def generate_heatmap(df, hub_name, behavior_name, export_path, start_date, end_d
     # Adjust font size to 55% of cell height
     font_size = cell_height_in_points * 0.45  # 55% of cell height in points
 
-    # Draw the heatmap cells with rounded corners and spacing
-    for (i, j), value in np.ndenumerate(data):
-        # Calculate positions with spacing and extra offsets
-        x = j + spacing / 2
-        y_cell = y_positions[i] + spacing / 2
-
-        time_label = pivot_df.columns[j]
-        facecolor = None
-        edgecolor = None
-        linewidth = 0
-
-        if value == 0:
-            facecolor = 'none'  # No background color
-            linewidth = linewidth_in_points
-
-            if time_label.endswith(':00'):
-                edgecolor = '#E6E7E6'  # Border color for '00' minutes
-            elif time_label.endswith(':30'):
-                edgecolor = '#C4C4C4'  # Border color for '30' minutes
-            else:
-                edgecolor = 'black'  # Default edge color if time format is unexpected
-        else:
-            # Determine the appropriate color based on the value
-            if value <= 5:
-                color_index = int(value) - 1  # Indices start from 0
-            else:
-                color_index = 5  # '5+' color
-            facecolor = cmap.colors[color_index]
-            edgecolor = None
-            linewidth = 0
-
-        # Draw the cell
-        rect = FancyBboxPatch(
-            (x, y_cell),
-            adjusted_cell_size,
-            adjusted_cell_size,
-            boxstyle=f"round,pad=0,rounding_size={adjusted_cell_size * 0.25}",
-            linewidth=linewidth,
-            edgecolor=edgecolor,
-            facecolor=facecolor
-        )
-        ax.add_patch(rect)
-
-        # Add the data value as text in the center of the cell with padding
-        if value != 0:
-            # Convert facecolor to RGB tuple
-            r, g, b = to_rgb(facecolor)  # Returns values between 0 and 1
-
-            # Calculate text color based on cell background color
-            luminance = 0.2126 * r + 0.7152 * g + 0.0722 * b  # Relative luminance
-            text_color = 'black' if luminance > 0.6 else 'white'
-
-            # Position of the text (center of the cell)
-            x_text = x + adjusted_cell_size / 2
-            y_text = y_cell + adjusted_cell_size / 2
-
-            # Add text
-            ax.text(
-                x_text,
-                y_text,
-                int(value),
-                ha='center',
-                va='center',
-                color=text_color,
-                fontsize=font_size,
-                clip_on=False
-            )
+    # Draw the heatmap cells with rounded corners and spacing, and their counts, as two batched artists
+    draw_heatmap_cells(ax, data, pivot_df.columns, y_positions, spacing, adjusted_cell_size,
+                       linewidth_in_points, cmap.colors, font_size)
 
     # Set the limits, labels, and ticks
     ax.set_xlim(0, num_columns)
@@ -285,7 +229,8 @@ def generate_heatmap(df, hub_name, behavior_name, export_path, start_date, end_d
     y_tick_positions = [y_positions[i] + adjusted_cell_size / 2 for i in range(num_rows)]
     ax.set_yticks(y_tick_positions)
     ax.set_yticklabels(pivot_df.index)
-    ax.set_xlabel("Time of Day (Half-Hour Intervals)")
+    interval = {30: "Half-Hour", 60: "Hourly"}.get(HEATMAP_SLOT_MINUTES, f"{HEATMAP_SLOT_MINUTES}-Minute")
+    ax.set_xlabel(f"Time of Day ({interval} Intervals)")
     ax.set_ylabel("Date (Weekday)")
     plt.title(f"{hub_name} - {behavior_name}")
 
@@ -305,25 +250,14 @@ def generate_heatmap(df, hub_name, behavior_name, export_path, start_date, end_d
 
     # Save the heatmap as a PNG file
     export_file_name = f"{hub_name}-{behavior_name}.png"
-    plt.savefig(os.path.join(export_path, export_file_name), format='png', bbox_inches='tight')
+    # fig.savefig, as plt.savefig redraws the whole figure once more after saving
+    fig.savefig(os.path.join(export_path, export_file_name), format='png', bbox_inches='tight')
     plt.close()
 
-def generate_consolidated_chart(df, export_path, start_date, end_date):
-    # Prepare data for the chart
-    df = df.copy()
-    df['Timestamp'] = pd.to_datetime(df['Timestamp'])
-    df['Date'] = df['Timestamp'].dt.date
-    df['Hour'] = df['Timestamp'].dt.hour
-
-    # Create a date range to ensure all dates are included
-    date_range = pd.date_range(start=start_date, end=end_date).date
-    data_matrix = pd.DataFrame(index=date_range, columns=range(24), data=0)
-
-    # Mark hours with logged behavior as 1
-    for date, hour in zip(df['Date'], df['Hour']):
-        if date in data_matrix.index:
-            data_matrix.loc[date, hour] = 1
+def chart_file(export_path, chart_name, start_date, end_date):
+    return os.path.join(export_path, f"{chart_name}_{start_date}_to_{end_date}.png")
 
+def generate_consolidated_chart(data_matrix, export_path, start_date, end_date):
     # Convert to numpy array for easier plotting
     data = data_matrix.values
     num_rows, num_columns = data.shape
@@ -333,25 +267,23 @@ def generate_consolidated_chart(df, export_path, start_date, end_date):
     fig_width = cell_size * num_columns
     fig_height = cell_size * num_rows
 
-    # Create figure and axis
-    fig, ax = plt.subplots(figsize=(fig_width, fig_height))
-
     # Define colors for cells
     has_data_color = '#9700FF'
     no_data_color = '#3C0066'
+    colors = np.where(data == 1, has_data_color, no_data_color)
+    export_file = chart_file(export_path, "Consolidated_Chart", start_date, end_date)
+
+    if CELL_CHART_BACKEND == 'raster':
+        write_square_chart(export_file, colors, cell_size)
+        return
+
+    # Create figure and axis
+    fig, ax = plt.subplots(figsize=(fig_width, fig_height))
 
-    # Draw the chart
-    for (i, j), value in np.ndenumerate(data):
-        color = has_data_color if value == 1 else no_data_color
-        rect = FancyBboxPatch(
-            (j, num_rows - i - 1),  # Reverse y-axis for proper date sorting
-            1,
-            1,
-            boxstyle="square,pad=0",
-            facecolor=color,
-            edgecolor='none'
-        )
-        ax.add_patch(rect)
+    # Draw the chart, all cells as one collection
+    rows, columns = np.indices(data.shape)
+    # Reverse y-axis for proper date sorting
+    add_cells(ax, columns.ravel(), num_rows - rows.ravel() - 1, 1, 1, "square,pad=0", colors.ravel())
 
     # Adjust axis limits and aspect ratio
     ax.set_xlim(0, num_columns)
@@ -363,26 +295,10 @@ def generate_consolidated_chart(df, export_path, start_date, end_date):
     ax.set_yticks([])
 
     # Save the chart
-    export_file_name = f"Consolidated_Chart_{start_date}_to_{end_date}.png"
-    plt.savefig(os.path.join(export_path, export_file_name), format='png', bbox_inches='tight')
+    plt.savefig(export_file, format='png', bbox_inches='tight')
     plt.close()
 
-def generate_styled_consolidated_chart(df, export_path, start_date, end_date):
-
-    # Prepare data for the chart
-    df = df.copy()
-    df['Timestamp'] = pd.to_datetime(df['Timestamp'])
-    df['Date'] = df['Timestamp'].dt.date
-    df['Hour'] = df['Timestamp'].dt.hour
-
-    # Create a date range to ensure all dates are included
-    date_range = pd.date_range(start=start_date, end=end_date).date
-    data_matrix = pd.DataFrame(index=date_range, columns=range(24), data=0)
-
-    # Mark hours with logged behavior as 1
-    for date, hour in zip(df['Date'], df['Hour']):
-        if date in data_matrix.index:
-            data_matrix.loc[date, hour] = 1
+def generate_styled_consolidated_chart(data_matrix, export_path, start_date, end_date):
 
     # Convert to numpy array for easier plotting
     data = data_matrix.values
@@ -400,25 +316,26 @@ def generate_styled_consolidated_chart(df, export_path, start_date, end_date):
     fig_width = (cell_size + spacing) * num_columns / 72
     fig_height = (cell_size + spacing) * num_rows / 72
 
+    colors = np.where(data == 1, has_data_color, no_data_color)
+    export_file = chart_file(export_path, "Styled_Consolidated_Chart", start_date, end_date)
+
+    if CELL_CHART_BACKEND == 'raster':
+        # Rows from the top, where the figure has the last date
+        write_rounded_chart(export_file, colors[::-1], cell_size, spacing, corner_radius,
+                            background=background_color)
+        return
+
     # Create figure and axis
     fig, ax = plt.subplots(figsize=(fig_width, fig_height))
     fig.patch.set_facecolor(background_color)
     ax.set_facecolor(background_color)
 
-    # Draw the chart
-    for (i, j), value in np.ndenumerate(data):
-        x = j * (cell_size + spacing) / 72
-        y = (num_rows - i - 1) * (cell_size + spacing) / 72
-        color = has_data_color if value == 1 else no_data_color
-        rect = FancyBboxPatch(
-            (x, y),  # Position
-            cell_size / 72,  # Width
-            cell_size / 72,  # Height
-            boxstyle=f"round,pad=0,rounding_size={corner_radius / 72}",  # Rounded corners
-            facecolor=color,
-            edgecolor='none'  # Remove border
-        )
-        ax.add_patch(rect)
+    # Draw the chart, all cells as one collection
+    rows, columns = np.indices(data.shape)
+    xs = columns.ravel() * (cell_size + spacing) / 72
+    ys = (num_rows - rows.ravel() - 1) * (cell_size + spacing) / 72
+    add_cells(ax, xs, ys, cell_size / 72, cell_size / 72,
+              f"round,pad=0,rounding_size={corner_radius / 72}", colors.ravel())  # Rounded corners
 
     # Adjust axis limits to make the outer ring the edge of the chart
     ax.set_xlim(0, num_columns * (cell_size + spacing) / 72)
@@ -428,48 +345,37 @@ def generate_styled_consolidated_chart(df, export_path, start_date, end_date):
     ax.invert_yaxis()  # Match the order with dates from top to bottom
 
     # Save the chart
-    export_file_name = f"Styled_Consolidated_Chart_{start_date}_to_{end_date}.png"
-    plt.savefig(os.path.join(export_path, export_file_name), format='png', dpi=300, bbox_inches='tight')
+    plt.savefig(export_file, format='png', dpi=300, bbox_inches='tight')
     plt.close()
 
 
-def analyze_and_generate_consolidated_chart(merged_df, start_date, end_date):
-    # Filter data based on the selected date range
-    filtered_df = merged_df[(merged_df['Date'] >= start_date) & (merged_df['Date'] <= end_date)]
+def analyze_and_generate_consolidated_chart(cube, start_date, end_date):
+    # Hours with data in the selected date range
+    data_matrix = activity_matrix(cube, start_date, end_date)
 
     # Create a folder for exporting the chart
     export_path = create_data_vis_folder()
 
     # Generate the consolidated chart
-    generate_consolidated_chart(filtered_df, export_path, start_date, end_date)
+    cached_render(generate_consolidated_chart, data_matrix, export_path, start_date, end_date,
+                  output=chart_file(export_path, "Consolidated_Chart", start_date, end_date))
 
 
-def analyze_and_generate_styled_consolidated_chart(merged_df, start_date, end_date):
-    # Filter data based on the selected date range
-    filtered_df = merged_df[(merged_df['Date'] >= start_date) & (merged_df['Date'] <= end_date)]
+def analyze_and_generate_styled_consolidated_chart(cube, start_date, end_date):
+    # Hours with data in the selected date range
+    data_matrix = activity_matrix(cube, start_date, end_date)
 
     # Create a folder for exporting the chart
     export_path = create_data_vis_folder()
 
     # Generate the styled consolidated chart
-    generate_styled_consolidated_chart(filtered_df, export_path, start_date, end_date)
+    cached_render(generate_styled_consolidated_chart, data_matrix, export_path, start_date, end_date,
+                  output=chart_file(export_path, "Styled_Consolidated_Chart", start_date, end_date))
     
-def generate_transparent_chart(df, export_path, start_date, end_date, hub_id):
-    # Prepare data for the chart
-    df = df.copy()
-    df['Timestamp'] = pd.to_datetime(df['Timestamp'])
-    df['Date'] = df['Timestamp'].dt.date
-    df['Hour'] = df['Timestamp'].dt.hour
-
-    # Create a date range to ensure all dates are included
-    date_range = pd.date_range(start=start_date, end=end_date).date
-    data_matrix = pd.DataFrame(index=date_range, columns=range(24), data=0)
-
-    # Mark hours with logged behavior as 1
-    for date, hour in zip(df['Date'], df['Hour']):
-        if date in data_matrix.index:
-            data_matrix.loc[date, hour] = 1
+def hub_chart_file(export_path, hub_id, start_date, end_date):
+    return os.path.join(export_path, f"Hub_{hub_id}_{start_date}_to_{end_date}.png")
 
+def generate_transparent_chart(data_matrix, export_path, start_date, end_date, hub_id):
     # Convert to numpy array for easier plotting
     data = data_matrix.values
     num_rows, num_columns = data.shape
@@ -485,27 +391,26 @@ def generate_transparent_chart(df, export_path, start_date, end_date, hub_id):
     fig_width = (cell_size * num_columns + spacing * (num_columns - 1)) / 72
     fig_height = (cell_size * num_rows + spacing * (num_rows - 1)) / 72
 
+    colors = np.where(data == 1, has_data_color, no_data_color)
+    # Use the hub_id in the output file name
+    export_file = hub_chart_file(export_path, hub_id, start_date, end_date)
+
+    if CELL_CHART_BACKEND == 'raster':
+        write_rounded_chart(export_file, colors, cell_size, spacing, corner_radius,
+                            transparent=True)
+        return
+
     # Create figure and axis
     fig, ax = plt.subplots(figsize=(fig_width, fig_height))
     fig.patch.set_alpha(0)  # Transparent figure background
     ax.set_alpha(0)  # Transparent axis background
 
-    # Draw the chart
-
-
-    for (i, j), value in np.ndenumerate(data):
-        x = j * (cell_size + spacing) / 72
-        y = i * (cell_size + spacing) / 72  # Use i directly instead of (num_rows - i - 1)
-        color = has_data_color if value == 1 else no_data_color
-        rect = FancyBboxPatch(
-            (x, y),  
-            cell_size / 72,
-            cell_size / 72,
-            boxstyle=f"round,pad=0,rounding_size={corner_radius / 72}",
-            facecolor=color,
-            edgecolor='none'
-        )
-        ax.add_patch(rect)
+    # Draw the chart, all cells as one collection
+    rows, columns = np.indices(data.shape)
+    xs = columns.ravel() * (cell_size + spacing) / 72
+    ys = rows.ravel() * (cell_size + spacing) / 72  # Use i directly instead of (num_rows - i - 1)
+    add_cells(ax, xs, ys, cell_size / 72, cell_size / 72,
+              f"round,pad=0,rounding_size={corner_radius / 72}", colors.ravel())
 
     # Remove axis spines (black border lines)
     for spine in ax.spines.values():
@@ -518,10 +423,8 @@ def generate_transparent_chart(df, export_path, start_date, end_date, hub_id):
     ax.set_yticks([])
     ax.invert_yaxis()  # Dates top to bottom
 
-    # Use the hub_id in the output file name
-    export_file_name = f"Hub_{hub_id}_{start_date}_to_{end_date}.png"
     plt.savefig(
-        os.path.join(export_path, export_file_name),
+        export_file,
         format='png',
         dpi=300,
         bbox_inches='tight',  
@@ -531,17 +434,18 @@ def generate_transparent_chart(df, export_path, start_date, end_date, hub_id):
     plt.close()
 
 
-def analyze_and_generate_transparent_charts_per_hub(merged_df, start_date, end_date):
-    # Filter data based on the selected date range
-    filtered_df = merged_df[(merged_df['Date'] >= start_date) & (merged_df['Date'] <= end_date)]
+def analyze_and_generate_transparent_charts_per_hub(cube, start_date, end_date):
+    # Hubs with data in the selected date range
+    hubs = cube.count_matrix(start_date, end_date)[0].index
 
     # Create a folder for exporting the charts
     export_path = create_data_vis_folder()
 
-    # Group by Hub and create a chart for each hub
-    for hub_id in filtered_df['Hub Name'].unique():
-        hub_df = filtered_df[filtered_df['Hub Name'] == hub_id]
-        generate_transparent_chart(hub_df, export_path, start_date, end_date, hub_id)
+    # Create a chart for each hub, from its activity matrix
+    jobs = [(activity_matrix(cube, start_date, end_date, hub=hub_id), export_path, start_date, end_date, hub_id)
+            for hub_id in hubs]
+    render_charts(generate_transparent_chart, jobs, CHART_WORKERS,
+                  outputs=[hub_chart_file(export_path, hub_id, start_date, end_date) for hub_id in hubs])
 
 
 def main():
@@ -563,12 +467,14 @@ def main():
             
             list_csv_files(folder_path)
             if confirm_file_list():
-                merged_df, first_date, last_date = merge_csv_files(folder_path, csv_files)
+                store, first_date, last_date = merge_csv_files(folder_path, csv_files)
                 start_date, end_date = get_date_range(first_date, last_date)
                 
                 if confirm_date_selection(start_date, end_date):
+                    # Charts are drawn from the count cube, the events themselves are not loaded
+                    cube = load_count_cube(store, start_date, end_date)
                     # Instead of one combined chart, produce charts for each hub
-                    analyze_and_generate_transparent_charts_per_hub(merged_df, start_date, end_date)
+                    analyze_and_generate_transparent_charts_per_hub(cube, start_date, end_date)
                 break
             else:
                 continue
@@ -3,11 +3,16 @@ import sys
 import pandas as pd
 from datetime import datetime
 import subprocess
+import json
+import numpy as np
+from dataloader import (load_csv_files, concat_frames, report_memory_usage, file_fingerprint, describe_folder,
+                        apply_schema, hash_events, drop_duplicate_events, EventHashSet, EVENT_KEY_COLUMNS, DROP_DUPLICATES,
+                        split_invalid_rows, write_quarantine, get_quarantine_path, VALIDATE_ROWS, CHUNK_SIZE)
 
 def list_folders(root_folder):
     subfolders = [f for f in os.listdir(root_folder) if os.path.isdir(os.path.join(root_folder, f))]
     for idx, folder in enumerate(subfolders, 1):
-        print(f"[{idx}] {folder}")
+        print(f"[{idx}] {folder} {describe_folder(os.path.join(root_folder, folder))}")
     return subfolders
 
 def get_folder_selection(subfolders):
@@ -46,8 +51,12 @@ def confirm_file_list():
             print("Invalid input, please enter Y or N.")
 
 def merge_csv_files(folder_path, csv_files, output_folder):
-    merged_df = pd.concat([pd.read_csv(os.path.join(folder_path, file)) for file in csv_files], ignore_index=True)
+    frames = load_csv_files(folder_path, csv_files)
+    if DROP_DUPLICATES:
+        frames = drop_duplicate_events(frames, csv_files)
+    merged_df = concat_frames(frames)
     merged_df = merged_df.loc[:, ~merged_df.columns.duplicated()]  # Remove duplicate columns if any
+    report_memory_usage(merged_df)
 
     output_filename = f"merged_file_on_{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}.csv"
     output_path = os.path.join(output_folder, output_filename)
@@ -57,6 +66,213 @@ def merge_csv_files(folder_path, csv_files, output_folder):
     last_date = pd.to_datetime(merged_df.iloc[:, 0], errors='coerce').max()
     print(f"{len(merged_df)} entries from {len(csv_files)} file(s), ranging from {first_date.date()} to {last_date.date()}, have been merged to file {output_filename}")
 
+def streaming_merge(folder_path, csv_files, output_folder, chunk_size=CHUNK_SIZE):
+    """
+    Merge the files chunk by chunk, writing each chunk straight to the output file. Only one
+    chunk is held in memory at a time; the entry count and date range are tracked on the fly.
+    """
+    # Read only the headers first so the output has the same columns as a full merge
+    columns = list(pd.concat([pd.read_csv(os.path.join(folder_path, file), nrows=0) for file in csv_files]).columns)
+    columns = [c for i, c in enumerate(columns) if c not in columns[:i]]
+
+    output_filename = f"merged_file_on_{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}.csv"
+    output_path = os.path.join(output_folder, output_filename)
+
+    total_rows = total_dropped = 0
+    first_date = last_date = pd.NaT
+    seen = EventHashSet()
+    with open(output_path, 'w', newline='', encoding='utf-8') as out:
+        pd.DataFrame(columns=columns).to_csv(out, index=False)
+        for file in csv_files:
+            file_path = os.path.join(folder_path, file)
+            dropped = quarantined = 0
+            for chunk in pd.read_csv(file_path, chunksize=chunk_size):
+                chunk = chunk.loc[:, ~chunk.columns.duplicated()]  # Remove duplicate columns if any
+                if VALIDATE_ROWS:
+                    chunk, invalid = split_invalid_rows(chunk)
+                    if len(invalid):
+                        write_quarantine(invalid, file_path, append=quarantined > 0)
+                        quarantined += len(invalid)
+                if DROP_DUPLICATES:
+                    # Hash the parsed key columns so presses match the way they do in the other merge modes
+                    keys = apply_schema(chunk[[c for c in EVENT_KEY_COLUMNS if c in chunk.columns]].copy())
+                    new = seen.add_new(hash_events(keys))
+                    dropped += int(len(chunk) - new.sum())
+                    chunk = chunk[new]
+                chunk.reindex(columns=columns).to_csv(out, index=False, header=False)
+
+                timestamps = pd.to_datetime(chunk.iloc[:, 0], errors='coerce')
+                chunk_first, chunk_last = timestamps.min(), timestamps.max()
+                if not pd.isna(chunk_first) and (pd.isna(first_date) or chunk_first < first_date):
+                    first_date = chunk_first
+                if not pd.isna(chunk_last) and (pd.isna(last_date) or chunk_last > last_date):
+                    last_date = chunk_last
+                total_rows += len(chunk)
+            if quarantined:
+                print(f"{file}: {quarantined} invalid row(s) moved to {get_quarantine_path(file_path)}")
+            elif VALIDATE_ROWS and os.path.exists(get_quarantine_path(file_path)):
+                os.remove(get_quarantine_path(file_path))  # Left over from an earlier version of the file
+            if dropped:
+                print(f"{file}: dropped {dropped} duplicate entries")
+            total_dropped += dropped
+
+    if DROP_DUPLICATES:
+        print(f"{total_dropped} duplicate entries dropped in total.")
+    print(f"{total_rows} entries from {len(csv_files)} file(s), ranging from {first_date.date()} to {last_date.date()}, have been merged to file {output_filename}")
+
+def choose_merge_mode():
+    print("Select merge mode:")
+    print("[1] Full merge (write a new timestamped file)")
+    print("[2] Incremental merge (only add new or changed files to the folder's merged file)")
+    print("[3] Streaming merge (low memory, for very large folders)")
+    while True:
+        choice = input("Enter the number of your choice: ").strip()
+        if choice in ['1', '2', '3']:
+            return choice
+        else:
+            print("Invalid input, please enter 1, 2 or 3.")
+
+def load_manifest(manifest_path, output_path):
+    # The manifest is only trusted if the merged file still has the size it recorded
+    if not os.path.exists(manifest_path) or not os.path.exists(output_path):
+        return None
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as fh:
+            manifest = json.load(fh)
+    except (OSError, ValueError):
+        return None
+    if manifest.get('size') != os.path.getsize(output_path):
+        return None
+    return manifest
+
+def load_hashes(hashes_path, manifest):
+    # The event hashes of the merged rows, only trusted if their count matches the manifest
+    if manifest is None or manifest.get('hashes') is None or not os.path.exists(hashes_path):
+        return None
+    try:
+        hashes = np.load(hashes_path)
+    except (OSError, ValueError):
+        return None
+    return hashes if len(hashes) == manifest['hashes'] else None
+
+def copy_byte_range(src, dst, offset, length, block_size=1024 * 1024):
+    src.seek(offset)
+    while length > 0:
+        block = src.read(min(block_size, length))
+        if not block:
+            break
+        dst.write(block)
+        length -= len(block)
+
+def file_stats(df):
+    timestamps = pd.to_datetime(df.iloc[:, 0], errors='coerce')
+    first, last = timestamps.min(), timestamps.max()
+    return {
+        'rows': len(df),
+        'first': None if pd.isna(first) else first.isoformat(),
+        'last': None if pd.isna(last) else last.isoformat(),
+    }
+
+def append_frames(out, file_names, frames, columns, fingerprints, files):
+    for file, df in zip(file_names, frames):
+        data = df.reindex(columns=columns).to_csv(index=False, header=False, lineterminator=os.linesep).encode('utf-8')
+        offset = out.tell()
+        out.write(data)
+        files[file] = dict(file_stats(df), fingerprint=fingerprints[file], offset=offset, length=len(data))
+
+def incremental_merge(folder_path, csv_files, output_folder):
+    """
+    Keep one merged file per input folder up to date. A manifest records, for every merged
+    input file, its fingerprint, the byte range its rows occupy in the merged file and its
+    row count and date range. Only new or changed files are parsed; rows of changed or
+    deleted files are dropped by copying the remaining byte ranges, without parsing them.
+    """
+    folder_name = os.path.basename(os.path.normpath(folder_path))
+    output_filename = f"merged_{folder_name}.csv"
+    output_path = os.path.join(output_folder, output_filename)
+    manifest_path = os.path.join(output_folder, f"merged_{folder_name}.manifest.json")
+
+    hashes_path = os.path.join(output_folder, f"merged_{folder_name}.hashes.npy")
+
+    manifest = load_manifest(manifest_path, output_path)
+    stored_hashes = load_hashes(hashes_path, manifest) if DROP_DUPLICATES else None
+    remerge_reason = None  # Why all files are merged again although the merged file exists
+    if DROP_DUPLICATES and stored_hashes is None and manifest is not None:
+        manifest = None  # The merged file was written without (intact) duplicate tracking
+        remerge_reason = "the merged file has no intact duplicate tracking"
+    fingerprints = {file: file_fingerprint(os.path.join(folder_path, file)) for file in csv_files}
+
+    if manifest is not None:
+        kept = {file: entry for file, entry in manifest['files'].items()
+                if fingerprints.get(file) == entry['fingerprint']}
+        to_parse = [file for file in csv_files if file not in kept]
+    else:
+        kept = {}
+        to_parse = list(csv_files)
+
+    removed = len(manifest['files']) - len(kept) if manifest is not None else 0
+    if DROP_DUPLICATES and removed > 0:
+        # Rows of the remaining files may have been dropped as copies of rows that are now gone,
+        # so all files are merged again (unchanged ones come from the cache)
+        kept = {}
+        to_parse = list(csv_files)
+        remerge_reason = (f"{removed} changed or removed file(s) may have held the kept copies "
+                          "of duplicates dropped from the other files")
+    seen = EventHashSet(stored_hashes) if DROP_DUPLICATES and kept else EventHashSet()
+
+    new_frames = load_csv_files(folder_path, to_parse) if to_parse else []
+    new_frames = [df.loc[:, ~df.columns.duplicated()] for df in new_frames]  # Remove duplicate columns if any
+    if DROP_DUPLICATES and new_frames:
+        new_frames = drop_duplicate_events(new_frames, to_parse, seen)
+
+    columns = manifest['columns'] if manifest is not None else None
+    if columns is not None and any(set(df.columns) - set(columns) for df in new_frames):
+        # New columns cannot be appended to the existing header, start over with a full rebuild
+        print("New columns found in the input files, rebuilding the merged file.")
+        os.remove(manifest_path)
+        return incremental_merge(folder_path, csv_files, output_folder)
+    if columns is None:
+        columns = list(pd.concat([df.head(0) for df in new_frames]).columns) if new_frames else []
+
+    rewrite = manifest is None or removed > 0
+    files = {}
+    if rewrite:
+        # Copy the rows of unchanged files into a fresh file, then append the new rows to it
+        tmp_path = output_path + '.tmp'
+        with open(tmp_path, 'wb') as out:
+            out.write(pd.DataFrame(columns=columns).to_csv(index=False, lineterminator=os.linesep).encode('utf-8'))
+            if kept:
+                with open(output_path, 'rb') as src:
+                    for file, entry in kept.items():
+                        offset = out.tell()
+                        copy_byte_range(src, out, entry['offset'], entry['length'])
+                        files[file] = dict(entry, offset=offset)
+            append_frames(out, to_parse, new_frames, columns, fingerprints, files)
+        os.replace(tmp_path, output_path)
+    else:
+        files = dict(kept)
+        with open(output_path, 'ab') as out:
+            append_frames(out, to_parse, new_frames, columns, fingerprints, files)
+
+    if DROP_DUPLICATES:
+        np.save(hashes_path, seen.to_array())
+    manifest = {'columns': columns, 'files': files, 'size': os.path.getsize(output_path),
+                'hashes': len(seen) if DROP_DUPLICATES else None}
+    with open(manifest_path, 'w', encoding='utf-8') as fh:
+        json.dump(manifest, fh, indent=2)
+
+    # Statistics come from the per-file entries, the merged file is not read again
+    total_rows = sum(entry['rows'] for entry in files.values())
+    firsts = [entry['first'] for entry in files.values() if entry['first']]
+    lasts = [entry['last'] for entry in files.values() if entry['last']]
+    first_date = pd.Timestamp(min(firsts)).date() if firsts else None
+    last_date = pd.Timestamp(max(lasts)).date() if lasts else None
+    if remerge_reason:
+        print(f"Full re-merge of all {len(to_parse)} file(s), as {remerge_reason}.")
+    else:
+        print(f"{len(to_parse)} new or changed file(s) parsed, {removed} changed or removed file(s) dropped.")
+    print(f"{total_rows} entries from {len(files)} file(s), ranging from {first_date} to {last_date}, have been merged to file {output_filename}")
+
 def main():
     root_folder = "data_input"
     output_folder = "data_output"
@@ -80,7 +296,13 @@ def main():
             # Now print the CSV files
             list_csv_files(folder_path)  # Default is print_files=True
             if confirm_file_list():
-                merge_csv_files(folder_path, csv_files, output_folder)
+                merge_mode = choose_merge_mode()
+                if merge_mode == '2':
+                    incremental_merge(folder_path, csv_files, output_folder)
+                elif merge_mode == '3':
+                    streaming_merge(folder_path, csv_files, output_folder)
+                else:
+                    merge_csv_files(folder_path, csv_files, output_folder)
                 break
             else:
                 continue
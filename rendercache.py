@@ -0,0 +1,121 @@
+import os
+import shutil
+import hashlib
+import inspect
+import numpy as np
+import pandas as pd
+import matplotlib
+from dataloader import CACHE_FOLDER
+
+# Content-addressed cache of rendered charts. A chart's key is a hash of the chart function, the
+# sources that draw it (the script with its style constants, chartrender.py and cellraster.py),
+# and the arguments of the call: the count matrix with its date and slot labels, colours, dates
+# and the name of the file. The folder the chart is saved in is left out, so a new export of
+# unchanged data copies every chart from the cache and only redraws the charts whose counts changed.
+# Fan-outs are looked up by chartpool.render_charts, single charts by cached_render.
+USE_RENDER_CACHE = True
+RENDER_CACHE_FOLDER = os.path.join(CACHE_FOLDER, 'renders')
+# Size of the cache folder; the least recently used charts are removed beyond it
+RENDER_CACHE_MAX_BYTES = 512 * 1024 * 1024
+# Bump when the key changes so older entries are not reused
+RENDER_CACHE_VERSION = 1
+# Modules whose code draws the charts, besides the script of the chart function
+DRAWING_MODULES = ['chartrender.py', 'cellraster.py']
+
+
+def update_key(digest, value):
+    """Feed `value` to the hash: frames and arrays by their labels, dtype and bytes, the rest by repr."""
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        columns = list(value.columns) if isinstance(value, pd.DataFrame) else value.name
+        update_key(digest, (type(value).__name__, list(value.index), columns, value.to_numpy()))
+    elif isinstance(value, np.ndarray) and value.dtype != object:
+        digest.update(f"ndarray|{value.dtype.str}|{value.shape}|".encode('utf-8'))
+        digest.update(np.ascontiguousarray(value).tobytes())
+    elif isinstance(value, dict):
+        update_key(digest, ('dict', list(value.items())))
+    elif isinstance(value, (list, tuple, np.ndarray)):
+        digest.update(f"{type(value).__name__}|{len(value)}|".encode('utf-8'))
+        for item in value:
+            update_key(digest, item)
+    else:
+        digest.update(f"{type(value).__name__}|{value!r}|".encode('utf-8'))
+
+
+def source_key(render):
+    """Hash of everything that draws the charts of `render` but is not in its arguments."""
+    digest = hashlib.sha256(f"{RENDER_CACHE_VERSION}|{matplotlib.__version__}|{np.__version__}|".encode('utf-8'))
+    digest.update(f"{render.__qualname__}|".encode('utf-8'))
+    here = os.path.dirname(os.path.abspath(__file__))
+    for path in [inspect.getfile(render)] + [os.path.join(here, name) for name in DRAWING_MODULES]:
+        with open(path, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def chart_key(sources, job, output):
+    """
+    Key of the chart render(*job) saves as `output`. Arguments naming where it is saved (the
+    export folder or the file itself) are replaced by the file name.
+    """
+    folder = os.path.dirname(output)
+    digest = hashlib.sha256(sources.encode('utf-8'))
+    update_key(digest, os.path.basename(output))
+    update_key(digest, [arg for arg in job if not (isinstance(arg, str) and arg in (folder, output))])
+    return digest.hexdigest()
+
+
+def cache_path(key):
+    return os.path.join(RENDER_CACHE_FOLDER, f"{key}.png")
+
+
+def restore_chart(key, output):
+    """Copy the cached chart to `output` and mark it as used. Returns False if it is not cached."""
+    try:
+        shutil.copyfile(cache_path(key), output)
+    except FileNotFoundError:
+        return False
+    os.utime(cache_path(key))
+    return True
+
+
+def store_chart(key, output):
+    """Copy a newly rendered chart into the cache."""
+    os.makedirs(RENDER_CACHE_FOLDER, exist_ok=True)
+    tmp_path = f"{cache_path(key)}.{os.getpid()}.tmp"
+    shutil.copyfile(output, tmp_path)
+    os.replace(tmp_path, cache_path(key))
+
+
+def cached_render(render, *args, output):
+    """
+    Call render(*args), which saves one chart as `output`, unless the same chart is in the
+    cache, in which case it is copied from there.
+    """
+    if not USE_RENDER_CACHE:
+        render(*args)
+        return
+    key = chart_key(source_key(render), args, output)
+    if restore_chart(key, output):
+        print(f"{os.path.basename(output)} unchanged, copied from the render cache.")
+        return
+    render(*args)
+    store_chart(key, output)
+    evict_charts()
+
+
+def evict_charts(max_bytes=RENDER_CACHE_MAX_BYTES):
+    """Remove the least recently used charts until the cache fits in `max_bytes`."""
+    try:
+        entries = [entry for entry in os.scandir(RENDER_CACHE_FOLDER) if entry.name.endswith('.png')]
+    except FileNotFoundError:
+        return
+    stats = [(entry.stat(), entry.path) for entry in entries]
+    total = sum(stat.st_size for stat, _ in stats)
+    for stat, path in sorted(stats, key=lambda item: item[0].st_mtime_ns):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= stat.st_size
@@ -0,0 +1,66 @@
+import datetime
+import numpy as np
+import pandas as pd
+import pytest
+from aggregates import SummedAreaTable, RunningCounts, week_bounds
+from dataloader import iter_event_chunks
+from eventstore import open_events, load_count_cube
+
+HEADER = '"Timestamp","Hub Name","Behaviour Name","Button ID"\n'
+
+
+@pytest.fixture
+def events(tmp_path, monkeypatch):
+    # Random presses of 3 hubs and 2 behaviours over 20 days, written to two exports
+    monkeypatch.chdir(tmp_path)
+    folder = tmp_path / 'data_input' / 'pilot'
+    folder.mkdir(parents=True)
+    rng = np.random.default_rng(17)
+    df = pd.DataFrame({'Timestamp': pd.Timestamp('2024-11-01') + pd.to_timedelta(rng.integers(0, 20 * 86400, 600), unit='s'),
+                       'Hub Name': rng.choice(['Hub 001', 'Hub 002', 'Hub 003'], 600),
+                       'Behaviour Name': rng.choice(['Snacking', 'Eating Out'], 600)}).sort_values('Timestamp')
+    for name, part in (('nov_a.csv', df[:300]), ('nov_b.csv', df[300:])):
+        (folder / name).write_text(HEADER + ''.join(f'"{t}","{hub}","{behaviour}","3"\n' for t, hub, behaviour in part.to_numpy()))
+    return folder, ['nov_a.csv', 'nov_b.csv'], df
+
+
+@pytest.mark.parametrize('start_date, end_date, start_time, end_time, hub, behaviour, weekdays', [
+    (None, None, None, None, None, None, None),
+    ('2024-11-03', '2024-11-12', '08:00', '17:30', None, None, None),
+    ('2024-11-02', '2024-11-19', '06:30', '24:00', 'Hub 002', None, [0, 2, 5]),
+    (None, '2024-11-10', None, '12:00', None, 'Snacking', [6]),
+    ('2024-11-05', None, '00:00', '09:00', 'Hub 003', 'Eating Out', [1, 2, 3]),
+])
+def test_summed_area_table_matches_a_brute_force_count(events, start_date, end_date, start_time, end_time,
+                                                       hub, behaviour, weekdays):
+    folder, csv_files, df = events
+    table = SummedAreaTable(load_count_cube(open_events(str(folder), csv_files)).rollup(30))
+
+    dates = [None if day is None else datetime.date.fromisoformat(day) for day in (start_date, end_date)]
+    count = table.count(*dates, start_time, end_time, hub=hub, behaviour=behaviour, weekdays=weekdays)
+
+    minutes = df['Timestamp'].dt.hour * 60 + df['Timestamp'].dt.minute
+    expected = df[(df['Timestamp'].dt.date >= (dates[0] or datetime.date.min))
+                  & (df['Timestamp'].dt.date <= (dates[1] or datetime.date.max))
+                  & (minutes >= (0 if start_time is None else int(start_time[:2]) * 60 + int(start_time[3:])))
+                  & (minutes < (1440 if end_time is None else int(end_time[:2]) * 60 + int(end_time[3:])))
+                  & (df['Hub Name'] == hub if hub else True)
+                  & (df['Behaviour Name'] == behaviour if behaviour else True)
+                  & (df['Timestamp'].dt.weekday.isin(weekdays) if weekdays else True)]
+    assert count == len(expected)
+
+
+def test_running_counts_match_the_count_cube(events):
+    folder, csv_files, _ = events
+    cube = load_count_cube(open_events(str(folder), csv_files))
+    counts = RunningCounts()
+    for chunk in iter_event_chunks(str(folder), csv_files, chunk_size=64):
+        counts.update(chunk)
+
+    assert (counts.first_day, counts.last_day) == (cube.first_day, cube.last_day)
+    windows = [(None, None), (datetime.date(2024, 11, 4), datetime.date(2024, 11, 9))]
+    bounds = week_bounds(cube.first_day, cube.last_day)
+    for expected, actual in zip([cube.count_matrix(*window) for window in windows] + cube.period_matrices(bounds),
+                                [counts.count_matrix(*window) for window in windows] + counts.period_matrices(bounds)):
+        for expected_frame, actual_frame in zip(expected, actual):
+            pd.testing.assert_frame_equal(actual_frame, expected_frame)
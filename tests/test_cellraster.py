@@ -0,0 +1,43 @@
+import os
+import importlib.util
+import matplotlib
+matplotlib.use('Agg')
+import numpy as np
+import pandas as pd
+import pytest
+from PIL import Image
+
+SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'fpMaker(all hubs).py')
+
+
+def load_script():
+    spec = importlib.util.spec_from_file_location('fpmaker_all_hubs', SCRIPT)
+    script = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(script)
+    return script
+
+
+def read_png(folder):
+    (name,) = os.listdir(folder)
+    return np.asarray(Image.open(os.path.join(folder, name)).convert('RGBA')).astype(int)
+
+
+@pytest.mark.parametrize('chart', ['generate_consolidated_chart', 'generate_styled_consolidated_chart',
+                                   'generate_transparent_chart'])
+def test_raster_matches_matplotlib(tmp_path, chart):
+    script = load_script()
+    data_matrix = pd.DataFrame((np.random.default_rng(14).random((14, 24)) < 0.4).astype(int))
+    images = {}
+    for backend in ('matplotlib', 'raster'):
+        script.CELL_CHART_BACKEND = backend
+        folder = tmp_path / backend
+        folder.mkdir()
+        getattr(script, chart)(data_matrix, str(folder), 'start', 'end')
+        images[backend] = read_png(folder)
+
+    expected, actual = images['matplotlib'], images['raster']
+    assert actual.shape == expected.shape
+    # Compare premultiplied, as pixels of an alpha of 1/255 may keep the cell colour or not
+    alpha = expected[..., 3:] / 255, actual[..., 3:] / 255
+    difference = np.abs(expected[..., :3] * alpha[0] - actual[..., :3] * alpha[1]).max()
+    assert max(difference, np.abs(expected[..., 3] - actual[..., 3]).max()) <= 6
@@ -0,0 +1,56 @@
+import os
+import datetime
+import matplotlib
+matplotlib.use('Agg')
+import chartmaker
+from eventstore import open_events, load_count_cube
+
+HEADER = '"Timestamp","Hub Name","Behaviour Name","Button ID"\n'
+START_DATE, END_DATE = datetime.date(2024, 11, 5), datetime.date(2024, 11, 8)
+
+
+def make_charts(tmp_path, monkeypatch, empty_charts):
+    # Hub 001 has both behaviours, hubs 002 and 003 only 'Eating Out'
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(chartmaker, 'CHART_WORKERS', 1)
+    monkeypatch.setattr(chartmaker, 'EMPTY_CHARTS', empty_charts)
+    folder = tmp_path / 'data_input' / 'pilot'
+    folder.mkdir(parents=True)
+    rows = [f'"2024-11-{day:02d} {hour:02d}:15:00","{hub}","{behavior}","3"\n'
+            for day in range(5, 9)
+            for hour, hub, behavior in [(8, 'Hub 001', 'Snacking'), (12, 'Hub 001', 'Eating Out'),
+                                        (13, 'Hub 002', 'Eating Out'), (19, 'Hub 003', 'Eating Out')]]
+    (folder / 'export.csv').write_text(HEADER + ''.join(rows))
+    cube = load_count_cube(open_events(str(folder), ['export.csv']), START_DATE, END_DATE)
+    chartmaker.analyze_and_generate_charts(cube, START_DATE, END_DATE)
+    (export_path,) = [entry.path for entry in os.scandir(tmp_path / 'data_output') if entry.name.startswith('DataVis_Export_on_')]
+    return export_path, cube
+
+
+def test_empty_pairs_are_rendered_with_their_own_titles(tmp_path, monkeypatch):
+    export_path, cube = make_charts(tmp_path, monkeypatch, 'render')
+
+    assert sorted(os.listdir(export_path)) == [f"Hub 00{hub}-{behavior}.png" for hub in (1, 2, 3)
+                                               for behavior in ('Eating Out', 'Snacking')]
+    first, second = (os.path.join(export_path, f"Hub 00{hub}-Snacking.png") for hub in (2, 3))
+    assert not os.path.samefile(first, second)
+    with open(first, 'rb') as f, open(second, 'rb') as g:
+        assert f.read() != g.read()  # Each has its hub in the title
+
+    # The same chart as a pair without entries drawn on its own
+    reference = tmp_path / 'reference'
+    reference.mkdir()
+    empty_df = chartmaker.heatmap_matrix(cube, 'Hub 002', 'Snacking', START_DATE, END_DATE)
+    assert empty_df.to_numpy().sum() == 0
+    chartmaker.generate_heatmap(empty_df, 'Hub 002', 'Snacking', str(reference), START_DATE, END_DATE)
+    with open(first, 'rb') as f, open(reference / 'Hub 002-Snacking.png', 'rb') as g:
+        assert f.read() == g.read()
+
+
+def test_empty_pairs_can_share_one_linked_chart(tmp_path, monkeypatch):
+    export_path, _ = make_charts(tmp_path, monkeypatch, 'link')
+
+    first, second = (os.path.join(export_path, f"Hub 00{hub}-Snacking.png") for hub in (2, 3))
+    with open(first, 'rb') as f, open(second, 'rb') as g:
+        assert f.read() == g.read()
+    assert len(os.listdir(export_path)) == 6
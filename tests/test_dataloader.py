@@ -0,0 +1,70 @@
+import numpy as np
+import pandas as pd
+import pytest
+from dataloader import parse_csv_file, get_quarantine_path, EventHashSet, drop_duplicate_events
+
+HEADER = '"Timestamp","Hub Name","Behaviour Name","Button ID"\n'
+
+
+def test_invalid_rows_are_quarantined(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    csv_path = tmp_path / 'export.csv'
+    csv_path.write_text(HEADER
+                        + '"2024-11-05 08:00:00","Hub 001","Snacking","3"\n'
+                        + '"2024-11-05 09:00:00","","Snacking","3"\n'
+                        + '"2024-11-05 10:00:00","Hub 001","Snacking","99999"\n'
+                        + '"2024/11/05 11:30","Hub 002","Snacking","4"\n')
+
+    df = parse_csv_file(str(csv_path))
+
+    assert df['Timestamp'].tolist() == [pd.Timestamp('2024-11-05 08:00:00'), pd.Timestamp('2024-11-05 11:30:00')]
+    quarantined = pd.read_csv(get_quarantine_path(str(csv_path)))
+    assert quarantined['Reason'].tolist() == ['missing hub name', 'button ID out of range']
+
+
+@pytest.mark.parametrize('offsets', [['+01:00'], ['+01:00', '+02:00']])
+def test_timestamps_with_utc_offsets_are_quarantined(tmp_path, monkeypatch, offsets):
+    # The offsets make the inferred timestamps zone-aware, which the naive column cannot hold
+    monkeypatch.chdir(tmp_path)
+    csv_path = tmp_path / 'export.csv'
+    zoned = [f'2024-11-05T15:00:00{offset}' for offset in offsets]
+    csv_path.write_text(HEADER
+                        + '"garbage","Hub 001","Snacking","3"\n'
+                        + ''.join(f'"{timestamp}","Hub 001","Snacking","3"\n' for timestamp in zoned)
+                        + '"2024-11-05 12:00:00","Hub 001","Snacking","3"\n')
+
+    df = parse_csv_file(str(csv_path))
+
+    assert df['Timestamp'].tolist() == [pd.Timestamp('2024-11-05 12:00:00')]
+    quarantined = pd.read_csv(get_quarantine_path(str(csv_path)))
+    assert quarantined['Timestamp'].tolist() == ['garbage'] + zoned
+    assert set(quarantined['Reason']) == {'unparseable timestamp'}
+
+
+def test_event_hash_set_keeps_only_first_copies():
+    rng = np.random.default_rng(11)
+    seen, expected = EventHashSet(), set()
+    for size in (1, 5, 40, 3, 200, 17, 0, 90):
+        hashes = rng.integers(0, 300, size).astype(np.uint64)
+        new = seen.add_new(hashes)
+        first_copies = [value not in expected and value not in hashes[:index].tolist()
+                        for index, value in enumerate(hashes.tolist())]
+        assert new.tolist() == first_copies
+        expected.update(hashes.tolist())
+        assert len(seen) == len(expected)
+    probe = np.arange(300, dtype=np.uint64)
+    for hash_set in (seen, EventHashSet(np.array(sorted(expected), dtype=np.uint64))):
+        assert hash_set.contains(probe).tolist() == [value in expected for value in range(300)]
+
+
+def test_duplicate_events_are_dropped_across_files(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    rows = ['"2024-11-05 08:00:00","Hub 001","Snacking","3"\n', '"2024-11-05 09:00:00","Hub 001","Snacking","3"\n',
+            '"2024-11-05 09:00:00","Hub 001","Eating Out","3"\n']
+    (tmp_path / 'a.csv').write_text(HEADER + rows[0] + rows[1] + rows[0])
+    (tmp_path / 'b.csv').write_text(HEADER + rows[1] + rows[2])
+    frames = [parse_csv_file(str(tmp_path / name)) for name in ('a.csv', 'b.csv')]
+
+    first, second = drop_duplicate_events(frames, ['a.csv', 'b.csv'])
+    assert first['Timestamp'].tolist() == [pd.Timestamp('2024-11-05 08:00:00'), pd.Timestamp('2024-11-05 09:00:00')]
+    assert second['Behaviour Name'].astype(str).tolist() == ['Eating Out']
@@ -0,0 +1,29 @@
+import datetime
+from eventstore import open_events, load_count_cube, FolderScan
+
+HEADER = '"Timestamp","Hub Name","Behaviour Name","Button ID"\n'
+
+
+def write_export(folder, name, month):
+    rows = [f'"2024-{month:02d}-{day:02d} {hour:02d}:15:00","Hub 00{hour % 3}","Snacking","3"\n'
+            for day in range(1, 11) for hour in (8, 12, 19)]
+    (folder / name).write_text(HEADER + ''.join(rows))
+
+
+def test_count_cube_of_range_between_files(tmp_path, monkeypatch):
+    # Before the event store is built, a range in the gap between two exports loads no file
+    monkeypatch.chdir(tmp_path)
+    folder = tmp_path / 'data_input' / 'gap'
+    folder.mkdir(parents=True)
+    write_export(folder, 'nov.csv', 11)
+    write_export(folder, 'dec.csv', 12)
+
+    store = open_events(str(folder), ['nov.csv', 'dec.csv'])
+    assert isinstance(store, FolderScan)
+    start_date, end_date = datetime.date(2024, 11, 20), datetime.date(2024, 11, 25)
+    cube = load_count_cube(store, start_date, end_date)
+
+    counts, _ = cube.count_matrix(start_date, end_date)
+    assert counts.empty
+    assert cube.day_slot_counts(start_date, end_date).shape == (6, cube.slots_per_day)
+    assert cube.day_slot_counts(start_date, end_date).sum() == 0
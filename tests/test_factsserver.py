@@ -0,0 +1,50 @@
+import pytest
+import factsserver
+from factsserver import QueryError, get_dataset, cached_query
+
+HEADER = '"Timestamp","Hub Name","Behaviour Name","Button ID"\n'
+
+
+@pytest.fixture
+def pilot(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(factsserver, '_datasets', factsserver.OrderedDict())
+    folder = tmp_path / 'data_input' / 'pilot'
+    folder.mkdir(parents=True)
+    (folder / 'export.csv').write_text(HEADER + '"2024-11-05 08:15:00","Hub 001","Snacking","3"\n'
+                                       + '"2024-11-06 12:15:00","Hub 001","Eating Out","3"\n')
+    (tmp_path / 'outside').mkdir()
+    (tmp_path / 'outside' / 'export.csv').write_text((folder / 'export.csv').read_text())
+    return folder
+
+
+@pytest.mark.parametrize('folder', ['../outside', '../data_input/../outside', '.', '/tmp'])
+def test_only_subfolders_of_the_input_folder_are_served(pilot, folder):
+    with pytest.raises(QueryError) as e:
+        get_dataset(folder)
+    assert e.value.status == 404
+
+
+def test_files_are_checked_again_only_after_a_while(pilot, monkeypatch):
+    calls = []
+    monkeypatch.setattr(factsserver, 'get_source_key', lambda *args: calls.append(args) or 'key')
+    source_key, cube, _ = get_dataset('pilot')
+    assert get_dataset('pilot')[1] is cube and len(calls) == 1
+
+    monkeypatch.setattr(factsserver, 'SOURCE_CHECK_SECONDS', 0)
+    assert get_dataset('pilot')[1] is cube and len(calls) == 2
+
+
+@pytest.mark.parametrize('weekdays', ['x', '1,7', '-1', '1,,2'])
+def test_invalid_weekdays_are_rejected(pilot, weekdays):
+    with pytest.raises(QueryError, match='weekdays must be numbers from 0'):
+        cached_query('count', 'pilot', 'key', f'weekdays={weekdays}')
+
+
+def test_least_recently_queried_folder_is_dropped(pilot, monkeypatch):
+    monkeypatch.setattr(factsserver, 'MAX_DATASETS', 1)
+    (pilot.parent / 'other').mkdir()
+    (pilot.parent / 'other' / 'export.csv').write_text((pilot / 'export.csv').read_text())
+    get_dataset('pilot')
+    get_dataset('other')
+    assert list(factsserver._datasets) == ['other']
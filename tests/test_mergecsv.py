@@ -0,0 +1,45 @@
+import pandas as pd
+from mergecsv import incremental_merge, merge_csv_files
+
+HEADER = '"Timestamp","Hub Name","Behaviour Name","Button ID"\n'
+
+
+def write_csv(path, rows):
+    path.write_text(HEADER + ''.join(f'"2024-11-{day:02d} {hour:02d}:15:00","{hub}","Snacking","3"\n'
+                                     for day, hour, hub in rows))
+
+
+def sorted_rows(csv_path):
+    return sorted(map(tuple, pd.read_csv(csv_path).astype(str).to_numpy().tolist()))
+
+
+def check_against_full_merge(tmp_path, folder, csv_files):
+    incremental_merge(str(folder), csv_files, str(tmp_path / 'incremental'))
+    full = tmp_path / 'full'
+    for path in full.iterdir():
+        path.unlink()
+    merge_csv_files(str(folder), csv_files, str(full))
+    (full_path,) = full.iterdir()
+    assert sorted_rows(tmp_path / 'incremental' / 'merged_pilot.csv') == sorted_rows(full_path)
+
+
+def test_incremental_merge_follows_added_changed_and_removed_files(tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    folder = tmp_path / 'pilot'
+    for name in ('pilot', 'incremental', 'full'):
+        (tmp_path / name).mkdir()
+    write_csv(folder / 'a.csv', [(5, 8, 'Hub 001'), (5, 9, 'Hub 001')])
+    write_csv(folder / 'b.csv', [(5, 9, 'Hub 001'), (6, 9, 'Hub 002')])  # One row also in a.csv
+    check_against_full_merge(tmp_path, folder, ['a.csv', 'b.csv'])
+
+    write_csv(folder / 'c.csv', [(7, 10, 'Hub 003')])
+    check_against_full_merge(tmp_path, folder, ['a.csv', 'b.csv', 'c.csv'])
+    assert "1 new or changed file(s) parsed, 0 changed or removed file(s) dropped." in capsys.readouterr().out
+
+    write_csv(folder / 'c.csv', [(7, 11, 'Hub 003'), (8, 11, 'Hub 003')])
+    check_against_full_merge(tmp_path, folder, ['a.csv', 'b.csv', 'c.csv'])
+
+    # The shared row must stay, now from b.csv
+    (folder / 'a.csv').unlink()
+    check_against_full_merge(tmp_path, folder, ['b.csv', 'c.csv'])
+    assert "Full re-merge of all 2 file(s), as 1 changed or removed file(s)" in capsys.readouterr().out
@@ -0,0 +1,62 @@
+import os
+import pandas as pd
+import rendercache
+from rendercache import cached_render, evict_charts, RENDER_CACHE_FOLDER
+
+calls = []
+
+
+def render(data_matrix, export_path, title):
+    # Stands in for a chart function: saves one 'chart' named after its title
+    calls.append(title)
+    with open(os.path.join(export_path, f"{title}.png"), 'w') as f:
+        f.write(f"{title}\n{data_matrix.to_csv()}")
+
+
+def render_to(folder, data_matrix, title='Hub 001'):
+    folder.mkdir(exist_ok=True)
+    output = folder / f"{title}.png"
+    cached_render(render, data_matrix, str(folder), title, output=str(output))
+    return output.read_text()
+
+
+def test_charts_are_rendered_once_and_then_copied(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    calls.clear()
+    data_matrix = pd.DataFrame([[1, 0], [2, 3]])
+
+    first = render_to(tmp_path / 'export_1', data_matrix)
+    assert render_to(tmp_path / 'export_2', data_matrix) == first  # Another export folder, same chart
+    assert calls == ['Hub 001']
+
+    render_to(tmp_path / 'export_3', data_matrix + 1)
+    render_to(tmp_path / 'export_3', data_matrix, title='Hub 002')
+    assert calls == ['Hub 001', 'Hub 001', 'Hub 002']
+
+    # A change to the drawing code (here its version) invalidates every chart
+    monkeypatch.setattr(rendercache, 'RENDER_CACHE_VERSION', rendercache.RENDER_CACHE_VERSION + 1)
+    render_to(tmp_path / 'export_4', data_matrix)
+    assert len(calls) == 4
+
+
+def test_render_cache_can_be_turned_off(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(rendercache, 'USE_RENDER_CACHE', False)
+    calls.clear()
+    for export in ('export_1', 'export_2'):
+        render_to(tmp_path / export, pd.DataFrame([[1]]))
+    assert len(calls) == 2
+    assert not os.path.exists(RENDER_CACHE_FOLDER)
+
+
+def test_least_recently_used_charts_are_evicted(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs(RENDER_CACHE_FOLDER)
+    for age, name in enumerate(['newest', 'middle', 'oldest']):
+        path = os.path.join(RENDER_CACHE_FOLDER, f"{name}.png")
+        with open(path, 'wb') as f:
+            f.write(b'x' * 100)
+        os.utime(path, (1000 - age, 1000 - age))
+
+    evict_charts(max_bytes=250)
+    assert sorted(os.listdir(RENDER_CACHE_FOLDER)) == ['middle.png', 'newest.png']